@@ -16,18 +16,28 @@
 # You should have received a copy of the GNU General Public License
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import math
 import shutil
 import time
 import xml.etree.ElementTree
 import urllib.request
 import multiprocessing
+import threading
+import traceback
+
+import numpy
+import shapely.geometry
 
 from location import *
 from generated import *
 from overpass import *
 from processor import *
 from comparator import *
+from scores import *
 from factors import *
+from pipeline import *
+from extract import *
 
 
 def default_settings():
@@ -42,6 +52,7 @@ def default_settings():
         'output_folder_path': './output/',
         'surs_file_path': 'surs.txt',  # relative to input_folder_path
         'factors_file_path': 'factors.txt',
+        'sur_osm_mapping_file_path': None,  # None: built-in rules (classifier.sur_osm_map)
         'cache_folder_path': './cache/',
         'log_folder_path': './log/',
         'log_file_prefix': '',
@@ -52,6 +63,20 @@ def default_settings():
         'minimum_intersection_ratio': 0.7,
         'compare_results': True,
         'exclude_slow_classifiers': False,
+        'prune_ways': False,
+        'jobs': None,  # Number of worker processes, None: number of CPUs
+        'chunk_size': None,  # Locations per work queue item, None: about four items per worker process
+        'largest_first': False,  # Start with the locations with the largest OSM cache files
+        'pipeline_queue_size': 2,  # Locations waiting between two stages of a worker (see prepared_locations())
+        'fetch_concurrency': 4,  # Overpass API requests all worker processes together send at the same time
+        'overpass_urls': [default_url],  # Overpass API interpreters, requests are distributed over all of them
+        'overpass_retries': 5,  # Repetitions of a failed request, see overpass.OverpassClient
+        'overpass_backoff': 1.0,  # Seconds to wait before the first repetition, doubled after every failed attempt
+        'overpass_rate': None,  # Maximum Overpass API requests per second of all worker processes together, None: no limit
+        'osm_extract_file_path': None,  # Local *.osm extract to use instead of the Overpass API (see extract.OSMExtract), None: use the Overpass API
+        'osm_extract_to_cache': False,  # Write the data from the extract to the cache folder instead of passing it on in memory
+        'spatial_join': False,  # Assign the data from the extract to all locations in one spatial join (see extract.SpatialJoin)
+        'score_store_folder_path': None,  # Folder to save the unweighted points of all locations to (see rescore()), None: do not save
         'quiet_mode': False,
         'factors': None,
         'debug_output': False,
@@ -84,13 +109,30 @@ def format_header(settings):
     header += item('Output folder path', os.path.abspath(settings['output_folder_path']))
     header += item('SURs file path', os.path.abspath(settings['surs_file_path']))
     header += item('Factors file path', os.path.abspath(settings['factors_file_path']))
+    if settings['sur_osm_mapping_file_path'] is not None:
+        header += item('SUR-OSM mapping file path', os.path.abspath(settings['sur_osm_mapping_file_path']))
     header += item('Cache folder path', os.path.abspath(settings['cache_folder_path']))
     header += item('Log folder path', os.path.abspath(settings['log_folder_path']))
     header += item('Log file prefix', settings['log_file_prefix'])
     header += item('Force cache update', settings['force_cache_update'])
     header += item('Maximum cache file age', time.strftime("%dd %Hh %Mm %Ss", time.gmtime(settings['maximum_cache_file_age'])))
     header += item('Exclude slow classifiers', settings['exclude_slow_classifiers'])
+    header += item('Prune ways', settings['prune_ways'])
+    header += item('Jobs', settings['jobs'] if settings['jobs'] is not None else 'number of CPUs')
+    header += item('Chunk size', settings['chunk_size'] if settings['chunk_size'] is not None else 'automatic')
+    header += item('Largest locations first', settings['largest_first'])
+    if settings['score_store_folder_path'] is not None:
+        header += item('Score store path', os.path.abspath(settings['score_store_folder_path']))
     header += item('Overpass radius [m]', settings['overpass_radius'])
+    header += item('Fetch concurrency', settings['fetch_concurrency'])
+    if settings['osm_extract_file_path'] is not None:
+        header += item('OSM extract path', os.path.abspath(settings['osm_extract_file_path']))
+        header += item('OSM extract to cache', settings['osm_extract_to_cache'])
+        header += item('Spatial join', settings['spatial_join'])
+    else:
+        header += item('Overpass API URLs', ', '.join(settings['overpass_urls']))
+        header += item('Overpass retries', settings['overpass_retries'])
+        header += item('Overpass rate [1/s]', settings['overpass_rate'] if settings['overpass_rate'] is not None else 'unlimited')
     header += item('Minimum intersection ratio', settings['minimum_intersection_ratio'])
     header += item('Compare results', settings['compare_results'])
     header += item('Debug CSV output', settings['debug_output'])
@@ -99,6 +141,404 @@ def format_header(settings):
     return header
 
 
+def job_count(settings):
+    """
+    Returns the number of worker processes.
+
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :return: Number of worker processes
+    :rtype: int
+    """
+    return settings['jobs'] if settings['jobs'] is not None else multiprocessing.cpu_count()
+
+
+# Limit of the Overpass API request rate shared by all worker processes, set by init_worker()
+_rate_limiter = None
+# Limit of the Overpass API requests all worker processes send at the same time, set by init_worker()
+_fetch_slots = None
+# Local OSM extract of the worker processes, set by init_worker()
+_osm_extract = None
+# Spatial join of all locations with the OSM extract, set by init_worker()
+_spatial_join = None
+
+
+def load_osm_extract(settings, log_file):
+    """
+    Loads the OSM extract settings['osm_extract_file_path'].
+
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param log_file: Log file of the caller
+    :type log_file: file
+    :return: Extract, None on failure
+    :rtype: extract.OSMExtract
+    """
+    log_file.write('Loading OSM extract "%s"...' % settings['osm_extract_file_path'])
+    try:
+        osm_extract = OSMExtract(settings['osm_extract_file_path'])
+    except (OSError, xml.etree.ElementTree.ParseError, KeyError, ValueError) as error:
+        print('Could not load OSM extract "%s", aborting.' % settings['osm_extract_file_path'], file=sys.stderr)
+        log_file.write('FAILURE\nException: %s\n' % str(error))
+        log_file.write('Could not load OSM extract "%s", aborting.\n' % settings['osm_extract_file_path'])
+        return None
+    log_file.write('OK, %d node(s), %d way(s)\n' % (len(osm_extract.node_ids), len(osm_extract.way_ids)))
+    return osm_extract
+
+
+def join_locations(locations, settings, osm_extract, log_file):
+    """
+    Joins all locations with the OSM extract (see extract.SpatialJoin). Has to be called before create_pool(), so the
+    worker processes inherit the features instead of building them again.
+
+    :param locations: Locations to join
+    :type locations: dict
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param osm_extract: Extract loaded by load_osm_extract()
+    :type osm_extract: extract.OSMExtract
+    :param log_file: Log file of the caller
+    :type log_file: file
+    :return: Spatial join
+    :rtype: extract.SpatialJoin
+    """
+    log_file.write('Joining locations with OSM extract...')
+    spatial_join = SpatialJoin(osm_extract, locations, settings['overpass_radius'])
+    log_file.write('OK, %d node(s), %d way(s)\n' % (len(spatial_join.nodes), len(spatial_join.ways)))
+    return spatial_join
+
+
+def create_pool(settings, osm_extract=None, spatial_join=None):
+    """
+    Creates the pool of worker processes. The processes share the limit of the Overpass API request rate
+    (settings['overpass_rate']), the limit of concurrent Overpass API requests (settings['fetch_concurrency']), the OSM
+    extract and the spatial join.
+
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param osm_extract: Extract loaded by load_osm_extract(), None: use the Overpass API
+    :type osm_extract: extract.OSMExtract
+    :param spatial_join: Spatial join created by join_locations(), None: query the data of every location on its own
+    :type spatial_join: extract.SpatialJoin
+    :return: Pool of job_count(settings) processes
+    :rtype: multiprocessing.Pool
+    """
+    rate_limiter = TokenBucket(settings['overpass_rate']) if settings['overpass_rate'] is not None else None
+    fetch_slots = multiprocessing.BoundedSemaphore(settings['fetch_concurrency'])
+    return multiprocessing.Pool(job_count(settings), initializer=init_worker,
+                                initargs=(rate_limiter, osm_extract, spatial_join, fetch_slots))
+
+
+def init_worker(rate_limiter, osm_extract, spatial_join=None, fetch_slots=None):
+    """
+    Initializes a worker process of create_pool().
+
+    :param rate_limiter: Limit of the Overpass API request rate, None: no limit
+    :type rate_limiter: overpass.TokenBucket
+    :param osm_extract: Local OSM extract, None: use the Overpass API
+    :type osm_extract: extract.OSMExtract
+    :param spatial_join: Spatial join of all locations, None: query the data of every location on its own
+    :type spatial_join: extract.SpatialJoin
+    :param fetch_slots: Limit of the concurrent Overpass API requests of all worker processes, None: no limit
+    :type fetch_slots: multiprocessing.BoundedSemaphore
+    :return: None
+    """
+    global _rate_limiter
+    global _osm_extract
+    global _spatial_join
+    global _fetch_slots
+    _rate_limiter = rate_limiter
+    _osm_extract = osm_extract
+    _spatial_join = spatial_join
+    _fetch_slots = fetch_slots
+
+
+def chunk_locations(locations, settings):
+    """
+    Splits locations into the items of the work queue of main() and compute_score_table(). Idle workers take the
+    next item, so an item with expensive locations does not delay the others. If settings['largest_first'] is set,
+    the locations are sorted by the size of their OSM cache files, largest first.
+
+    :param locations: Locations to split
+    :type locations: dict
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :return: Locations of every item
+    :rtype: [dict]
+    """
+    keys = list(locations.keys())
+    if settings['largest_first']:
+        def cache_file_size(key):
+            """
+            Returns the size of the OSM cache file of a location, 0 if it does not exist yet.
+
+            :param key: Location name
+            :type key: string
+            :return: Size in bytes
+            :rtype: int
+            """
+            cache_file_name = settings['cache_folder_path'] + key + '.osm'
+            return os.path.getsize(cache_file_name) if os.path.isfile(cache_file_name) else 0
+        keys.sort(key=cache_file_size, reverse=True)
+    chunk_size = settings['chunk_size']
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(keys) / (4 * job_count(settings))))
+    return [{key: locations[key] for key in keys[i:i + chunk_size]} for i in range(0, len(keys), chunk_size)]
+
+
+def statistics_file_path(worker_id, settings):
+    """
+    Returns the path of the file a worker saves its classifier statistics to.
+
+    :param worker_id: Unique worker identification token
+    :type worker_id: int
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :return: Path of the statistics file
+    :rtype: string
+    """
+    return settings['log_folder_path'] + settings['log_file_prefix'] + 'process_' + str(worker_id) + '.statistics.json'
+
+
+def score_store_files(settings):
+    """
+    Returns the paths of the files of the score store (see rescore()), one per worker.
+
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :return: Paths of the score files
+    :rtype: list
+    """
+    folder_path = settings['score_store_folder_path']
+    return sorted(folder_path + file_name for file_name in os.listdir(folder_path) if file_name.startswith('scores_') and file_name.endswith('.npz'))
+
+
+def format_statistics(statistics):
+    """
+    Creates a printable table from aggregated classifier statistics.
+
+    :param statistics: Aggregated statistics as returned by processor.aggregate_statistics()
+    :type statistics: dict
+    :return: Printable table
+    :rtype: string
+    """
+    table = '%-30s %10s %10s %10s %10s %12s %8s\n' % ('Classifier', 'Sum [ms]', 'Mean [ms]', 'P95 [ms]', 'Ways', 'Geometry ops', 'Skipped')
+    for (name, entry) in sorted(statistics.items(), key=lambda item: item[1]['sum_ms'], reverse=True):
+        table += '%-30s %10.2f %10.3f %10.3f %10d %12d %8d\n' % (name, entry['sum_ms'], entry['mean_ms'], entry['p95_ms'], entry['ways'], entry['geometry_operations'], entry['skipped'])
+    return table
+
+
+def load_location(location, settings, worker_log_file):
+    """
+    Adds the image to a location.
+
+    :param location: Location to load
+    :type location: location.Location
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param worker_log_file: Log file of the calling worker, shared with other threads
+    :type worker_log_file: pipeline.LockedFile
+    :return: The location
+    :rtype: location.Location
+    """
+    image_file_path = settings['input_folder_path'] + location.name + '.jpg'
+    if os.path.isfile(image_file_path):
+        try:
+            location.add_image(image_file_path)
+        except OSError as error:
+            worker_log_file.write('\tFailed to add image %s: %s \n' % (image_file_path, str(error)))
+            print('\nFailed to add image: %s' % str(error), file=sys.stderr)
+    if not settings['quiet_mode']:
+        print('.', end='', flush=True)
+    return location
+
+
+def fetch_location(location, settings, worker_log_file, client):
+    """
+    Updates the OSM cache file of a location if necessary. If the update fails, an outdated cache file is used
+    and a location without cache file is skipped.
+
+    :param location: Location to update the cache file of
+    :type location: location.Location
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param worker_log_file: Log file of the calling worker, shared with other threads
+    :type worker_log_file: pipeline.LockedFile
+    :param client: Client of the Overpass API used by the calling thread only, or a local extract
+    :type client: overpass.OverpassClient or extract.OSMExtract
+    :return: The location, None if it is skipped
+    :rtype: location.Location
+    """
+    cache_file_name = settings['cache_folder_path'] + location.name + '.osm'
+    file_exists = os.path.isfile(cache_file_name)
+    if file_exists:
+        file_mtime = os.path.getmtime(cache_file_name)
+    else:
+        file_mtime = 0
+    if settings['force_cache_update'] or not file_exists or time.time() - file_mtime > settings['maximum_cache_file_age']:
+        if isinstance(client, OSMExtract):
+            overpass = LocalExtract(cache_file_name, client)
+        else:
+            overpass = Overpass(cache_file_name, client)
+        try:
+            overpass.query_by_lat_lon_and_radius(location.point.y, location.point.x, settings['overpass_radius'])
+        except (urllib.request.URLError, OSError) as error:
+            worker_log_file.write('\t%s...FAILURE\nException: %s\n' % (cache_file_name, str(error)))
+            if file_exists:
+                worker_log_file.write('Could not get "%s", using outdated file.\n' % cache_file_name)
+                return location
+            print('\nCould not get "%s", skipping location "%s".' % (cache_file_name, location.name), file=sys.stderr)
+            worker_log_file.write('Could not get "%s", skipping location "%s".\n' % (cache_file_name, location.name))
+            return None
+        worker_log_file.write('\t%s...OK, %d bytes\n' % (cache_file_name, overpass.file_size))
+        if not settings['quiet_mode']:
+            print('.', end='', flush=True)
+    else:
+        worker_log_file.write('\t%s...Skipped\n' % cache_file_name)
+    return location
+
+
+def parse_location(location, settings, worker_log_file):
+    """
+    Adds the OSM data from the cache file and the generated polygons to a location.
+    Exits the process on errors.
+
+    :param location: Location loaded by load_location()
+    :type location: location.Location
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param worker_log_file: Log file of the calling worker, shared with other threads
+    :type worker_log_file: pipeline.LockedFile
+    :return: The location
+    :rtype: location.Location
+    """
+    cache_file_name = settings['cache_folder_path'] + location.name + '.osm'
+    try:
+        element_tree = xml.etree.ElementTree.parse(cache_file_name)
+    except xml.etree.ElementTree.ParseError as error:
+        print('Removing bad file "%s", please restart the script.' % cache_file_name, file=sys.stderr)
+        worker_log_file.write('Parsing "%s"...FAILURE\nException: %s\n' % (cache_file_name, str(error)))
+        worker_log_file.write('Removing bad file "%s", please restart the script.\n' % cache_file_name)
+        os.remove(cache_file_name)
+        sys.exit(1)
+    except OSError as error:
+        print('Could not parse OSM files, aborting.', file=sys.stderr)
+        worker_log_file.write('Parsing "%s"...FAILURE\nException: %s\n' % (cache_file_name, str(error)))
+        worker_log_file.write('Could not parse OSM files, aborting.\n')
+        sys.exit(1)
+    location.add_osm(OSM(element_tree.getroot()))
+
+    # Add generated locations
+    location.add_generated(GeneratedFromOSMNode(location))
+    if not settings['quiet_mode']:
+        print('.', end='', flush=True)
+    return location
+
+
+def extract_location(location, settings, osm_extract):
+    """
+    Adds the OSM data around a location from a local extract and the generated polygons to a location,
+    without writing a cache file.
+
+    :param location: Location loaded by load_location()
+    :type location: location.Location
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param osm_extract: Local OSM extract
+    :type osm_extract: extract.OSMExtract
+    :return: The location
+    :rtype: location.Location
+    """
+    location.add_osm(osm_extract.osm(location.point.y, location.point.x, settings['overpass_radius']))
+    location.add_generated(GeneratedFromOSMNode(location))
+    if not settings['quiet_mode']:
+        print('.', end='', flush=True)
+    return location
+
+
+def join_location(location, settings, spatial_join):
+    """
+    Adds the OSM data and the generated polygons assigned to a location by the spatial join to the location.
+
+    :param location: Location loaded by load_location()
+    :type location: location.Location
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param spatial_join: Spatial join of all locations
+    :type spatial_join: extract.SpatialJoin
+    :return: The location
+    :rtype: location.Location
+    """
+    spatial_join.add_to_location(location)
+    if not settings['quiet_mode']:
+        print('.', end='', flush=True)
+    return location
+
+
+def prepared_locations(locations, settings, worker_log_file):
+    """
+    Loads (see load_location()), fetches (see fetch_location()) and parses (see parse_location()) locations in a
+    pipeline of threads (see pipeline.stream()), so the next locations are prepared while the caller processes one.
+    With a local OSM extract the OSM data is taken from the extract instead (see extract_location()), with a spatial
+    join from the join (see join_location()).
+    Up to settings['fetch_concurrency'] cache files are fetched at the same time by all worker processes together,
+    each fetching thread keeps its connections to the Overpass API. At most settings['pipeline_queue_size'] locations wait between two stages.
+    Locations are removed from the dict when they enter the pipeline, so each location can be released
+    as soon as the caller is done with it. Locations whose OSM data could not be fetched are skipped.
+    Exits the process on other errors.
+
+    :param locations: Locations to prepare
+    :type locations: dict
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param worker_log_file: Log file of the calling worker, shared with the pipeline threads
+    :type worker_log_file: pipeline.LockedFile
+    :return: Prepared locations in the order of the dict
+    :rtype: generator
+    """
+    thread_data = threading.local()
+    clients = []
+
+    def fetch(location):
+        """
+        Runs fetch_location() with the client of the calling thread, after waiting for a free slot of the worker
+        processes (see init_worker()).
+
+        :param location: Location to update the cache file of
+        :type location: location.Location
+        :return: The location
+        :rtype: location.Location
+        """
+        if not hasattr(thread_data, 'client'):
+            # Threads start with different interpreters
+            thread_data.client = OverpassClient(settings['overpass_urls'], settings['overpass_retries'], settings['overpass_backoff'],
+                                                rate_limiter=_rate_limiter, first=len(clients))
+            clients.append(thread_data.client)
+        if _fetch_slots is None:
+            return fetch_location(location, settings, worker_log_file, thread_data.client)
+        with _fetch_slots:
+            return fetch_location(location, settings, worker_log_file, thread_data.client)
+
+    stages = [lambda location: load_location(location, settings, worker_log_file)]
+    if _spatial_join is not None:
+        stages.append(lambda location: join_location(location, settings, _spatial_join))
+    elif _osm_extract is not None and not settings['osm_extract_to_cache']:
+        stages.append(lambda location: extract_location(location, settings, _osm_extract))
+    else:
+        if settings['skip_cache_update']:
+            worker_log_file.write('Skipping cache update.\n')
+        elif _osm_extract is not None:
+            stages.append(lambda location: fetch_location(location, settings, worker_log_file, _osm_extract))
+        else:
+            stages.append((fetch, settings['fetch_concurrency']))
+        stages.append(lambda location: parse_location(location, settings, worker_log_file))
+    try:
+        yield from stream((locations.pop(name) for name in list(locations.keys())), stages, settings['pipeline_queue_size'])
+    finally:
+        for client in clients:
+            client.close()
+
+
 def worker(locations, worker_id, settings):
     """
     Worker function that processes given locations.
@@ -116,91 +556,13 @@ def worker(locations, worker_id, settings):
     try:
         start_time = time.time()
         worker_log_file_path = settings['log_folder_path'] + settings['log_file_prefix'] + 'process_' + str(worker_id) + '.log'
-        with open(worker_log_file_path, 'w', 1) as worker_log_file:
+        with open(worker_log_file_path, 'w', 1) as log_file:
+            # Shared with the threads of prepared_locations()
+            worker_log_file = LockedFile(log_file)
             worker_log_file.write('+++ Started process %i at %i +++\n\n' % (worker_id, time.time()))
 
-            # Import images
-            worker_log_file.write('Importing images...')
-            failed_osm_parsings = {}
-            image_error_string=''
-            for location in locations.values():
-                image_file_path = settings['input_folder_path'] + location.name + '.jpg'
-                if os.path.isfile(image_file_path):
-                    try:
-                        location.add_image(image_file_path)
-                    except OSError as error:
-                        failed_osm_parsings[location.name] = image_file_path
-                        image_error_string += '\tFailed to add image %s: %s \n' % (image_file_path, str(error))
-                        print('\nFailed to add image: %s' % str(error), file=sys.stderr)
-                else:
-                    failed_osm_parsings[location.name] = image_file_path
-                if not settings['quiet_mode']:
-                    print('.', end='', flush=True)
-            worker_log_file.write('OK, %d failed \n' % len(failed_osm_parsings))
-            worker_log_file.write(image_error_string)
-
-            # Update OSM cache
-            if not settings['skip_cache_update']:
-                worker_log_file.write('Updating OSM cache...\n')
-                current_time = time.time()
-                for location in locations.values():
-                    cache_file_name = settings['cache_folder_path'] + location.name + '.osm'
-                    worker_log_file.write('\t' + cache_file_name + '...')
-                    file_exists = os.path.isfile(cache_file_name)
-                    if file_exists:
-                        file_mtime = os.path.getmtime(cache_file_name)
-                    else:
-                        file_mtime = 0
-                    if settings['force_cache_update'] or not file_exists or current_time - file_mtime > settings['maximum_cache_file_age']:
-                        overpass = Overpass(cache_file_name)
-                        try:
-                            overpass.query_by_lat_lon_and_radius(location.point.y, location.point.x, settings['overpass_radius'])
-                        except (urllib.request.URLError, OSError) as error:
-                            print('Could not get "%s", aborting.\n' % cache_file_name, file=sys.stderr)
-                            worker_log_file.write('FAILURE\n')
-                            worker_log_file.write('Exception: %s\n' % str(error))
-                            worker_log_file.write('Could not get "%s", aborting.\n' % cache_file_name)
-                            sys.exit(1)
-                        worker_log_file.write('OK, %d bytes\n' % overpass.file_size)
-                        if not settings['quiet_mode']:
-                            print('.', end='', flush=True)
-                    else:
-                        worker_log_file.write('Skipped\n')
-            else:
-                worker_log_file.write('Skipping cache update.\n')
-
-            # Parse OSM files
-            try:
-                worker_log_file.write('Parsing OSM files...')
-                for location in locations.values():
-                    cache_file_name = settings['cache_folder_path'] + location.name + '.osm'
-                    try:
-                        element_tree = xml.etree.ElementTree.parse(cache_file_name)
-                    except xml.etree.ElementTree.ParseError as error:
-                        print('Removing bad file "%s", please restart the script.' % cache_file_name, file=sys.stderr)
-                        worker_log_file.write('FAILURE\nException: %s\n' % str(error))
-                        worker_log_file.write('Removing bad file "%s", please restart the script.\n' % cache_file_name)
-                        os.remove(cache_file_name)
-                        sys.exit(1)
-
-                    osm = OSM(element_tree.getroot())
-                    location.add_osm(osm)
-                worker_log_file.write('OK\n')
-                if not settings['quiet_mode']:
-                    print('.', end='', flush=True)
-            except OSError as error:
-                print('Could not parse OSM files, aborting.', file=sys.stderr)
-                worker_log_file.write('FAILURE\nException: %s\n' % str(error))
-                worker_log_file.write('Could not parse OSM files, aborting.\n')
-                sys.exit(1)
-
-            # Add generated locations
-            for location in locations.values():
-                generated = GeneratedFromOSMNode(location)
-                location.add_generated(generated)
-
             # Process
-            worker_log_file.write('Processing...')
+            worker_log_file.write('Processing...\n')
             if settings['factors'] is None:
                 factors = Factors()
                 try:
@@ -212,11 +574,27 @@ def worker(locations, worker_id, settings):
                     sys.exit(1)
             else:
                 factors = settings['factors']
-            for location in locations.values():
+            sur_osm_rules = None
+            if settings['sur_osm_mapping_file_path'] is not None:
+                try:
+                    sur_osm_rules = SUROSMRules.load_file(settings['sur_osm_mapping_file_path'])
+                except Exception as exception:
+                    print('Could not load SUR-OSM mapping file, aborting.', file=sys.stderr)
+                    worker_log_file.write('FAILURE\nException: %s\n' % str(exception))
+                    worker_log_file.write('Could not load SUR-OSM mapping file, aborting.\n')
+                    sys.exit(1)
+            location_statistics = []
+            location_scores_list = []
+            store_scores = settings['score_store_folder_path'] is not None
+            for location in prepared_locations(locations, settings, worker_log_file):
                 # Determine winner
                 processor = Processor(location, factors, settings['output_folder_path'], settings['exclude_slow_classifiers'])
 
                 processor.save_csv_files = settings['debug_output']
+                processor.sur_osm_rules = sur_osm_rules
+                # Stored scores have to be complete for any factors
+                processor.prune_ways = settings['prune_ways'] and not store_scores
+                processor.skip_zero_weight_classifiers = not store_scores
 
                 try:
                     totals = processor.run()
@@ -226,11 +604,15 @@ def worker(locations, worker_id, settings):
                     worker_log_file.write('Could not complete processing, aborting.\n')
                     sys.exit(1)
                 winner_uid = totals[0][0]
+                location_statistics.append(processor.statistics)
+                if store_scores:
+                    location_scores_list.append(LocationScores.from_processor(processor))
 
                 # Build and save local KML
                 single_kml_builder = KMLBuilder()
-                kml_way = location.ways[winner_uid]
-                kml_way.name = location.name
+                # The ways may be shared with other locations (see extract.SpatialJoin)
+                winner = location.ways[winner_uid]
+                kml_way = Way(location.name, dict(winner.tags), winner.polygon)
                 if location.image is not None:
                     kml_way.tags['description'] = '<img src="' + location.name + '.jpg" width="400"/>'
                 single_kml_builder.add_placemark(kml_way)
@@ -260,20 +642,217 @@ def worker(locations, worker_id, settings):
                 if not settings['quiet_mode']:
                     print('.', end='', flush=True)
 
-            worker_log_file.write('OK\n')
+            worker_log_file.write('Processing...OK, %d location(s)\n' % len(location_statistics))
+
+            if store_scores:
+                scores_file_path = settings['score_store_folder_path'] + 'scores_' + str(worker_id) + '.npz'
+                worker_log_file.write('Saving scores to "%s"...' % scores_file_path)
+                try:
+                    classifier_names = [classifier_name(c) for c in registered_classifiers(settings['exclude_slow_classifiers'])]
+                    save_scores_file(scores_file_path, classifier_names, location_scores_list)
+                except OSError as error:
+                    print('Could not save scores file "%s", aborting.' % scores_file_path, file=sys.stderr)
+                    worker_log_file.write('FAILURE\nException: %s\n' % str(error))
+                    worker_log_file.write('Could not save scores file "%s", aborting.\n' % scores_file_path)
+                    sys.exit(1)
+                worker_log_file.write('OK\n')
+
+            # Save classifier statistics for batch.main()
+            with open(statistics_file_path(worker_id, settings), 'w') as statistics_file:
+                statistics_file.write(json.dumps(location_statistics))
+
             worker_log_file.write('\n+++ Completed process %i +++\n' % worker_id, )
 
             end_time = time.time()
             worker_log_file.write('\nElapsed time: %.2f ms\n' % ((end_time - start_time) * 1000))
 
     except OSError as error:
-        print('Process ' + worker_id + ' failed: ' + str(error), file=sys.stderr)
+        print('Process ' + str(worker_id) + ' failed: ' + str(error), file=sys.stderr)
         print('Could not save log file "%s", aborting.' % worker_log_file_path, file=sys.stderr)
         sys.exit(1)
     except KeyboardInterrupt:
         return
 
 
+def log_worker_failure(worker_id, settings, error):
+    """
+    Reports an unexpected exception of a worker on stderr and in the log file of the worker.
+
+    :param worker_id: Unique worker identification token
+    :type worker_id: int
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :param error: Raised exception
+    :type error: Exception
+    :return: None
+    """
+    print('Process %i failed: %s' % (worker_id, str(error)), file=sys.stderr)
+    worker_log_file_path = settings['log_folder_path'] + settings['log_file_prefix'] + 'process_' + str(worker_id) + '.log'
+    try:
+        with open(worker_log_file_path, 'a') as log_file:
+            log_file.write('FAILURE\nException: %s\n' % ''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+            log_file.write('Process %i failed, aborting.\n' % worker_id)
+    except OSError:
+        pass
+
+
+def worker_task(arguments):
+    """
+    Runs worker() as work queue item of a multiprocessing.Pool. worker() exits the process on errors and an exception
+    would end the whole pool, so SystemExit and exceptions are turned into a result.
+
+    :param arguments: Arguments of worker()
+    :type arguments: tuple
+    :return: Worker identification token and whether the worker succeeded
+    :rtype: (int, bool)
+    """
+    try:
+        worker(*arguments)
+    except SystemExit as exit:
+        return arguments[1], exit.code in (0, None)
+    except Exception as error:
+        log_worker_failure(arguments[1], arguments[2], error)
+        return arguments[1], False
+    return arguments[1], True
+
+
+def score_worker(locations, worker_id, settings):
+    """
+    Worker function that computes the unweighted points of given locations.
+    Used for multi-processing by batch.compute_score_table().
+
+    :param locations: Locations this worker will process
+    :type locations: dict
+    :param worker_id: Unique worker identification token
+    :type worker_id: int
+    :param settings: Reference to batch settings
+    :type settings: dict
+    :return: Scores of the locations, None on failure
+    :rtype: [scores.LocationScores]
+    """
+    worker_log_file_path = settings['log_folder_path'] + settings['log_file_prefix'] + 'process_' + str(worker_id) + '.log'
+    try:
+        with open(worker_log_file_path, 'w', 1) as log_file:
+            # Shared with the threads of prepared_locations()
+            worker_log_file = LockedFile(log_file)
+            worker_log_file.write('+++ Started process %i at %i +++\n\n' % (worker_id, time.time()))
+
+            worker_log_file.write('Computing scores...\n')
+            location_scores = []
+            try:
+                for location in prepared_locations(locations, settings, worker_log_file):
+                    # Factors do not matter, all classifiers have to run
+                    processor = Processor(location, Factors(), settings['output_folder_path'], settings['exclude_slow_classifiers'])
+                    processor.save_json_files = False
+                    processor.skip_zero_weight_classifiers = False
+                    try:
+                        processor.run()
+                    except Exception as error:
+                        worker_log_file.write('FAILURE\nException: %s\n' % str(error))
+                        worker_log_file.write('Could not complete processing, aborting.\n')
+                        return None
+                    location_scores.append(LocationScores.from_processor(processor))
+            except SystemExit:
+                return None
+            worker_log_file.write('Computing scores...OK, %d location(s)\n' % len(location_scores))
+            worker_log_file.write('\n+++ Completed process %i +++\n' % worker_id)
+            return location_scores
+    except OSError as error:
+        print('Could not save log file "%s": %s' % (worker_log_file_path, str(error)), file=sys.stderr)
+        return None
+
+
+def score_worker_task(arguments):
+    """
+    Runs score_worker() as work queue item of a multiprocessing.Pool. An exception would end the whole pool,
+    so it is turned into a failed result.
+
+    :param arguments: Arguments of score_worker()
+    :type arguments: tuple
+    :return: Worker identification token and result of score_worker()
+    :rtype: (int, [scores.LocationScores])
+    """
+    try:
+        return arguments[1], score_worker(*arguments)
+    except Exception as error:
+        log_worker_failure(arguments[1], arguments[2], error)
+        return arguments[1], None
+
+
+def compute_score_table(settings, main_log_file, truth_table_file_path=None):
+    """
+    Computes the unweighted points of all locations in the SURs file using all CPUs.
+    The truth polygons are read from settings['input_folder_path'].
+
+    :param settings: Batch settings, settings['factors'] is ignored
+    :type settings: dict
+    :param main_log_file: Log file of the caller
+    :type main_log_file: file
+    :param truth_table_file_path: File to load the truth table (see comparator.TruthTable) from and save it to, None: do not save
+    :type truth_table_file_path: string
+    :return: Score table, None on failure
+    :rtype: scores.ScoreTable
+    """
+    osm_extract = None
+    if settings['osm_extract_file_path'] is not None:
+        osm_extract = load_osm_extract(settings, main_log_file)
+        if osm_extract is None:
+            return None
+
+    spatial_join = None
+    if settings['spatial_join']:
+        main_log_file.write('Parsing SURs file "%s"...' % settings['surs_file_path'])
+    else:
+        main_log_file.write('Computing score table...')
+    try:
+        locations = LocationsFileParser(settings['surs_file_path']).locations
+    except Exception as error:
+        main_log_file.write('FAILURE\nException: %s\n' % str(error))
+        main_log_file.write('Could not parse SURs file "%s", aborting.\n' % settings['surs_file_path'])
+        return None
+    if settings['spatial_join']:
+        main_log_file.write('OK, %d location(s)\n' % len(locations))
+        spatial_join = join_locations(locations, settings, osm_extract, main_log_file)
+        osm_extract = None
+        main_log_file.write('Computing score table...')
+
+    chunks = chunk_locations(locations, settings)
+    with create_pool(settings, osm_extract, spatial_join) as pool:
+        results = dict(pool.imap_unordered(score_worker_task, [(chunk, i, settings) for (i, chunk) in enumerate(chunks)]))
+    if any(result is None for result in results.values()):
+        main_log_file.write('FAILURE\n')
+        main_log_file.write('Failed processes: %s\n' % ', '.join([str(i) for (i, result) in sorted(results.items()) if result is None]))
+        return None
+
+    classifier_names = [classifier_name(c) for c in registered_classifiers(settings['exclude_slow_classifiers'])]
+    score_table = ScoreTable(classifier_names, settings['minimum_intersection_ratio'], settings['use_two_circle_intersection_ratio'])
+    for (i, result) in sorted(results.items()):
+        for location_scores in result:
+            score_table.add_location(location_scores)
+    main_log_file.write('OK, %d location(s)\n' % len(score_table.locations))
+
+    # Intersection ratios of all ways
+    main_log_file.write('Computing truth table...')
+    truth_table = None
+    if truth_table_file_path is not None and os.path.isfile(truth_table_file_path):
+        try:
+            truth_table = TruthTable.load_file(truth_table_file_path)
+        except (OSError, ValueError, KeyError) as error:
+            main_log_file.write('ignoring truth table file "%s" (%s)...' % (truth_table_file_path, str(error)))
+    try:
+        computed = score_table.load_truth_polygons(settings['input_folder_path'], truth_table)
+    except ComparatorError as error:
+        main_log_file.write('FAILURE\nException: %s\n' % str(error))
+        return None
+    main_log_file.write('OK, %d of %d location(s) computed\n' % (computed, len(score_table.truth_polygons)))
+    if truth_table_file_path is not None and computed > 0:
+        try:
+            score_table.truth_table.save_file(truth_table_file_path)
+        except OSError as error:
+            main_log_file.write('Could not save truth table file "%s": %s\n' % (truth_table_file_path, str(error)))
+    return score_table
+
+
 def compare_results(main_log_file, settings):
     """
     Runs the Comparator on on settings['input_folder_path']
@@ -354,6 +933,17 @@ def main(settings):
                 main_log_file.write('FAILURE\nException: %s\n' % str(error))
                 main_log_file.write('Could not create folder "%s", aborting.\n' % settings['output_folder_path'])
                 return 1
+            if settings['score_store_folder_path'] is not None:
+                try:
+                    if not os.path.exists(settings['score_store_folder_path']):
+                        os.makedirs(settings['score_store_folder_path'])
+                    # Files of previous runs might have been written by more workers
+                    for scores_file_path in score_store_files(settings):
+                        os.remove(scores_file_path)
+                except OSError as error:
+                    main_log_file.write('FAILURE\nException: %s\n' % str(error))
+                    main_log_file.write('Could not prepare score store "%s", aborting.\n' % settings['score_store_folder_path'])
+                    return 1
             main_log_file.write('OK\n')
 
             # Validate factors file unless factors are given
@@ -368,6 +958,18 @@ def main(settings):
                     main_log_file.write('Could not validate factors file "%s", aborting.\n' % settings['output_folder_path'])
                     return 1
 
+            # Validate SUR-OSM mapping file if given
+            if settings['sur_osm_mapping_file_path'] is not None:
+                try:
+                    main_log_file.write('Validating SUR-OSM mapping file...')
+                    rules = SUROSMRules.load_file(settings['sur_osm_mapping_file_path'])
+                    main_log_file.write('OK, %d rule(s)\n' % len(rules.rules))
+                except Exception as exception:
+                    print('Could not validate SUR-OSM mapping file "%s", aborting.' % settings['sur_osm_mapping_file_path'], file=sys.stderr)
+                    main_log_file.write('FAILURE\nException: %s\n' % str(exception))
+                    main_log_file.write('Could not validate SUR-OSM mapping file "%s", aborting.\n' % settings['sur_osm_mapping_file_path'])
+                    return 1
+
             # Parse SURs file
             main_log_file.write('Parsing SURs file "%s"...' % settings['surs_file_path'])
             try:
@@ -385,37 +987,55 @@ def main(settings):
                 return 1
             main_log_file.write('OK, %d location(s)\n' % total_locations)
 
+            osm_extract = None
+            if settings['osm_extract_file_path'] is not None:
+                osm_extract = load_osm_extract(settings, main_log_file)
+                if osm_extract is None:
+                    return 1
+            spatial_join = None
+            if settings['spatial_join']:
+                spatial_join = join_locations(locations, settings, osm_extract, main_log_file)
+                # Not needed by the worker processes any more
+                osm_extract = None
+
             # Prepare parallelization
             main_log_file.write('Preparing parallelization...')
-            cpu_count = multiprocessing.cpu_count()
-            parallel_locations = [{} for i in range(cpu_count)]
-            i = 0
-            for key in locations.keys():
-                parallel_locations[i % cpu_count][key] = locations[key]
-                i += 1
-            main_log_file.write('OK, distribution: %s\n' % str([len(pl) for pl in parallel_locations]))
-
-            # Start processes
+            jobs = job_count(settings)
+            chunks = chunk_locations(locations, settings)
+            main_log_file.write('OK, %d chunk(s), distribution: %s\n' % (len(chunks), str([len(chunk) for chunk in chunks])))
+
+            # Idle processes take the next chunk
             if not settings['quiet_mode']:
-                print('Running %d processes' % cpu_count, end='', flush=True)
-            main_log_file.write('Running %d processes...' % cpu_count)
-            processes = []
-            failed_processes = []
-            for i in range(cpu_count):
-                processes.append(multiprocessing.Process(target=worker, args=(parallel_locations[i], i, settings, )))
-            for process in processes:
-                process.start()
-            for process in processes:
-                process.join()
-                if not process.exitcode == 0:
-                    failed_processes += [process]
-            if len(failed_processes) == 0:
+                print('Running %d processes' % jobs, end='', flush=True)
+            main_log_file.write('Running %d processes...' % jobs)
+            failed_chunks = []
+            with create_pool(settings, osm_extract, spatial_join) as pool:
+                for (i, success) in pool.imap_unordered(worker_task, [(chunk, i, settings) for (i, chunk) in enumerate(chunks)]):
+                    if not success:
+                        failed_chunks.append(i)
+            if len(failed_chunks) == 0:
                 main_log_file.write('OK\n')
             else:
                 main_log_file.write('FAILURE\n')
-                main_log_file.write('Failed processes: %s\n' % ', '.join([p.name for p in failed_processes]))
+                main_log_file.write('Failed processes: %s\n' % ', '.join([str(i) for i in sorted(failed_chunks)]))
                 return 1
 
+            # Aggregate classifier statistics
+            location_statistics = []
+            for i in range(len(chunks)):
+                try:
+                    with open(statistics_file_path(i, settings)) as statistics_file:
+                        location_statistics += json.loads(statistics_file.read())
+                except (OSError, ValueError) as error:
+                    main_log_file.write('Could not read classifier statistics of process %i: %s\n' % (i, str(error)))
+            if len(location_statistics) < total_locations:
+                skipped_text = '%d location(s) skipped, see process log files.' % (total_locations - len(location_statistics))
+                if not settings['quiet_mode']:
+                    print('\n' + skipped_text, end='')
+                main_log_file.write(skipped_text + '\n')
+            main_log_file.write('\nClassifier statistics (%d locations):\n' % len(location_statistics))
+            main_log_file.write(format_statistics(aggregate_statistics(location_statistics)) + '\n')
+
             if settings['compare_results']:
                 code = compare_results(main_log_file, settings)
                 if not code == 0:
@@ -438,3 +1058,139 @@ def main(settings):
         sys.exit(1)
 
     return 0
+
+
+def rescore(settings, factors_file_paths):
+    """
+    Determines the winners of all locations in the score store (settings['score_store_folder_path'], written by
+    main()) for one or more factors files without processing the locations again. Writes the *.computed.kml
+    files and images like main() and compares the results if settings['compare_results'] is set.
+    With several factors files, the results of each file are written to a subfolder of
+    settings['output_folder_path'] named like the factors file.
+
+    :param settings: Batch settings, settings['factors_file_path'] and settings['factors'] are ignored
+    :type settings: dict
+    :param factors_file_paths: Paths of the factors files
+    :type factors_file_paths: list
+    :return: 0 when successful, 1 otherwise
+    :rtype: int
+    """
+    header = format_header(settings)
+    if not settings['quiet_mode']:
+        print(header)
+
+    if not os.path.exists(settings['log_folder_path']):
+        try:
+            os.makedirs(settings['log_folder_path'])
+        except OSError as error:
+            print('FAILURE\nException: %s' % str(error))
+            print('Could not create log folder "%s", aborting.' % settings['log_folder_path'])
+            return 1
+
+    main_log_file_path = settings['log_folder_path'] + settings['log_file_prefix'] + 'rescore.log'
+    try:
+        start_time = time.time()
+        with open(main_log_file_path, 'w', 1) as main_log_file:
+            main_log_file.write(header + '\n')
+
+            # Load scores
+            main_log_file.write('Loading score store "%s"...' % settings['score_store_folder_path'])
+            classifier_names = None
+            location_scores_list = []
+            try:
+                scores_file_paths = score_store_files(settings)
+                for scores_file_path in scores_file_paths:
+                    (file_classifier_names, file_location_scores) = load_scores_file(scores_file_path)
+                    if classifier_names is not None and not file_classifier_names == classifier_names:
+                        raise ValueError('Classifiers of "%s" differ from the other files' % scores_file_path)
+                    classifier_names = file_classifier_names
+                    location_scores_list += file_location_scores
+            except (OSError, ValueError, KeyError) as error:
+                main_log_file.write('FAILURE\nException: %s\n' % str(error))
+                main_log_file.write('Could not load score store "%s", aborting.\n' % settings['score_store_folder_path'])
+                return 1
+            if len(location_scores_list) == 0:
+                print('Score store "%s" is empty, aborting.' % settings['score_store_folder_path'], file=sys.stderr)
+                main_log_file.write('FAILURE\n')
+                main_log_file.write('Score store "%s" is empty, aborting.\n' % settings['score_store_folder_path'])
+                return 1
+            main_log_file.write('OK, %d location(s) from %d file(s)\n' % (len(location_scores_list), len(scores_file_paths)))
+
+            # Output folders and factors
+            output_folder_paths = []
+            factor_vectors = []
+            for factors_file_path in factors_file_paths:
+                output_folder_path = settings['output_folder_path']
+                if len(factors_file_paths) > 1:
+                    output_folder_path += os.path.splitext(os.path.basename(factors_file_path))[0] + os.path.sep
+                output_folder_paths.append(output_folder_path)
+                main_log_file.write('Loading factors file "%s" (results in "%s")...' % (factors_file_path, output_folder_path))
+                factors = Factors()
+                try:
+                    factors.load_file(factors_file_path)
+                    if os.path.exists(output_folder_path):
+                        shutil.rmtree(output_folder_path)
+                    os.makedirs(output_folder_path)
+                except Exception as exception:
+                    print('Could not prepare factors file "%s", aborting.' % factors_file_path, file=sys.stderr)
+                    main_log_file.write('FAILURE\nException: %s\n' % str(exception))
+                    main_log_file.write('Could not prepare factors file "%s", aborting.\n' % factors_file_path)
+                    return 1
+                factor_vectors.append(numpy.array([factors.get_factor(name) for name in classifier_names], dtype=float))
+                main_log_file.write('OK\n')
+
+            # Write the results of all factors files location by location, so every image is loaded once
+            main_log_file.write('Rescoring...')
+            for location_scores in location_scores_list:
+                location = Location(location_scores.name, location_scores.point)
+                image_file_path = settings['input_folder_path'] + location.name + '.jpg'
+                if os.path.isfile(image_file_path):
+                    try:
+                        location.add_image(image_file_path)
+                    except OSError as error:
+                        main_log_file.write('\n\tFailed to add image %s: %s\n' % (image_file_path, str(error)))
+
+                for (output_folder_path, factor_vector) in zip(output_folder_paths, factor_vectors):
+                    index = location_scores.winner(factor_vector)
+                    description = location_scores.descriptions[index]
+                    if location.image is not None:
+                        description = '<img src="' + location.name + '.jpg" width="400"/>'
+                    polygon = shapely.geometry.Polygon(location_scores.coordinates[location_scores.offsets[index]:location_scores.offsets[index + 1]])
+
+                    single_kml_builder = KMLBuilder()
+                    single_kml_builder.add_placemark(Way(location.name, {'description': description} if len(description) > 0 else {}, polygon))
+                    single_kml_builder.add_placemark(Node(location.name, {}, location.point))
+                    local_kml_file_path = output_folder_path + location.name + '.computed.kml'
+                    try:
+                        with open(local_kml_file_path, 'w') as kml_file:
+                            kml_file.write(single_kml_builder.run())
+                        if location.image is not None:
+                            location.image.save(output_folder_path + location.name + '.jpg')
+                    except OSError as error:
+                        print('Could not save results of location "%s", aborting.' % location.name, file=sys.stderr)
+                        main_log_file.write('FAILURE\nException: %s\n' % str(error))
+                        main_log_file.write('Could not save results of location "%s" to "%s", aborting.\n' % (location.name, output_folder_path))
+                        return 1
+            main_log_file.write('OK\n')
+
+            if settings['compare_results']:
+                for (factors_file_path, output_folder_path) in zip(factors_file_paths, output_folder_paths):
+                    if not settings['quiet_mode']:
+                        print('Factors file "%s":' % factors_file_path, end='')
+                    main_log_file.write('\nFactors file "%s":\n' % factors_file_path)
+                    code = compare_results(main_log_file, dict(settings, output_folder_path=output_folder_path))
+                    if not code == 0:
+                        return code
+
+            end_time = time.time()
+            elapsed_time_text = '\nElapsed time: %.2f ms' % ((end_time - start_time) * 1000)
+            if not settings['quiet_mode']:
+                print(elapsed_time_text)
+            main_log_file.write(elapsed_time_text + '\n')
+    except OSError as error:
+        print('FAILURE\n')
+        print('%s\n' % str(error))
+        print('Could not write log file "%s", aborting.\n' % main_log_file_path)
+        return 1
+
+    return 0
@@ -19,9 +19,99 @@
 import math
 import shapely.geometry
 from image_processor import *
+from distance import *
+from geometry import *
 
 
-def get_classifiers_list(location=None, exclude_slow_classifiers=False):
+# Classifiers with at least this cost are excluded by the "exclude slow classifiers" policy
+slow_classifier_cost = 10
+
+
+def location_inputs(location):
+    """
+    Returns the inputs available for a location. Classifiers declare the inputs they need in Classifier.requires.
+    - 'image': an RGB(A) image
+    - 'direction': the EXIF GPS image direction
+    - 'surs': at least one SUR
+
+    :param location: Location to inspect
+    :type location: location.Location
+    :return: Available inputs
+    :rtype: set
+    """
+    inputs = set()
+    if location.image is not None and location.image.mode in ('RGB', 'RGBA'):
+        inputs.add('image')
+    if 'direction' in location.gps_info:
+        inputs.add('direction')
+    if len(location.surs) > 0:
+        inputs.add('surs')
+    return inputs
+
+
+def registered_classifiers(exclude_slow_classifiers=False):
+    """
+    Returns the classes of all registered classifiers (classifier_registry) in output order.
+
+    :param exclude_slow_classifiers: Exclude classifiers with a cost of at least slow_classifier_cost (default: False)
+    :type exclude_slow_classifiers: bool
+    :return: List of classifier classes
+    :rtype: list
+    """
+    return [c for c in classifier_registry if not (exclude_slow_classifiers and c.cost >= slow_classifier_cost)]
+
+
+def classifier_name(classifier_class):
+    """
+    Returns the name of a classifier class without instantiating it for a location.
+
+    :param classifier_class: Classifier class
+    :type classifier_class: type
+    :return: Name of the classifier
+    :rtype: string
+    """
+    return classifier_class(None).name()
+
+
+def skip_reason(classifier_class, location, factors=None):
+    """
+    Determines whether a classifier can be skipped for a location because all its weighted points would be 0.
+
+    :param classifier_class: Classifier class
+    :type classifier_class: type
+    :param location: Location to classify
+    :type location: location.Location
+    :param factors: Factors used for weighting, None: do not skip classifiers with a factor of 0
+    :type factors: factors.Factors
+    :return: None if the classifier has to run, otherwise the reason ('not applicable' or 'zero weight')
+    :rtype: string
+    """
+    if not classifier_class.requires.issubset(location_inputs(location)):
+        return 'not applicable'
+    if factors is not None and factors.get_factor(classifier_name(classifier_class)) == 0:
+        return 'zero weight'
+    return None
+
+
+def create_classifier(classifier_class, location, sur_osm_rules=None):
+    """
+    Instantiates a classifier.
+
+    :param classifier_class: Classifier class
+    :type classifier_class: type
+    :param location: Location to instantiate classifier with, may be None
+    :type location: location.Location
+    :param sur_osm_rules: Rules used by SUROSMMapping (Default: classifier.default_sur_osm_rules)
+    :type sur_osm_rules: SUROSMRules
+    :return: Classifier
+    :rtype: Classifier
+    """
+    if classifier_class is SUROSMMapping:
+        return SUROSMMapping(location, sur_osm_rules)
+    return classifier_class(location)
+
+
+def get_classifiers_list(location=None, exclude_slow_classifiers=False, sur_osm_rules=None):
     """
     Returns a list with all classifiers.
     
@@ -29,30 +119,37 @@ def get_classifiers_list(location=None, exclude_slow_classifiers=False):
     :type location: location.Location
     :param exclude_slow_classifiers: Exclude classifiers with suboptimal running times (default: False)
     :type exclude_slow_classifiers: bool
+    :param sur_osm_rules: Rules used by SUROSMMapping (Default: classifier.default_sur_osm_rules)
+    :type sur_osm_rules: SUROSMRules
     :return: List with all classifiers
     :rtype: List
     """
-    classifiers = [ProximityCentroid(location), PointInPolygon(location), ProximityClosestEdge(location),
-                   ProximityClosestVertex(location),
-                   SUROSMMapping(location), SURDescription(location), ExifDirection(location),
-                   GeneratedFromOSMNodeWeight(location), OSMWeight(location)]
-    if not exclude_slow_classifiers:
-        classifiers += [ImageProcessing(location)]
-    return classifiers
+    return [create_classifier(c, location, sur_osm_rules) for c in registered_classifiers(exclude_slow_classifiers)]
 
 
 class Classifier():
+    # False if the classifier must not run concurrently with other classifiers of the same location
+    thread_safe = True
+    # Relative running time (1: cheapest, see slow_classifier_cost)
+    cost = 1
+    # Inputs (see location_inputs()) without which all points are 0
+    requires = set()
+    # Lowest and highest points the classifier can give, used to bound totals
+    score_range = (-100, 100)
+
     def __init__(self, location):
         """
         This is an abstract class representing a classifier.
         A classifier is a unit which rates the polygons with points between -100 and 100.
         Each classifier takes over one specific role.
+        Classifiers count their exact geometry evaluations (distances, predicates) in self.geometry_operations.
         
         :param location: Location object
         :type location: location.Location
         :return: None
         """
         self.location = location
+        self.geometry_operations = 0
 
     def name(self):
         """
@@ -76,8 +173,23 @@ class Classifier():
         """
         raise NotImplementedError("The method classify() of Classifier is not implemented")
 
+    def classify_ways(self, uids):
+        """
+        Rates only the given polygons. The points must be identical to the points given by classify().
+        Classifiers which can save work for a subset of polygons should overwrite this method.
+
+        :param uids: UIDs of the polygons to rate
+        :type uids: list
+        :return: Dictionary with polygon UIDs as keys and polygon points as values
+        :rtype: dict
+        """
+        points = self.classify()
+        return {uid: points[uid] for uid in uids}
+
 
 class ProximityCentroid(Classifier):
+    cost = 3
+
     def __init__(self, location):
         """
         This classifier rates based on the distance between the location and the polygon centroids.
@@ -92,22 +204,18 @@ class ProximityCentroid(Classifier):
         return "Proximity (centroid)"
 
     def classify(self):
-        # Compute distances
-        distances = {}
-        for (name, way) in self.location.ways.items():
-            distances[name] = self.location.point.distance(way.polygon.centroid)
-
-        # Determine points
-        points = {}
-        current = 100
-        for uid in sorted(distances, key=distances.get):
-            points[uid] = current
-            current = max(current - 25, -100)
-
-        return points
+        uids = list(self.location.ways.keys())
+        distances = centroid_distances(self.location.point, list(self.location.ways.values()))
+        self.geometry_operations += len(distances)
+        return rank_points(uids, distances)
 
 
 class PointInPolygon(Classifier):
+    # Prepared geometries build internal indexes on first use and are shared with ExifDirection
+    thread_safe = False
+    cost = 2
+    score_range = (-75, 100)
+
     def __init__(self, location):
         """
         This classifier gives 100 points if the polygon contains the point, -75 otherwise.
@@ -122,13 +230,18 @@ class PointInPolygon(Classifier):
         return "Point in polygon"
 
     def classify(self):
-        points = {}
-        for (name, way) in self.location.ways.items():
-            points[name] = 100 if way.polygon.contains(self.location.point) else -75
+        # Ways whose bounding box does not contain the point can not contain it either
+        points = dict.fromkeys(self.location.ways.keys(), -75)
+        for name in self.location.query_ways(self.location.point):
+            self.geometry_operations += 1
+            if self.location.ways[name].prepared().contains(self.location.point):
+                points[name] = 100
         return points
 
 
 class ProximityClosestEdge(Classifier):
+    cost = 5
+
     def __init__(self, location):
         """
         This classifier rates based on the distance between the location and the polygon's closest edge.
@@ -143,27 +256,21 @@ class ProximityClosestEdge(Classifier):
         return "Proximity (closest edge)"
 
     def classify(self):
-        # Compute distances
-        distances = {}
-        for (name, way) in self.location.ways.items():
-            distances[name] = float('inf')
-            coords = way.polygon.exterior.coords
-            n = len(coords)
-            for i in range(n):
-                line_string = shapely.geometry.linestring.LineString([coords[i], coords[(i + 1) % n]])
-                distances[name] = min(distances[name], self.location.point.distance(line_string))
-
-        # Determine points
-        points = {}
-        current = 100
-        for uid in sorted(distances, key=distances.get):
-            points[uid] = current
-            current = max(current - 25, -100)
-
+        uids = list(self.location.ways.keys())
+        distances = edge_distances(self.location.point, list(self.location.ways.values()))
+        self.geometry_operations += sum(len(way.coordinates()) - 1 for way in self.location.ways.values())
+        return rank_points(uids, distances)
+
+    def classify_ways(self, uids):
+        points, measured = rank_points_of(self.location.point, self.location.ways, list(self.location.ways.keys()),
+                                          uids, edge_distances)
+        self.geometry_operations += sum(len(self.location.ways[uid].coordinates()) - 1 for uid in measured)
         return points
 
 
 class ProximityClosestVertex(Classifier):
+    cost = 3
+
     def __init__(self, location):
         """
         This classifier rates based on the distance between the location and the polygon's closest vertex.
@@ -178,107 +285,198 @@ class ProximityClosestVertex(Classifier):
         return "Proximity (closest vertex)"
 
     def classify(self):
-        # Compute distances
-        distances = {}
-        for (name, way) in self.location.ways.items():
-            distances[name] = float('inf')
-            for coord in way.polygon.exterior.coords:
-                distances[name] = min(distances[name], self.location.point.distance(shapely.geometry.Point(coord)))
+        uids = list(self.location.ways.keys())
+        distances = vertex_distances(self.location.point, list(self.location.ways.values()))
+        self.geometry_operations += sum(len(way.coordinates()) for way in self.location.ways.values())
+        return rank_points(uids, distances)
+
+    def classify_ways(self, uids):
+        points, measured = rank_points_of(self.location.point, self.location.ways, list(self.location.ways.keys()),
+                                          uids, vertex_distances)
+        self.geometry_operations += sum(len(self.location.ways[uid].coordinates()) for uid in measured)
+        return points
 
-        # Determine points
-        points = {}
-        current = 100
-        for uid in sorted(distances, key=distances.get):
-            points[uid] = current
-            current = max(current - 25, -100)
 
+sur_osm_map = [
+    # (SUR key, SUR value, OSM key, OSM value, points)
+    # Points: added upon match, may be negative, total is multiplied by 10 and capped at +- 100)
+    # '*': match any value
+    ('access:dog', 'no', 'building', 'yes', 10),
+    ('access:dog', 'no', 'shop', '*', 10),
+    ('access:dog', 'no', 'amenity', '*', 10),
+    ('access:dog', 'no', 'leisure', 'playground', 10),
+
+    ('access', 'restricted', 'aeroway', 'aerodrome', 10),
+
+    ('dog_waste', 'no', 'landuse', '*', 10),
+    ('dog_waste', 'no', 'leisure', 'playground', 10),
+
+    ('smoking', 'no', 'building', '*', 10),
+    ('smoking', 'no', 'shop', '*', 10),
+    ('smoking', 'no', 'building', 'roof', -20),
+    ('smoking', 'no', 'building', 'university', 10),
+    ('smoking', 'no', 'landuse', 'retail', 10),
+    ('smoking', 'no', 'railway', 'platform', 10),
+    ('smoking', 'no', 'railway', 'station', 10),
+    ('smoking', 'no', 'highway', '*', -10),
+    ('smoking', 'no', 'amenity', 'bank', 10),
+    ('smoking', 'no', 'amenity', 'cafe', 10),
+    ('smoking', 'no', 'amenity', 'parking', -10),
+    ('smoking', 'no', 'amenity', 'bicycle_parking', -10),
+    ('smoking', 'no', 'amenity', 'restaurant', 10),
+    ('smoking', 'no', 'amenity', 'stables', 10),
+    ('smoking', 'no', 'amenity', 'fast_food', 10),
+
+    ('wear:helmet', 'no', 'amenity', 'bank', 10),
+    ('access', 'no', 'landuse', 'construction', 10),
+
+    ('parking', 'yes', 'amenity', 'parking', 10),
+    ('parking', 'yes', 'parking', '*', 10),
+    ('parking', 'restricted', 'amenity', 'parking', 10),
+    ('parking', 'restricted', 'parking', '*', 10),
+
+    ('food', 'no', 'highway', '*', -10),
+    ('food', 'no', 'oneway', '*', -10),
+
+    ('fire', 'no', 'amenity', 'stables', 10),
+
+    ('dog_waste', 'no', 'natural', '*', 10),
+
+    ('way:leave', 'no', 'landuse', 'forest', 10),
+]
+
+
+class SUROSMRules:
+    def __init__(self, rules):
+        """
+        This class compiles a SUR-OSM rule table into an index for fast lookups.
+        A rule is a tuple (SUR key, SUR value, OSM key, OSM value, points), '*' matches any key or value.
+        The index maps (SUR key, SUR value) to OSM keys and OSM values to the sum of the points of all matching rules.
+
+        :param rules: Rules to compile
+        :type rules: [(string, string, string, string, int)]
+        :return: None
+        """
+        self.rules = list(rules)
+        self.index = {}
+        for (sur_key, sur_value, osm_key, osm_value, points) in self.rules:
+            osm_values = self.index.setdefault((sur_key, sur_value), {}).setdefault(osm_key, {})
+            osm_values[osm_value] = osm_values.get(osm_value, 0) + points
+
+    @staticmethod
+    def load_file(path):
+        """
+        Loads a SUR-OSM rule file.
+        A rule file is a comma separated list containing (in that order):
+        [SUR key (string)], [SUR value (string)], [OSM key (string)], [OSM value (string)], [points (int)]
+        Empty lines and lines starting with a number sign (#) will be ignored.
+
+        :param path: Path to rule file
+        :type path: string
+        :raise: ValueError if the file contains no rules, a line without five fields or invalid points
+        :return: Compiled rules
+        :rtype: SUROSMRules
+        """
+        rules = []
+        with open(path, 'r') as data_file:
+            for (number, line) in enumerate(data_file, 1):
+                line = line.strip()
+                if line == '' or line.startswith('#'):
+                    continue
+                parts = [part.strip() for part in line.split(',')]
+                if not len(parts) == 5:
+                    raise ValueError('Line %d of SUR-OSM rule file has %d field(s) instead of 5' % (number, len(parts)))
+                try:
+                    points = int(parts[4])
+                except ValueError:
+                    raise ValueError('Line %d of SUR-OSM rule file has invalid points "%s"' % (number, parts[4]))
+                rules.append((parts[0], parts[1], parts[2], parts[3], points))
+
+        if len(rules) == 0:
+            raise ValueError('Empty SUR-OSM rule file')
+        return SUROSMRules(rules)
+
+    def buckets(self, sur_key, sur_value):
+        """
+        Returns the index entries of all rules matching the SUR, including wildcard rules.
+
+        :param sur_key: SUR key
+        :type sur_key: string
+        :param sur_value: SUR value
+        :type sur_value: string
+        :return: Index entries {OSM key: {OSM value: points}}
+        :rtype: list
+        """
+        keys = dict.fromkeys([(sur_key, sur_value), (sur_key, '*'), ('*', sur_value), ('*', '*')])
+        return [self.index[key] for key in keys if key in self.index]
+
+    @staticmethod
+    def points(buckets, tags):
+        """
+        Sums up the points of all rules in the given index entries matching the tags.
+
+        :param buckets: Index entries as returned by SUROSMRules.buckets()
+        :type buckets: list
+        :param tags: Tags of the way
+        :type tags: dict
+        :return: Sum of points
+        :rtype: int
+        """
+        points = 0
+        for bucket in buckets:
+            for (key, value) in tags.items():
+                osm_values = bucket.get(key)
+                if osm_values is not None:
+                    points += osm_values.get('*', 0)
+                    if value != '*':
+                        points += osm_values.get(value, 0)
+            osm_values = bucket.get('*')
+            if osm_values is not None:
+                points += sum(p for (v, p) in osm_values.items() if v == '*' or v in tags.values())
         return points
 
 
+default_sur_osm_rules = SUROSMRules(sur_osm_map)
+
+
 class SUROSMMapping(Classifier):
-    def __init__(self, location):
+    cost = 2
+    requires = {'surs'}
+
+    def __init__(self, location, rules=None):
         """
         This classifier rates based on the SURs and the tags of the polygons using a map.
 
         :param location: Location to analyse
         :type location: location.Location
+        :param rules: Compiled SUR-OSM rules (Default: classifier.default_sur_osm_rules)
+        :type rules: SUROSMRules
         :return: None
         """
         super().__init__(location)
-
-        self.map = [
-            # (SUR key, SUR value, OSM key, OSM value, points)
-            # Points: added upon match, may be negative, total is multiplied by 10 and capped at +- 100)
-            # '*': match any value
-            ('access:dog', 'no', 'building', 'yes', 10),
-            ('access:dog', 'no', 'shop', '*', 10),
-            ('access:dog', 'no', 'amenity', '*', 10),
-            ('access:dog', 'no', 'leisure', 'playground', 10),
-
-            ('access', 'restricted', 'aeroway', 'aerodrome', 10),
-
-            ('dog_waste', 'no', 'landuse', '*', 10),
-            ('dog_waste', 'no', 'leisure', 'playground', 10),
-
-            ('smoking', 'no', 'building', '*', 10),
-            ('smoking', 'no', 'shop', '*', 10),
-            ('smoking', 'no', 'building', 'roof', -20),
-            ('smoking', 'no', 'building', 'university', 10),
-            ('smoking', 'no', 'landuse', 'retail', 10),
-            ('smoking', 'no', 'railway', 'platform', 10),
-            ('smoking', 'no', 'railway', 'station', 10),
-            ('smoking', 'no', 'highway', '*', -10),
-            ('smoking', 'no', 'amenity', 'bank', 10),
-            ('smoking', 'no', 'amenity', 'cafe', 10),
-            ('smoking', 'no', 'amenity', 'parking', -10),
-            ('smoking', 'no', 'amenity', 'bicycle_parking', -10),
-            ('smoking', 'no', 'amenity', 'restaurant', 10),
-            ('smoking', 'no', 'amenity', 'stables', 10),
-            ('smoking', 'no', 'amenity', 'fast_food', 10),
-
-            ('wear:helmet', 'no', 'amenity', 'bank', 10),
-            ('access', 'no', 'landuse', 'construction', 10),
-
-            ('parking', 'yes', 'amenity', 'parking', 10),
-            ('parking', 'yes', 'parking', '*', 10),
-            ('parking', 'restricted', 'amenity', 'parking', 10),
-            ('parking', 'restricted', 'parking', '*', 10),
-
-            ('food', 'no', 'highway', '*', -10),
-            ('food', 'no', 'oneway', '*', -10),
-
-            ('fire', 'no', 'amenity', 'stables', 10),
-
-            ('dog_waste', 'no', 'natural', '*', 10),
-
-            ('way:leave', 'no', 'landuse', 'forest', 10),
-        ]
+        self.rules = default_sur_osm_rules if rules is None else rules
 
     def name(self):
         return "SUR-OSM Mapping"
 
     def classify(self):
+        buckets = []
+        for (sur_key, sur_value) in self.location.surs.items():
+            buckets += self.rules.buckets(sur_key, sur_value)
+
         totals = {}
         for (name, way) in self.location.ways.items():
-            points = 0
-            for (sur_key, sur_value) in self.location.surs.items():
-                for m in self.map:
-                    match = True
-                    match &= m[0] == '*' or m[0] == sur_key
-                    match &= m[1] == '*' or m[1] == sur_value
-                    if m[2] == '*' or m[2] in way.tags:
-                        match &= m[3] == '*' or way.tags[m[2]] == m[3]
-                    else:
-                        match = False
-                    if match:
-                        points += m[4]
-
+            points = SUROSMRules.points(buckets, way.tags)
             totals[name] = min([100, points * 10]) if points > 0 else max([-100, points * 10])
 
         return totals
 
 
 class ImageProcessing(Classifier):
+    cost = slow_classifier_cost
+    requires = {'image'}
+    score_range = (0, 100)
+
     def __init__(self, location):
         """
         This classifier rates based on image processing methods.
@@ -313,11 +511,23 @@ class ImageProcessing(Classifier):
 
         return totals
 
+    def classify_ways(self, uids):
+        # Only polygons with an outside tag depend on the image
+        totals = dict.fromkeys(uids, 0)
+        candidates = [key for key in uids if not self.location.ways[key].tags.keys().isdisjoint(self.tags_outside)]
+        if len(candidates) > 0:
+            totals.update(super().classify_ways(candidates))
+        return totals
+
 
 class SURDescription(Classifier):
+    cost = 1
+    requires = {'surs'}
+
     def __init__(self, location):
         """
-        This classifier rates based on the SURs and the tags of the polygon
+        This classifier rates based on the SURs and the tags of the polygon.
+        The categories of the polygons are precomputed in geometry.Way.categories.
         
         :param location: Location to analyse
         :type location: location.Location
@@ -330,67 +540,50 @@ class SURDescription(Classifier):
         self.tags_street = {'maxspeed', 'minspeed', 'oneway'}
         self.tags_water = {'swimming', 'fishing'}
 
-        # OSM tags
-        self.keys_building = {'building', 'shop'}  # Don't forget landuse=retail
-        self.keys_outside = {'natural', 'landuse'}
-        self.keys_street = {'highway', 'sidewalk', 'cycleway', 'busway', 'public_transport', 'railway', 'bridge',
-                            'tracks', 'tunnel', 'route'}
-        self.keys_water = {
-        'waterway'}  # Don't forget natural=water,bay,spring | landuse = reservoir,basin,reservoir_watershed
-
     def name(self):
         return "SUR Description"
 
+    def sur_categories(self, sur_key):
+        """
+        Returns the categories (see geometry.tag_categories()) a SUR key belongs to.
+
+        :param sur_key: SUR key
+        :type sur_key: string
+        :return: Category bit mask
+        :rtype: int
+        """
+        categories = 0
+        if sur_key in self.tags_building:
+            categories |= category_building
+        if sur_key in self.tags_outside:
+            categories |= category_outside
+        if sur_key in self.tags_street:
+            categories |= category_street
+        if sur_key in self.tags_water:
+            categories |= category_water
+        return categories
+
     def classify(self):
+        # Number of SURs per category: +1 for each if the way has the category, -1 otherwise
+        counts = {category: 0 for category in (category_building, category_outside, category_street, category_water)}
+        for sur_key in self.location.surs.keys():
+            sur_categories = self.sur_categories(sur_key)
+            for category in counts.keys():
+                if sur_categories & category:
+                    counts[category] += 1
+        counts = [(category, count) for (category, count) in counts.items() if count > 0]
+
         points = {}
-        for way_key in self.location.ways.keys():
+        for (way_key, way) in self.location.ways.items():
             points_way = 0
-            for sur_key in self.location.surs.keys():
-                way_tags = self.location.ways[way_key].tags
-
-                # Buildings
-                if sur_key in self.tags_building:
-                    delta = -1
-                    for key in way_tags.keys():
-                        if key in self.keys_building:
-                            delta = 1
-                        elif key == "landuse" and way_tags["landuse"] in ["retail"]:
-                            delta = 1
-                    points_way += delta
-
-                # Outside
-                if sur_key in self.tags_outside:
-                    delta = -1
-                    for key in way_tags.keys():
-                        if key in self.keys_outside:
-                            delta = 1
-                    points_way += delta
-
-                # Street
-                if sur_key in self.tags_street:
-                    delta = -1
-                    for key in way_tags.keys():
-                        if key in self.keys_street:
-                            delta = 1
-                    points_way += delta
-
-                # Water
-                if sur_key in self.tags_water:
-                    delta = -1
-                    for key in way_tags.keys():
-                        if key in self.keys_water:
-                            delta = 1
-                        elif key == "natural" and way_tags["natural"] in ["water", "bay", "spring"]:
-                            delta = 1
-                        elif key == "landuse" and way_tags["landuse"] in ["reservoir", "basin", "reservoir_watershed"]:
-                            delta = 1
-                    points_way += delta
-
-                # Identical
-                for key in self.location.ways[way_key].tags.keys():
-                    if key == sur_key and self.location.surs[sur_key] == self.location.ways[way_key].tags[key]:
-                        # Must be low due to many location which do not have a corresponding tag.
-                        points_way += 1
+            for (category, count) in counts:
+                points_way += count if way.categories & category else -count
+
+            # Identical
+            for (sur_key, sur_value) in self.location.surs.items():
+                if sur_key in way.tags and way.tags[sur_key] == sur_value:
+                    # Must be low due to many location which do not have a corresponding tag.
+                    points_way += 1
 
             # Determine points
             if points_way > 0:
@@ -404,6 +597,12 @@ class SURDescription(Classifier):
 
 
 class ExifDirection(Classifier):
+    # Prepared geometries build internal indexes on first use and are shared with PointInPolygon
+    thread_safe = False
+    cost = 2
+    requires = {'direction'}
+    score_range = (0, 100)
+
     def __init__(self, location):
         """
         This classifier rates based on the exif ImageDirection tag
@@ -421,7 +620,6 @@ class ExifDirection(Classifier):
         if 'direction' not in self.location.gps_info.keys():
             return dict(zip(self.location.ways.keys(), [0] * len(self.location.ways)))
         else:
-            points = {}
             direction = self.location.gps_info['direction']
             p = self.location.point
 
@@ -438,13 +636,19 @@ class ExifDirection(Classifier):
 
             line = shapely.geometry.LineString([p, v])
             # print(self.location.name, direction, str([str(c[1]) + ' ' + str(c[0]) for c in line.coords]))
-            for (name, way) in self.location.ways.items():
-                points[name] = 100 if line.intersects(way.polygon) else 0
+            points = dict.fromkeys(self.location.ways.keys(), 0)
+            for name in self.location.query_ways(line):
+                self.geometry_operations += 1
+                if self.location.ways[name].prepared().intersects(line):
+                    points[name] = 100
 
         return points
 
 
 class GeneratedFromOSMNodeWeight(Classifier):
+    cost = 1
+    score_range = (-100, 0)
+
     def __init__(self, location):
         """
         This classifier gives -100 points to generated polygons, 0 to other polygons.
@@ -468,6 +672,9 @@ class GeneratedFromOSMNodeWeight(Classifier):
 
 
 class OSMWeight(Classifier):
+    cost = 1
+    score_range = (-100, 0)
+
     def __init__(self, location):
         """
         This classifier gives -100 points to open street maps polygons, 0 to other polygons.
@@ -487,4 +694,9 @@ class OSMWeight(Classifier):
         for (name, way) in self.location.ways.items():
             is_gpl_polygon = 'source' in way.tags and way.tags['source'] == 'osm'
             points[name] = -100 if is_gpl_polygon else 0
-        return points
\ No newline at end of file
+        return points
+
+
+# All classifiers in output order
+classifier_registry = [ProximityCentroid, PointInPolygon, ProximityClosestEdge, ProximityClosestVertex, SUROSMMapping,
+                       SURDescription, ExifDirection, GeneratedFromOSMNodeWeight, OSMWeight, ImageProcessing]
@@ -17,6 +17,7 @@
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import json
 import xml.etree.ElementTree
 import sys
 import math
@@ -31,6 +32,197 @@ class ComparatorError(Exception):
     pass
 
 
+def kml_files(folder_path, suffix):
+    """
+    Finds the KML files of all locations in a folder.
+
+    :param folder_path: Folder to search
+    :type folder_path: string
+    :param suffix: File name suffix, e.g. '.truth.kml'
+    :type suffix: string
+    :return: Dictionary with location names as keys and file names as values
+    :rtype: dict
+    """
+    files = {}
+    for subdir_name, dir_names, file_names in os.walk(folder_path):
+        for file_name in file_names:
+            if suffix in file_name:
+                files[file_name.replace(suffix, '')] = file_name
+    return files
+
+
+def read_kml_polygon(file_path):
+    """
+    Reads the polygon of a KML file containing exactly one polygon.
+
+    :param file_path: Path to the KML file
+    :type file_path: string
+    :raise: AssertionError if the file does not contain exactly one polygon, OSError or ParseError if it can not be read
+    :return: Polygon
+    :rtype: shapely.geometry.Polygon
+    """
+    kml = KML(xml.etree.ElementTree.parse(file_path).getroot())
+    assert len(kml.ways) == 1
+    return next(iter(kml.ways.values())).polygon
+
+
+def two_circles(truth_polygon):
+    """
+    Computes the circles used by the "two circle intersection ratio" method: the inner circle touches the closest
+    edge of the truth polygon, the outer circle has 1.5 times the distance to the farthest vertex as radius.
+    Both circles are centered at the centroid of the truth polygon.
+
+    :param truth_polygon: Polygon from the *.truth.kml
+    :type truth_polygon: shapely.geometry.Polygon
+    :return: Inner circle and outer circle
+    :rtype: (shapely.geometry.Polygon, shapely.geometry.Polygon)
+    """
+    center = truth_polygon.centroid
+    distance_inner = float('inf')
+    distance_outer = -1.0
+    coords = truth_polygon.exterior.coords
+    n = len(coords)
+    for i in range(n):
+        distance_outer = max(distance_outer, center.distance(shapely.geometry.Point(coords[i])))
+        line_string = shapely.geometry.linestring.LineString([coords[i], coords[(i + 1) % n]])
+        distance_inner = min(distance_inner, center.distance(line_string))
+    return center.buffer(distance_inner), center.buffer(distance_outer * 1.5)
+
+
+def intersection_ratio(truth_polygon, computed_polygon, minimum_intersection_ratio, use_two_circle_intersection_ratio=False, circles=None):
+    """
+    Computes the intersection ratio between a truth polygon and a computed polygon.
+
+    :param truth_polygon: Polygon from the *.truth.kml
+    :type truth_polygon: shapely.geometry.Polygon
+    :param computed_polygon: Polygon from the *.computed.kml
+    :type computed_polygon: shapely.geometry.Polygon
+    :param minimum_intersection_ratio: Ratio polygons have to share to be considered equal
+    :type minimum_intersection_ratio: float
+    :param use_two_circle_intersection_ratio: Use the "two circle intersection ratio" method
+    :type use_two_circle_intersection_ratio: bool
+    :param circles: Result of two_circles(truth_polygon) if already known
+    :type circles: (shapely.geometry.Polygon, shapely.geometry.Polygon)
+    :raise shapely.geos.TopologicalError: if the polygons can not be intersected
+    :return: Intersection ratio
+    :rtype: float
+    """
+    computed_hull = computed_polygon.convex_hull
+    ratio = 0.0
+    if use_two_circle_intersection_ratio:
+        (inner_circle, outer_circle) = two_circles(truth_polygon) if circles is None else circles
+        if abs(outer_circle.intersection(computed_hull).area / outer_circle.area) < minimum_intersection_ratio:
+            ratio = abs(inner_circle.intersection(computed_hull).area / inner_circle.area)
+    else:
+        truth_hull = truth_polygon.convex_hull
+        intersection_area = truth_hull.intersection(computed_hull).area
+        ratio = (2 * intersection_area) / (truth_hull.area + computed_hull.area)
+    return ratio
+
+
+class TruthTable:
+    def __init__(self, minimum_intersection_ratio):
+        """
+        This class stores the intersection ratios (default and "two circle" method) between the truth polygon
+        of a location and every way which could be computed for it. Every location has a key identifying
+        its inputs, so the table can be saved and reused as long as the inputs do not change.
+
+        :param minimum_intersection_ratio: Ratio polygons have to share to be considered equal
+        :type minimum_intersection_ratio: float
+        :return: None
+        """
+        self.minimum_intersection_ratio = minimum_intersection_ratio
+        self.locations = {}
+
+    def contains(self, location_name, key):
+        """
+        Checks whether the table contains the ratios of a location for the given inputs.
+
+        :param location_name: Location name
+        :type location_name: string
+        :param key: Key identifying the inputs of the location
+        :type key: string
+        :return: True if the ratios are known
+        :rtype: bool
+        """
+        return location_name in self.locations and self.locations[location_name]['key'] == key
+
+    def add_location(self, location_name, key, truth_polygon, polygons):
+        """
+        Computes the intersection ratios of all ways of a location.
+        Ways which can not be intersected get an error message instead of the ratios.
+
+        :param location_name: Location name
+        :type location_name: string
+        :param key: Key identifying the inputs of the location
+        :type key: string
+        :param truth_polygon: Polygon from the *.truth.kml
+        :type truth_polygon: shapely.geometry.Polygon
+        :param polygons: Polygons of the ways as in the *.computed.kml (UIDs as keys)
+        :type polygons: dict
+        :return: None
+        """
+        circles = two_circles(truth_polygon)
+        ratios = {}
+        for (uid, polygon) in polygons.items():
+            try:
+                ratios[uid] = [intersection_ratio(truth_polygon, polygon, self.minimum_intersection_ratio),
+                               intersection_ratio(truth_polygon, polygon, self.minimum_intersection_ratio, True, circles)]
+            except shapely.geos.TopologicalError as error:
+                ratios[uid] = str(error)
+        self.locations[location_name] = {'key': key, 'ratios': ratios}
+
+    def intersection_ratio(self, location_name, uid, use_two_circle_intersection_ratio=False):
+        """
+        Returns the intersection ratio of a way.
+
+        :param location_name: Location name
+        :type location_name: string
+        :param uid: UID of the way
+        :type uid: string
+        :param use_two_circle_intersection_ratio: Use the "two circle intersection ratio" method
+        :type use_two_circle_intersection_ratio: bool
+        :raise shapely.geos.TopologicalError: if the polygons could not be intersected
+        :return: Intersection ratio
+        :rtype: float
+        """
+        ratios = self.locations[location_name]['ratios'][uid]
+        if isinstance(ratios, str):
+            raise shapely.geos.TopologicalError(ratios)
+        return ratios[1] if use_two_circle_intersection_ratio else ratios[0]
+
+    @staticmethod
+    def load_file(path):
+        """
+        Loads a table saved by TruthTable.save_file().
+
+        :param path: Path to the table file
+        :type path: string
+        :raise: OSError or ValueError if the file can not be read
+        :return: Table
+        :rtype: TruthTable
+        """
+        with open(path) as table_file:
+            data = json.loads(table_file.read())
+        table = TruthTable(data['minimum_intersection_ratio'])
+        table.locations = data['locations']
+        return table
+
+    def save_file(self, path):
+        """
+        Saves the table. The file is replaced atomically.
+
+        :param path: Path to the table file
+        :type path: string
+        :raise: OSError if the file can not be written
+        :return: None
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as table_file:
+            table_file.write(json.dumps({'minimum_intersection_ratio': self.minimum_intersection_ratio, 'locations': self.locations}, separators=(',', ':')))
+        os.replace(temporary_path, path)
+
+
 class Comparator:
     def __init__(self, input_folder_path, output_folder_path, maximum_symmetric_difference, raise_on_critical_error=False, use_two_circle_intersection_ratio=False):
         """
@@ -93,40 +285,23 @@ class Comparator:
             self.handle_critical_error('Input folder (%s) does not exist' % self.input_folder_path)
 
         truth_polygons = {}
-        for subdir_name, dir_names, file_names in os.walk(self.input_folder_path):
-            for file_name in file_names:
-                if '.truth.kml' not in file_name:
-                    continue
-
-                location_name = file_name.replace('.truth.kml', '')
-                try:
-                    kml = KML(xml.etree.ElementTree.parse(self.input_folder_path + file_name).getroot())
-                    assert len(kml.ways) == 1
-                    polygon = next(iter(kml.ways.values())).polygon
-                    truth_polygons[location_name] = polygon
-                except:
-                    self.handle_critical_error('Failed to parse KML file "%s".' % file_name)
+        for (location_name, file_name) in kml_files(self.input_folder_path, '.truth.kml').items():
+            try:
+                truth_polygons[location_name] = read_kml_polygon(self.input_folder_path + file_name)
+            except:
+                self.handle_critical_error('Failed to parse KML file "%s".' % file_name)
 
         # Read computed polygons
         if not os.path.exists(self.output_folder_path):
             self.handle_critical_error('Output folder (%s) does not exist' % self.output_folder_path)
 
         computed_polygons = {}
-        for subdir_name, dir_names, file_names in os.walk(self.output_folder_path):
-            for file_name in file_names:
-                if '.computed.kml' not in file_name:
-                    continue
-
-                location_name = file_name.replace('.computed.kml', '')
-                try:
-                    kml = KML(xml.etree.ElementTree.parse(self.output_folder_path + file_name).getroot())
-                    assert len(kml.ways) == 1
-                    polygon = next(iter(kml.ways.values())).polygon
-                    computed_polygons[location_name] = polygon
-                except:
-                    self.handle_critical_error('Failed to parse KML file "%s".' % file_name)
-
-        values = []
+        for (location_name, file_name) in kml_files(self.output_folder_path, '.computed.kml').items():
+            try:
+                computed_polygons[location_name] = read_kml_polygon(self.output_folder_path + file_name)
+            except:
+                self.handle_critical_error('Failed to parse KML file "%s".' % file_name)
+
         # Compare locations
         for key in truth_polygons:
             if not key in computed_polygons:
@@ -134,44 +309,44 @@ class Comparator:
                 continue
 
             try:
-                truth_hull = truth_polygons[key].convex_hull
-                computed_hull = computed_polygons[key].convex_hull
-                passed = False
-                intersection_ratio = 0.0
-                if self.use_two_circle_intersection_ratio:
-                    center = truth_polygons[key].centroid
-                    distance_inner = float('inf')
-                    distance_outer = -1.0
-                    coords = truth_polygons[key].exterior.coords
-                    n = len(coords)
-                    for i in range(n):
-                        distance_outer = max(distance_outer, center.distance(shapely.geometry.Point(coords[i])))
-                        line_string = shapely.geometry.linestring.LineString([coords[i], coords[(i + 1) % n]])
-                        distance_inner = min(distance_inner, center.distance(line_string))
-                    inner_circle = center.buffer(distance_inner)
-                    outer_circle = center.buffer(distance_outer * 1.5)
-                    if abs(outer_circle.intersection(computed_hull).area / outer_circle.area) < self.minimum_intersection_ratio:
-                        intersection_ratio = abs(inner_circle.intersection(computed_hull).area / inner_circle.area)
-                else:
-                    intersection_area = truth_hull.intersection(computed_hull).area
-                    intersection_ratio = (2 * intersection_area) / (truth_hull.area + computed_hull.area)
-                passed = self.minimum_intersection_ratio < intersection_ratio
-                self.total_intersection_ratio += intersection_ratio
-                values.append(intersection_ratio)
-                if passed:
-                    self.passed[key] = intersection_ratio
-                else:
-                    self.failed[key] = intersection_ratio
+                self.add_result(key, intersection_ratio(truth_polygons[key], computed_polygons[key], self.minimum_intersection_ratio, self.use_two_circle_intersection_ratio))
             except shapely.geos.TopologicalError as error:
                 self.erroneous[key] = error
 
-        values.sort()
+        self.complete(len(truth_polygons))
+
+    def add_result(self, key, intersection_ratio):
+        """
+        Adds the intersection ratio of a location to the results.
+
+        :param key: Location name
+        :type key: string
+        :param intersection_ratio: Intersection ratio as returned by comparator.intersection_ratio()
+        :type intersection_ratio: float
+        :return: None
+        """
+        self.total_intersection_ratio += intersection_ratio
+        if self.minimum_intersection_ratio < intersection_ratio:
+            self.passed[key] = intersection_ratio
+        else:
+            self.failed[key] = intersection_ratio
+
+    def complete(self, total):
+        """
+        Computes the statistics of all added results.
+
+        :param total: Number of compared locations including erroneous locations
+        :type total: int
+        :return: None
+        """
+        values = sorted(list(self.passed.values()) + list(self.failed.values()))
         self.min_value = values[0]
         self.max_value = values[-1]
-        self.median = values[round(len(values)/2)]
-        self.Q1 = values[round(len(values)/4)]
-        self.Q3 = values[round(len(values)*3/4)]
-        self.average_intersection_ratio = self.total_intersection_ratio / len(truth_polygons)
+        last = len(values) - 1
+        self.median = values[min(round(len(values)/2), last)]
+        self.Q1 = values[min(round(len(values)/4), last)]
+        self.Q3 = values[min(round(len(values)*3/4), last)]
+        self.average_intersection_ratio = self.total_intersection_ratio / total
         self.variance = sum((value - self.average_intersection_ratio) ** 2 for value in values) / len(values)
         self.standard_deviation = math.sqrt(self.variance)
 
@@ -0,0 +1,219 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+
+def stack_coordinates(ways):
+    """
+    Concatenates the exterior coordinates of all ways into a single array.
+
+    :param ways: Ways to stack
+    :type ways: [geometry.Way]
+    :return: Coordinates (n x 2) and offsets of the first coordinate of every way (len(ways) + 1 entries)
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    arrays = [way.coordinates() for way in ways]
+    lengths = [len(array) for array in arrays]
+    offsets = numpy.zeros(len(arrays) + 1, dtype=int)
+    offsets[1:] = numpy.cumsum(lengths)
+    if len(arrays) == 0:
+        return numpy.zeros((0, 2)), offsets
+    return numpy.concatenate(arrays), offsets
+
+
+def point_distances(point, coordinates):
+    """
+    Computes the distances between a point and an array of coordinates.
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param coordinates: Coordinates (n x 2)
+    :type coordinates: numpy.ndarray
+    :return: Distances (n)
+    :rtype: numpy.ndarray
+    """
+    dx = coordinates[:, 0] - point.x
+    dy = coordinates[:, 1] - point.y
+    return numpy.sqrt(dx * dx + dy * dy)
+
+
+def segment_distances(point, starts, ends):
+    """
+    Computes the distances between a point and line segments. Follows the formula used by GEOS,
+    so the results are identical to shapely's point.distance(LineString([start, end])).
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param starts: Start coordinates of the segments (n x 2)
+    :type starts: numpy.ndarray
+    :param ends: End coordinates of the segments (n x 2)
+    :type ends: numpy.ndarray
+    :return: Distances (n)
+    :rtype: numpy.ndarray
+    """
+    bx = ends[:, 0] - starts[:, 0]
+    by = ends[:, 1] - starts[:, 1]
+    px = point.x - starts[:, 0]
+    py = point.y - starts[:, 1]
+    length2 = bx * bx + by * by
+    degenerate = length2 == 0
+    length2 = numpy.where(degenerate, 1.0, length2)
+
+    r = (px * bx + py * by) / length2
+    s = (-py * bx + px * by) / length2
+    distances = numpy.abs(s) * numpy.sqrt(length2)
+
+    distances = numpy.where(r <= 0.0, point_distances(point, starts), distances)
+    distances = numpy.where(r >= 1.0, point_distances(point, ends), distances)
+    return numpy.where(degenerate, point_distances(point, starts), distances)
+
+
+def vertex_distances(point, ways):
+    """
+    Computes the distance between a point and the closest exterior vertex of every way.
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param ways: Ways to measure
+    :type ways: [geometry.Way]
+    :return: Distances in the order of the given ways
+    :rtype: numpy.ndarray
+    """
+    if len(ways) == 0:
+        return numpy.zeros(0)
+    coordinates, offsets = stack_coordinates(ways)
+    return numpy.minimum.reduceat(point_distances(point, coordinates), offsets[:-1])
+
+
+def edge_distances(point, ways):
+    """
+    Computes the distance between a point and the closest exterior edge of every way.
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param ways: Ways to measure
+    :type ways: [geometry.Way]
+    :return: Distances in the order of the given ways
+    :rtype: numpy.ndarray
+    """
+    if len(ways) == 0:
+        return numpy.zeros(0)
+    coordinates, offsets = stack_coordinates(ways)
+
+    # Exterior rings are closed, so every coordinate but the last of each way starts an edge
+    is_start = numpy.ones(len(coordinates), dtype=bool)
+    is_start[offsets[1:] - 1] = False
+    starts = numpy.flatnonzero(is_start)
+    distances = segment_distances(point, coordinates[starts], coordinates[starts + 1])
+
+    edge_offsets = offsets[:-1] - numpy.arange(len(ways))
+    return numpy.minimum.reduceat(distances, edge_offsets)
+
+
+def centroid_distances(point, ways):
+    """
+    Computes the distance between a point and the centroid of every way.
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param ways: Ways to measure
+    :type ways: [geometry.Way]
+    :return: Distances in the order of the given ways
+    :rtype: numpy.ndarray
+    """
+    if len(ways) == 0:
+        return numpy.zeros(0)
+    centroids = numpy.array([(way.centroid().x, way.centroid().y) for way in ways], dtype=float)
+    return point_distances(point, centroids)
+
+
+def bounds_distances(point, ways):
+    """
+    Computes the distance between a point and the bounding box of every way.
+    This is a lower bound of the vertex, edge and centroid distances.
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param ways: Ways to measure
+    :type ways: [geometry.Way]
+    :return: Distances in the order of the given ways
+    :rtype: numpy.ndarray
+    """
+    if len(ways) == 0:
+        return numpy.zeros(0)
+    bounds = numpy.array([way.bounds() for way in ways], dtype=float)
+    dx = numpy.maximum(numpy.maximum(bounds[:, 0] - point.x, point.x - bounds[:, 2]), 0.0)
+    dy = numpy.maximum(numpy.maximum(bounds[:, 1] - point.y, point.y - bounds[:, 3]), 0.0)
+    return numpy.sqrt(dx * dx + dy * dy)
+
+
+def rank_points(uids, distances, step=25):
+    """
+    Converts distances to points based on their rank: the closest way gets 100 points, every following
+    way "step" points less, but never less than -100. Equal distances keep the order of the given uids.
+
+    :param uids: UIDs of the ways
+    :type uids: list
+    :param distances: Distances in the order of uids
+    :type distances: numpy.ndarray
+    :param step: Points subtracted per rank (Default: 25)
+    :type step: int
+    :return: Dictionary with polygon UIDs as keys and polygon points as values
+    :rtype: dict
+    """
+    order = numpy.argsort(distances, kind='stable')
+    points = numpy.maximum(100 - step * numpy.arange(len(order)), -100)
+    return {uids[i]: int(p) for (i, p) in zip(order, points)}
+
+
+def rank_points_of(point, ways, uids, subset, measure, step=25):
+    """
+    Computes the points rank_points() would assign to a subset of the ways without measuring all ways exactly.
+    Only ways whose bounding box is not farther away than the farthest way of the subset are measured,
+    all other ways are ranked behind the subset anyway.
+
+    :param point: Reference point
+    :type point: shapely.geometry.Point
+    :param ways: All ways
+    :type ways: {UID: geometry.Way}
+    :param uids: UIDs of all ways in ranking order (see rank_points())
+    :type uids: list
+    :param subset: UIDs to compute the points for
+    :type subset: list
+    :param measure: Distance function, e.g. edge_distances
+    :type measure: function
+    :param step: Points subtracted per rank (Default: 25)
+    :type step: int
+    :return: Dictionary with the UIDs of the subset as keys and their points as values and the list of measured UIDs
+    :rtype: (dict, list)
+    """
+    subset = set(subset)
+    distances = dict(zip(subset, measure(point, [ways[uid] for uid in subset])))
+    if len(distances) == 0:
+        return {}, []
+    # Slack for rounding differences between bounding box and exact distances
+    limit = max(distances.values()) * (1 + 1e-9) + 1e-12
+
+    others = [uid for uid in uids if uid not in subset]
+    others = [uid for (uid, d) in zip(others, bounds_distances(point, [ways[uid] for uid in others])) if d <= limit]
+    distances.update(zip(others, measure(point, [ways[uid] for uid in others])))
+
+    measured = [uid for uid in uids if uid in distances]
+    points = rank_points(measured, numpy.array([distances[uid] for uid in measured]), step)
+    return {uid: points[uid] for uid in subset}, measured
@@ -0,0 +1,460 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import os.path
+import xml.etree.ElementTree
+
+import numpy
+import shapely.geometry
+
+from distance import *
+from osm import *
+from generated import *
+
+# Distances like the Overpass API measures them (10 000 km from the equator to the pole)
+meters_per_degree = 10000000 / 90
+
+
+class GridIndex:
+    def __init__(self, bounds, cell_size, maximum_cells=256):
+        """
+        This class is a spatial index of bounding boxes on a regular grid. Every box is registered in all cells it
+        overlaps, so a query only has to look at the cells overlapping the query box. Boxes overlapping more than
+        maximum_cells cells are kept in a list returned by every query instead, so a few large boxes do not fill
+        the index.
+
+        :param bounds: Bounding boxes (rows: min x, min y, max x, max y)
+        :type bounds: numpy.ndarray
+        :param cell_size: Width and height of a cell
+        :type cell_size: float
+        :param maximum_cells: Maximum number of cells a box is registered in
+        :type maximum_cells: int
+        :return: None
+        """
+        self.cell_size = cell_size
+        bounds = numpy.asarray(bounds, dtype=float).reshape((-1, 4))
+        low = numpy.floor(bounds[:, :2] / cell_size)
+        high = numpy.floor(bounds[:, 2:] / cell_size)
+        large = numpy.prod(high - low + 1, axis=1) > maximum_cells
+        self.large = numpy.flatnonzero(large)
+        small = numpy.flatnonzero(~large)
+        (items, x, y) = self._cells(bounds[small])
+        items = small[items]
+        keys = self._keys(x, y)
+        order = numpy.argsort(keys, kind='stable')
+        self.items = items[order]
+        (self.keys, self.starts) = numpy.unique(keys[order], return_index=True)
+        self.ends = numpy.append(self.starts[1:], len(self.items))
+
+    def _cells(self, bounds):
+        """
+        Lists the cells overlapped by boxes.
+
+        :param bounds: Bounding boxes (rows: min x, min y, max x, max y)
+        :type bounds: numpy.ndarray
+        :return: Index of the box, x and y coordinates of every overlapped cell
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        low = numpy.floor(bounds[:, :2] / self.cell_size).astype(numpy.int64)
+        high = numpy.floor(bounds[:, 2:] / self.cell_size).astype(numpy.int64)
+        heights = high[:, 1] - low[:, 1] + 1
+        counts = (high[:, 0] - low[:, 0] + 1) * heights
+        boxes = numpy.repeat(numpy.arange(len(bounds)), counts)
+        steps = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        return boxes, low[boxes, 0] + steps // heights[boxes], low[boxes, 1] + steps % heights[boxes]
+
+    @staticmethod
+    def _keys(x, y):
+        """
+        Combines cell coordinates to a single key.
+
+        :param x: Cell x coordinates
+        :type x: numpy.ndarray
+        :param y: Cell y coordinates
+        :type y: numpy.ndarray
+        :return: Keys
+        :rtype: numpy.ndarray
+        """
+        return (x + 2 ** 31) * 2 ** 32 + (y + 2 ** 31)
+
+    def pairs(self, bounds):
+        """
+        Returns the boxes registered in the cells overlapping each of several query boxes. The boxes do not
+        necessarily intersect the query boxes and a pair is returned once per common cell.
+
+        :param bounds: Query boxes (rows: min x, min y, max x, max y)
+        :type bounds: numpy.ndarray
+        :return: Indices of the query boxes and of the registered boxes
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        bounds = numpy.asarray(bounds, dtype=float).reshape((-1, 4))
+        (queries, x, y) = self._cells(bounds)
+        keys = self._keys(x, y)
+        positions = numpy.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        queries = queries[found]
+        positions = positions[found]
+        counts = self.ends[positions] - self.starts[positions]
+        steps = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        queries = numpy.repeat(queries, counts)
+        items = self.items[numpy.repeat(self.starts[positions], counts) + steps]
+        if len(self.large) > 0:
+            queries = numpy.concatenate((queries, numpy.repeat(numpy.arange(len(bounds)), len(self.large))))
+            items = numpy.concatenate((items, numpy.tile(self.large, len(bounds))))
+        return queries, items
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """
+        Returns the boxes registered in the cells overlapping a query box. The boxes do not necessarily
+        intersect the query box.
+
+        :param min_x: Minimum x coordinate of the query box
+        :type min_x: float
+        :param min_y: Minimum y coordinate of the query box
+        :type min_y: float
+        :param max_x: Maximum x coordinate of the query box
+        :type max_x: float
+        :param max_y: Maximum y coordinate of the query box
+        :type max_y: float
+        :return: Indices of the boxes, each once
+        :rtype: numpy.ndarray
+        """
+        return numpy.unique(self.pairs(numpy.array([[min_x, min_y, max_x, max_y]]))[1])
+
+
+class OSMExtract:
+    def __init__(self, file_path, cell_size=0.01):
+        """
+        This class holds the nodes and ways of a local "Open Street Map" extract (*.osm file, e.g. exported by osmium
+        or osmconvert) in spatial indexes, so the data around many locations can be queried without the
+        Overpass API. The file is read once. References of ways to nodes missing in the extract are ignored.
+
+        :param file_path: Path of the *.osm file
+        :type file_path: string
+        :param cell_size: Cell size of the spatial indexes in degrees
+        :type cell_size: float
+        :raise xml.etree.ElementTree.ParseError: if the file can not be parsed
+        :return: None
+        """
+        self.file_path = file_path
+        self.node_ids = []
+        self.node_tags = {}
+        self.way_ids = []
+        self.way_tags = []
+        node_indices = {}
+        coordinates = []
+        way_refs = []
+        way_lengths = []
+
+        for (event, element) in xml.etree.ElementTree.iterparse(file_path):
+            if element.tag == 'node':
+                node_indices[element.attrib['id']] = len(self.node_ids)
+                tags = [(tag.attrib['k'], tag.attrib['v']) for tag in element.findall('tag')]
+                if len(tags) > 0:
+                    self.node_tags[len(self.node_ids)] = tags
+                self.node_ids.append(element.attrib['id'])
+                coordinates.append((float(element.attrib['lon']), float(element.attrib['lat'])))
+                element.clear()
+            elif element.tag == 'way':
+                refs = [node_indices[nd.attrib['ref']] for nd in element.findall('nd') if nd.attrib['ref'] in node_indices]
+                if len(refs) > 0:
+                    self.way_ids.append(element.attrib['id'])
+                    self.way_tags.append([(tag.attrib['k'], tag.attrib['v']) for tag in element.findall('tag')])
+                    way_refs += refs
+                    way_lengths.append(len(refs))
+                element.clear()
+            elif element.tag == 'relation':
+                element.clear()
+
+        # Nodes (lon, lat) and the nodes of way i in way_refs[way_offsets[i]:way_offsets[i + 1]]
+        self.node_coordinates = numpy.array(coordinates, dtype=float).reshape((-1, 2))
+        self.way_refs = numpy.array(way_refs, dtype=int)
+        self.way_offsets = numpy.zeros(len(way_lengths) + 1, dtype=int)
+        self.way_offsets[1:] = numpy.cumsum(way_lengths)
+        # Overpass API results are sorted by ID
+        self.node_keys = numpy.array([int(uid) for uid in self.node_ids], dtype=numpy.int64)
+        self.way_keys = numpy.array([int(uid) for uid in self.way_ids], dtype=numpy.int64)
+
+        self.node_index = GridIndex(numpy.hstack((self.node_coordinates, self.node_coordinates)), cell_size)
+        # Ways are indexed by segment, a long way (e.g. a coastline) would cover a lot of cells with its bounding box
+        (self.segment_ways, self.segment_starts, self.segment_ends) = self.segments(numpy.arange(len(self.way_ids)))
+        self.segment_index = GridIndex(self.segment_bounds(), cell_size)
+
+    def query(self, lat, lon, radius):
+        """
+        Selects the data the Overpass API returns for the OSM script of overpass.Overpass.query_by_lat_lon_and_radius():
+        the ways with a segment closer than radius to the position, the nodes of these ways and the nodes closer than
+        radius to the position. Distances are measured in a local projection around the position, which is exact
+        enough for radii up to a few kilometers.
+
+        :param lat: Latitude of the target position
+        :type lat: float
+        :param lon: Longitude of the target position
+        :type lon: float
+        :param radius: Radius in meters
+        :type radius: float
+        :return: Indices of the nodes and indices of the ways, both sorted by ID
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        scale = numpy.array([meters_per_degree * math.cos(math.radians(lat)), meters_per_degree])
+        reach = radius / scale
+        bounds = (lon - reach[0], lat - reach[1], lon + reach[0], lat + reach[1])
+        origin = shapely.geometry.Point(0, 0)
+
+        nodes = self.node_index.query(*bounds)
+        nodes = nodes[point_distances(origin, (self.node_coordinates[nodes] - (lon, lat)) * scale) <= radius]
+
+        segments = self.segment_index.query(*bounds)
+        start_coordinates = (self.node_coordinates[self.way_refs[self.segment_starts[segments]]] - (lon, lat)) * scale
+        end_coordinates = (self.node_coordinates[self.way_refs[self.segment_ends[segments]]] - (lon, lat)) * scale
+        close = segment_distances(origin, start_coordinates, end_coordinates) <= radius
+        return self._result(nodes, numpy.unique(self.segment_ways[segments[close]]))
+
+    def segments(self, ways):
+        """
+        Returns the segments of ways. A way with a single node is a segment of length 0.
+
+        :param ways: Indices of the ways
+        :type ways: numpy.ndarray
+        :return: Position of the way in ways and positions of the start and end node in self.way_refs of every segment
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        lengths = self.way_offsets[ways + 1] - self.way_offsets[ways]
+        counts = numpy.maximum(lengths - 1, 1)
+        owners = numpy.repeat(numpy.arange(len(ways)), counts)
+        starts = self.way_offsets[ways][owners] + numpy.arange(len(owners)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        ends = numpy.where(lengths[owners] > 1, starts + 1, starts)
+        return owners, starts, ends
+
+    def segment_bounds(self):
+        """
+        Returns the bounding boxes of all segments (see self.segment_starts and self.segment_ends).
+
+        :return: Bounding boxes (rows: min lon, min lat, max lon, max lat)
+        :rtype: numpy.ndarray
+        """
+        start_coordinates = self.node_coordinates[self.way_refs[self.segment_starts]]
+        end_coordinates = self.node_coordinates[self.way_refs[self.segment_ends]]
+        return numpy.hstack((numpy.minimum(start_coordinates, end_coordinates), numpy.maximum(start_coordinates, end_coordinates)))
+
+    def _result(self, nodes, ways):
+        """
+        Adds the nodes of the ways to the nodes and sorts both by ID.
+
+        :param nodes: Indices of the nodes around the position
+        :type nodes: numpy.ndarray
+        :param ways: Indices of the ways around the position
+        :type ways: numpy.ndarray
+        :return: Indices of the nodes and indices of the ways, both sorted by ID
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        way_nodes = [self.way_refs[self.way_offsets[i]:self.way_offsets[i + 1]] for i in ways]
+        nodes = numpy.unique(numpy.concatenate([nodes] + way_nodes))
+        nodes = nodes[numpy.argsort(self.node_keys[nodes], kind='stable')]
+        ways = ways[numpy.argsort(self.way_keys[ways], kind='stable')]
+        return nodes, ways
+
+    def join(self, points, radius, block_size=256):
+        """
+        Selects the data of query() for many positions in one spatial join: the segments of all ways and all nodes
+        are indexed once on a grid fitting the radius, and the distances of all candidate pairs of a block of
+        positions are computed at once. The results are identical to query().
+
+        :param points: Positions (rows: latitude, longitude)
+        :type points: numpy.ndarray
+        :param radius: Radius in meters
+        :type radius: float
+        :param block_size: Number of positions joined at once (limits memory usage)
+        :type block_size: int
+        :return: Indices of the nodes and indices of the ways around every position, both sorted by ID
+        :rtype: [(numpy.ndarray, numpy.ndarray)]
+        """
+        points = numpy.asarray(points, dtype=float).reshape((-1, 2))
+        origin = shapely.geometry.Point(0, 0)
+        cell_size = 2 * radius / meters_per_degree
+        node_index = GridIndex(numpy.hstack((self.node_coordinates, self.node_coordinates)), cell_size)
+        segment_index = GridIndex(self.segment_bounds(), cell_size)
+        owners = self.segment_ways
+        start_coordinates = self.node_coordinates[self.way_refs[self.segment_starts]]
+        end_coordinates = self.node_coordinates[self.way_refs[self.segment_ends]]
+
+        results = []
+        for first in range(0, len(points), block_size):
+            # Positions as (lon, lat) and their scales like in query()
+            centers = points[first:first + block_size, ::-1]
+            scales = numpy.array([(meters_per_degree * math.cos(math.radians(lat)), meters_per_degree) for lat in centers[:, 1]]).reshape((-1, 2))
+            reach = radius / scales
+            bounds = numpy.hstack((centers - reach, centers + reach))
+
+            (positions, nodes) = node_index.pairs(bounds)
+            close = point_distances(origin, (self.node_coordinates[nodes] - centers[positions]) * scales[positions]) <= radius
+            (node_positions, nodes) = (positions[close], nodes[close])
+
+            (positions, segments) = segment_index.pairs(bounds)
+            distances = segment_distances(origin, (start_coordinates[segments] - centers[positions]) * scales[positions],
+                                          (end_coordinates[segments] - centers[positions]) * scales[positions])
+            close = distances <= radius
+            pairs = numpy.unique(positions[close] * len(self.way_ids) + owners[segments[close]])
+            (way_positions, ways) = (pairs // len(self.way_ids), pairs % len(self.way_ids))
+
+            node_order = numpy.argsort(node_positions, kind='stable')
+            node_splits = numpy.searchsorted(node_positions[node_order], numpy.arange(1, len(centers)))
+            way_splits = numpy.searchsorted(way_positions, numpy.arange(1, len(centers)))
+            for (location_nodes, location_ways) in zip(numpy.split(nodes[node_order], node_splits), numpy.split(ways, way_splits)):
+                results.append(self._result(location_nodes, location_ways))
+        return results
+
+    def element(self, lat, lon, radius):
+        """
+        Returns the result of query() as OSM XML.
+
+        :param lat: Latitude of the target position
+        :type lat: float
+        :param lon: Longitude of the target position
+        :type lon: float
+        :param radius: Radius in meters
+        :type radius: float
+        :return: Root element ("osm")
+        :rtype: xml.etree.ElementTree.Element
+        """
+        (nodes, ways) = self.query(lat, lon, radius)
+        root = xml.etree.ElementTree.Element('osm', {'version': '0.6', 'generator': 'SPtP extract'})
+        for i in nodes:
+            # repr() restores the parsed float exactly
+            node = xml.etree.ElementTree.SubElement(root, 'node', {'id': self.node_ids[i], 'lat': repr(float(self.node_coordinates[i, 1])), 'lon': repr(float(self.node_coordinates[i, 0]))})
+            for (key, value) in self.node_tags.get(i, []):
+                xml.etree.ElementTree.SubElement(node, 'tag', {'k': key, 'v': value})
+        for i in ways:
+            way = xml.etree.ElementTree.SubElement(root, 'way', {'id': self.way_ids[i]})
+            for ref in self.way_refs[self.way_offsets[i]:self.way_offsets[i + 1]]:
+                xml.etree.ElementTree.SubElement(way, 'nd', {'ref': self.node_ids[ref]})
+            for (key, value) in self.way_tags[i]:
+                xml.etree.ElementTree.SubElement(way, 'tag', {'k': key, 'v': value})
+        return root
+
+    def osm(self, lat, lon, radius):
+        """
+        Returns the result of query() as OSM object, like parsing the file of an Overpass API query.
+
+        :param lat: Latitude of the target position
+        :type lat: float
+        :param lon: Longitude of the target position
+        :type lon: float
+        :param radius: Radius in meters
+        :type radius: float
+        :return: OSM data
+        :rtype: osm.OSM
+        """
+        return OSM(self.element(lat, lon, radius))
+
+
+class SpatialJoin:
+    def __init__(self, osm_extract, locations, radius):
+        """
+        This class assigns the data around all locations of an extract to them in one spatial join (see
+        OSMExtract.join()) and builds every node, way and generated polygon (see generated.GeneratedFromOSMNode)
+        needed by any location exactly once, however close the locations are. The locations share these objects,
+        so they must not be modified.
+
+        :param osm_extract: Loaded extract
+        :type osm_extract: OSMExtract
+        :param locations: Locations to join
+        :type locations: dict
+        :param radius: Radius in meters (like overpass.Overpass.query_by_lat_lon_and_radius())
+        :type radius: float
+        :return: None
+        """
+        self.extract = osm_extract
+        names = list(locations.keys())
+        points = [(locations[name].point.y, locations[name].point.x) for name in names]
+        self.candidates = dict(zip(names, osm_extract.join(points, radius)))
+
+        # Features by index in the extract, built like osm.OSM() and GeneratedFromOSMNode() do
+        self.nodes = {}
+        self.ways = {}
+        self.generated = {}
+        used_nodes = numpy.unique(numpy.concatenate([numpy.zeros(0, dtype=int)] + [nodes for (nodes, ways) in self.candidates.values()]))
+        used_ways = numpy.unique(numpy.concatenate([numpy.zeros(0, dtype=int)] + [ways for (nodes, ways) in self.candidates.values()]))
+        for i in used_nodes:
+            tags = {'source': 'osm'}
+            tags.update(osm_extract.node_tags.get(i, []))
+            (lon, lat) = osm_extract.node_coordinates[i]
+            self.nodes[i] = Node(osm_extract.node_ids[i], tags, shapely.geometry.Point(float(lon), float(lat)))
+        for i in used_ways:
+            refs = osm_extract.way_refs[osm_extract.way_offsets[i]:osm_extract.way_offsets[i + 1]]
+            if len(refs) < 3:
+                self.ways[i] = None
+                continue
+            tags = {'source': 'osm'}
+            tags.update(osm_extract.way_tags[i])
+            tags['source'] = 'osm'
+            polygon = shapely.geometry.Polygon([(self.nodes[ref].point.x, self.nodes[ref].point.y) for ref in refs])
+            self.ways[i] = Way(osm_extract.way_ids[i], tags, polygon)
+        for i in used_nodes:
+            self.generated[i] = GeneratedFromOSMNode.way_from_node(self.nodes[i])
+
+    def add_to_location(self, location):
+        """
+        Adds the OSM data and the generated polygons to a location like location.Location.add_osm() and
+        location.Location.add_generated() do with the results of OSMExtract.osm() and GeneratedFromOSMNode().
+
+        :param location: One of the joined locations
+        :type location: location.Location
+        :return: None
+        """
+        (nodes, ways) = self.candidates[location.name]
+        location.add_nodes('osm_', {self.extract.node_ids[i]: self.nodes[i] for i in nodes})
+        location.add_ways('osm_', {self.extract.way_ids[i]: self.ways[i] for i in ways if self.ways[i] is not None})
+        location.add_ways('gen_', {self.generated[i].name: self.generated[i] for i in nodes if self.generated[i] is not None})
+
+
+class LocalExtract:
+    def __init__(self, output_file_path, extract):
+        """
+        This class answers queries from a local extract instead of the Overpass API (see overpass.Overpass).
+
+        :param output_file_path: Path of the file to save the results to
+        :type output_file_path: string
+        :param extract: Loaded extract
+        :type extract: OSMExtract
+        :return: None
+        """
+        self.output_file_path = output_file_path
+        self.file_size = -1
+        self.extract = extract
+
+    def query_by_lat_lon_and_radius(self, lat, lon, radius):
+        """
+        Saves the data the Overpass API would return for overpass.Overpass.query_by_lat_lon_and_radius() in a file.
+
+        :param lat: Latitude of the target position
+        :type lat: float
+        :param lon: Longitude of the target position
+        :type lon: float
+        :param radius: Radius in which should be searched
+        :type radius: int
+        :return: Information about the request in the form (filename, headers)
+        :rtype: (filename, headers)
+        """
+        temporary_file_path = self.output_file_path + '.part'
+        xml.etree.ElementTree.ElementTree(self.extract.element(lat, lon, radius)).write(temporary_file_path, 'UTF-8', True)
+        os.replace(temporary_file_path, self.output_file_path)
+        self.file_size = os.path.getsize(self.output_file_path)
+        return self.output_file_path, {}
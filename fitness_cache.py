@@ -0,0 +1,134 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+
+
+class FitnessCache:
+    def __init__(self, classifier_names, quantum=1e-6, fingerprint=''):
+        """
+        This class remembers the fitness of evaluated factors. Factors are identified by their values
+        rounded to multiples of quantum, so factors differing less than that share their fitness.
+
+        :param classifier_names: Names of the classifiers whose factors identify an individual
+        :type classifier_names: list
+        :param quantum: Precision of the factors
+        :type quantum: float
+        :param fingerprint: Identifies the settings and data the fitness values are valid for (see load_file())
+        :type fingerprint: string
+        :return: None
+        """
+        self.classifier_names = list(classifier_names)
+        self.quantum = quantum
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def key(self, factors):
+        """
+        Returns the key of factors.
+
+        :param factors: Factors
+        :type factors: factors.Factors
+        :return: Quantized factors in order of self.classifier_names
+        :rtype: tuple
+        """
+        return tuple(int(round(factors.get_factor(name) / self.quantum)) for name in self.classifier_names)
+
+    def get(self, factors):
+        """
+        Looks up the fitness of factors and counts the lookup.
+
+        :param factors: Factors
+        :type factors: factors.Factors
+        :return: Fitness, None if unknown
+        :rtype: float
+        """
+        self.lookups += 1
+        fitness = self.entries.get(self.key(factors))
+        if fitness is not None:
+            self.hits += 1
+        return fitness
+
+    def add(self, factors, fitness):
+        """
+        Stores the fitness of factors.
+
+        :param factors: Factors
+        :type factors: factors.Factors
+        :param fitness: Fitness
+        :type fitness: float
+        :return: None
+        """
+        self.entries[self.key(factors)] = fitness
+
+    def hit_rate(self):
+        """
+        Returns the share of lookups answered by the cache.
+
+        :return: Hit rate between 0 and 1
+        :rtype: float
+        """
+        return self.hits / self.lookups if self.lookups > 0 else 0.0
+
+    @staticmethod
+    def load_file(path, classifier_names, quantum, fingerprint):
+        """
+        Loads a cache saved by FitnessCache.save_file().
+
+        :param path: Path to the cache file
+        :type path: string
+        :param classifier_names: Expected classifier names
+        :type classifier_names: list
+        :param quantum: Expected precision of the factors
+        :type quantum: float
+        :param fingerprint: Expected fingerprint
+        :type fingerprint: string
+        :raise: ValueError if the file was saved with other classifiers, precision or fingerprint, OSError if it can not be read
+        :return: Cache
+        :rtype: FitnessCache
+        """
+        with open(path) as cache_file:
+            data = json.loads(cache_file.read())
+        if data['classifier_names'] != list(classifier_names) or data['quantum'] != quantum or data['fingerprint'] != fingerprint:
+            raise ValueError('Fitness cache was saved with other settings')
+        cache = FitnessCache(classifier_names, quantum, fingerprint)
+        cache.entries = {tuple(key): fitness for (key, fitness) in data['entries']}
+        return cache
+
+    def save_file(self, path):
+        """
+        Saves the cache. The file is replaced atomically.
+
+        :param path: Path to the cache file
+        :type path: string
+        :raise: OSError if the file can not be written
+        :return: None
+        """
+        data = {
+            'classifier_names': self.classifier_names,
+            'quantum': self.quantum,
+            'fingerprint': self.fingerprint,
+            'entries': [[list(key), fitness] for (key, fitness) in self.entries.items()]
+        }
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            cache_file.write(json.dumps(data, separators=(',', ':')))
+        os.replace(temporary_path, path)
@@ -93,15 +93,30 @@ class GeneratedFromOSMNode:
         self.ways = {}
 
         for node in location.nodes.values():
-            if GeneratedFromOSMNode.exclude_node(node):
-                continue
-
-            name = 'from_node_' + node.name
-            tags = node.tags
-            tags['source'] = 'gen_from_osm_node'
-            radius = GeneratedFromOSMNode.polygon_radius(node)
-            polygon = node.point.buffer(radius * polygon_radii_scale)
-            self.ways[name] = Way(name, tags, polygon)
+            way = GeneratedFromOSMNode.way_from_node(node)
+            if way is not None:
+                self.ways[way.name] = way
+
+    @staticmethod
+    def way_from_node(node):
+        """
+        Generates the polygon of a single node. The generated way shares the tags of the node,
+        whose source becomes 'gen_from_osm_node', so a node is only used once.
+
+        :param node: node to generate the polygon for
+        :type node: geometry.Node
+        :return: generated way, None if the node is excluded
+        :rtype: geometry.Way
+        """
+        if GeneratedFromOSMNode.exclude_node(node):
+            return None
+
+        name = 'from_node_' + node.name
+        tags = node.tags
+        tags['source'] = 'gen_from_osm_node'
+        radius = GeneratedFromOSMNode.polygon_radius(node)
+        polygon = node.point.buffer(radius * polygon_radii_scale)
+        return Way(name, tags, polygon)
 
     @staticmethod
     def tags_match(t1, t2):
@@ -16,6 +16,50 @@
 # You should have received a copy of the GNU General Public License
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
+import numpy
+import shapely.prepared
+import shapely.strtree
+
+# Way categories (bit mask) used by classifier.SURDescription
+category_building = 1
+category_outside = 2
+category_street = 4
+category_water = 8
+
+# OSM keys and (key, value) pairs marking a category
+category_keys = [
+    (category_building, {'building', 'shop'}),
+    (category_outside, {'natural', 'landuse'}),
+    (category_street, {'highway', 'sidewalk', 'cycleway', 'busway', 'public_transport', 'railway', 'bridge', 'tracks',
+                       'tunnel', 'route'}),
+    (category_water, {'waterway'}),
+]
+category_tags = [
+    (category_building, {('landuse', 'retail')}),
+    (category_water, {('natural', 'water'), ('natural', 'bay'), ('natural', 'spring'), ('landuse', 'reservoir'),
+                      ('landuse', 'basin'), ('landuse', 'reservoir_watershed')}),
+]
+
+
+def tag_categories(tags):
+    """
+    Computes the category bit mask of OSM tags.
+
+    :param tags: OSM tags
+    :type tags: dict
+    :return: Category bit mask (category_building | category_outside | category_street | category_water)
+    :rtype: int
+    """
+    categories = 0
+    for (category, keys) in category_keys:
+        if not keys.isdisjoint(tags.keys()):
+            categories |= category
+    for (category, key_values) in category_tags:
+        if any(tags.get(key) == value for (key, value) in key_values):
+            categories |= category
+    return categories
+
+
 class Node:
     def __init__(self, name, tags, point):
         """
@@ -64,6 +108,68 @@ class Way:
         self.name = name
         self.tags = tags
         self.polygon = polygon
+        self.categories = tag_categories(tags)
+        self._geometry_cache = {}
+
+    def _cached(self, key, compute):
+        """
+        Returns a derived geometry from the cache, computing it on first access.
+        The cache assumes that self.polygon is not replaced afterwards.
+
+        :param key: Cache key
+        :type key: string
+        :param compute: Function computing the value
+        :type compute: function
+        :return: Cached value
+        """
+        if key not in self._geometry_cache:
+            self._geometry_cache[key] = compute()
+        return self._geometry_cache[key]
+
+    def prepared(self):
+        """
+        Returns the prepared polygon for fast repeated predicates (contains, intersects, ...).
+
+        :return: Prepared polygon
+        :rtype: shapely.prepared.PreparedGeometry
+        """
+        return self._cached('prepared', lambda: shapely.prepared.prep(self.polygon))
+
+    def centroid(self):
+        """
+        Returns the centroid of the polygon.
+
+        :return: Centroid
+        :rtype: shapely.geometry.Point
+        """
+        return self._cached('centroid', lambda: self.polygon.centroid)
+
+    def bounds(self):
+        """
+        Returns the bounding box of the polygon.
+
+        :return: Bounding box
+        :rtype: (min x, min y, max x, max y)
+        """
+        return self._cached('bounds', lambda: self.polygon.bounds)
+
+    def coordinates(self):
+        """
+        Returns the exterior coordinates of the polygon as array.
+
+        :return: Exterior coordinates (n x 2)
+        :rtype: numpy.ndarray
+        """
+        return self._cached('coordinates', lambda: numpy.asarray(self.polygon.exterior.coords, dtype=float)[:, :2])
+
+    def area(self):
+        """
+        Returns the area of the polygon.
+
+        :return: Area
+        :rtype: float
+        """
+        return self._cached('area', lambda: self.polygon.area)
 
     def json_serializable(self):
         """
@@ -74,9 +180,42 @@ class Way:
         return {
             'name': self.name,
             'tags': self.tags,
-            'polygon': [[y, x] for (x, y) in list(self.polygon.exterior.coords)]
+            'polygon': self.coordinates()[:, ::-1].tolist()
         }
 
+    def __getstate__(self):
+        # Prepared geometries can not be pickled, the cache is rebuilt on demand
+        state = self.__dict__.copy()
+        state['_geometry_cache'] = {}
+        return state
+
     def __repr__(self):
         return '%s[%s]' % (self.__class__.__name__, ', '.join(['%s = %s' % (str(k), str(v)) for (k, v) in self.__dict__.items()]))
 
+
+
+class WayIndex:
+    def __init__(self, ways):
+        """
+        A class providing a bounding box index (STRtree) over ways.
+
+        :param ways: Ways to index
+        :type ways: dict {string, geometry.Way}
+        :return: None
+        """
+        self.uids = list(ways.keys())
+        self.tree = shapely.strtree.STRtree([way.polygon for way in ways.values()]) if len(ways) > 0 else None
+
+    def query(self, geometry):
+        """
+        Returns the UIDs of all ways whose bounding box intersects the bounding box of the geometry.
+        The UIDs keep the order in which the ways were indexed.
+
+        :param geometry: Geometry to query
+        :type geometry: shapely.geometry.base.BaseGeometry
+        :return: List of way UIDs
+        :rtype: list
+        """
+        if self.tree is None:
+            return []
+        return [self.uids[i] for i in sorted(self.tree.query(geometry))]
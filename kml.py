@@ -22,6 +22,19 @@ from osm import *
 from geometry import *
 
 
+def kml_polygon(coordinates):
+    """
+    Creates the polygon a KML file written by KMLBuilder contains for the given exterior coordinates,
+    i.e. with coordinates rounded to the precision written by KMLBuilder.
+
+    :param coordinates: Exterior coordinates (n x 2)
+    :type coordinates: numpy.ndarray
+    :return: Polygon
+    :rtype: shapely.geometry.Polygon
+    """
+    return shapely.geometry.Polygon([(float('%f' % p[0]), float('%f' % p[1])) for p in coordinates])
+
+
 class KML:
     def __init__(self, root):
         """
@@ -138,7 +151,7 @@ class KMLBuilder:
                 node_kml += '<ExtendedData>%s</ExtendedData>\n</Placemark>\n' % extended_data
             # KML polygon
             if isinstance(item, Way):
-                coordinates = '\n'.join('%f,%f' % (p[0], p[1]) for p in item.polygon.exterior.coords)
+                coordinates = '\n'.join('%f,%f' % (p[0], p[1]) for p in item.coordinates())
                 style_url = '#poly1'
                 extended_tags = '<altitudeMode>clampToGround</altitudeMode>\n<extrude>1</extrude>\n<tessellate>1</tessellate>'
                 extended_data = '\n'
@@ -23,6 +23,8 @@ import PIL.ExifTags
 import shapely.geometry
 import json
 
+from geometry import *
+
 
 class Location:
     def __init__(self, name, point):
@@ -39,6 +41,7 @@ class Location:
         self.point = point
         self.surs = {}
         self.ways = {}
+        self.way_index = None
         self.nodes = {}
         self.osm = None
         self.generated = None
@@ -48,7 +51,7 @@ class Location:
 
     def json_serializable(self):
         """
-        Generates a JSON serializable representation of self. self.osm, self.image,
+        Generates a JSON serializable representation of self. self.osm, self.way_index, self.image,
         self.gps_info and self.exif_tags are omitted!
 
         :return: JSON serializable representation of self
@@ -76,7 +79,7 @@ class Location:
 
     def add_ways(self, prefix, ways):
         """
-        Updates self.ways with given ways prefixing the key.
+        Updates self.ways with given ways prefixing the key and rebuilds self.way_index.
 
         :param prefix: Key prefix
         :param ways: Ways to be added
@@ -85,6 +88,21 @@ class Location:
         """
         new_ways = {prefix + k: v for (k, v) in ways.items()}
         self.ways.update(new_ways)
+        self.way_index = WayIndex(self.ways)
+
+    def query_ways(self, geometry):
+        """
+        Returns the UIDs of all ways whose bounding box intersects the bounding box of the geometry.
+        Returns all UIDs if no index was built (i. e. self.ways was set directly).
+
+        :param geometry: Geometry to query
+        :type geometry: shapely.geometry.base.BaseGeometry
+        :return: List of way UIDs
+        :rtype: list
+        """
+        if self.way_index is None or len(self.way_index.uids) != len(self.ways):
+            return list(self.ways.keys())
+        return self.way_index.query(geometry)
 
     def add_osm(self, osm):
         """
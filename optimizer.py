@@ -0,0 +1,254 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+import shapely.geos
+
+
+class ScoreTensor:
+    def __init__(self, score_table, maximum_elements=2 ** 23):
+        """
+        This class holds the unweighted points and intersection ratios of the ways of all locations with
+        truth polygons of a score table in single arrays, so many factor vectors can be evaluated at once.
+        The results equal scores.ScoreTable.evaluate_vector().
+
+        :param score_table: Score table after load_truth_polygons()
+        :type score_table: scores.ScoreTable
+        :param maximum_elements: Maximum number of weighted points computed at once (limits memory usage)
+        :type maximum_elements: int
+        :return: None
+        """
+        self.minimum_intersection_ratio = score_table.minimum_intersection_ratio
+        self.use_two_circle_intersection_ratio = score_table.use_two_circle_intersection_ratio
+        self.maximum_elements = maximum_elements
+        self.location_names = [name for name in score_table.truth_polygons.keys() if len(score_table.locations[name].uids) > 0]
+
+        # Ways of all locations side by side, location i owns the columns offsets[i] to offsets[i + 1]
+        locations = [score_table.locations[name] for name in self.location_names]
+        self.offsets = numpy.zeros(len(locations) + 1, dtype=int)
+        self.offsets[1:] = numpy.cumsum([len(location_scores.uids) for location_scores in locations])
+        self.scores = numpy.zeros((len(score_table.classifier_names), self.offsets[-1]))
+        # NaN: intersection failed (Comparator.erroneous)
+        self.ratios = numpy.full(self.offsets[-1], numpy.nan)
+        for (i, location_scores) in enumerate(locations):
+            self.scores[:, self.offsets[i]:self.offsets[i + 1]] = location_scores.scores
+            for j in range(len(location_scores.uids)):
+                try:
+                    self.ratios[self.offsets[i] + j] = score_table.intersection_ratio(self.location_names[i], j)
+                except shapely.geos.TopologicalError:
+                    pass
+
+    def winners(self, factor_matrix):
+        """
+        Returns the winners of all locations for every factor vector (see scores.LocationScores.winner()).
+
+        The totals are first computed without rounding the weighted points by a single matrix product. Rounding
+        changes a total by at most half a point per classifier, so only ways whose unrounded total is close to the
+        highest one of their location can win. Only their rounded totals are computed.
+
+        :param factor_matrix: Factor vectors (rows: individuals, columns: classifiers)
+        :type factor_matrix: numpy.ndarray
+        :return: Column of the winning way in self.scores (rows: individuals, columns: self.location_names)
+        :rtype: numpy.ndarray
+        """
+        chunk_size = max(1, self.maximum_elements // max(1, self.offsets[-1]))
+        columns = numpy.arange(self.offsets[-1])
+        lengths = numpy.diff(self.offsets)
+        winners = numpy.zeros((len(factor_matrix), len(self.location_names)), dtype=int)
+        for start in range(0, len(factor_matrix), chunk_size):
+            factors = factor_matrix[start:start + chunk_size]
+            estimates = factors @ self.scores
+            best = numpy.maximum.reduceat(estimates, self.offsets[:-1], axis=1)
+            # One additional point covers the floating point error of the estimates
+            margin = numpy.count_nonzero(factors, axis=1) + 1
+            (rows, candidates) = numpy.nonzero(estimates >= numpy.repeat(best, lengths, axis=1) - margin[:, numpy.newaxis])
+
+            # Each weighted point is rounded like processor.Processor.run(), sums of integral floats are exact
+            totals = numpy.full(estimates.shape, -numpy.inf)
+            totals[rows, candidates] = numpy.rint(factors[rows] * self.scores[:, candidates].T).sum(axis=1)
+            best = numpy.maximum.reduceat(totals, self.offsets[:-1], axis=1)
+            # First column reaching the highest total of its location
+            first = numpy.where(totals == numpy.repeat(best, lengths, axis=1), columns, self.offsets[-1])
+            winners[start:start + chunk_size] = numpy.minimum.reduceat(first, self.offsets[:-1], axis=1)
+        return winners
+
+    def evaluate_many(self, factor_matrix):
+        """
+        Returns the intersection ratios of the winners of all locations for every factor vector.
+
+        :param factor_matrix: Factor vectors (rows: individuals, columns: classifiers)
+        :type factor_matrix: numpy.ndarray
+        :return: Intersection ratios, NaN if the intersection failed (rows: individuals, columns: self.location_names)
+        :rtype: numpy.ndarray
+        """
+        return self.ratios[self.winners(factor_matrix)]
+
+    def fitness_many(self, factor_matrix):
+        """
+        Computes the fitness of every factor vector like run_learning.fitness() does on the Comparator
+        returned by scores.ScoreTable.evaluate_vector().
+
+        :param factor_matrix: Factor vectors (rows: individuals, columns: classifiers)
+        :type factor_matrix: numpy.ndarray
+        :return: Fitness of each factor vector, higher is better
+        :rtype: numpy.ndarray
+        """
+        ratios = self.evaluate_many(factor_matrix)
+        # Sum location by location, so the result is identical to the Comparator's
+        total = numpy.zeros(len(factor_matrix))
+        for i in range(len(self.location_names)):
+            total += numpy.nan_to_num(ratios[:, i])
+        average = total / len(self.location_names)
+        if self.use_two_circle_intersection_ratio:
+            passed = (ratios > self.minimum_intersection_ratio).sum(axis=1)
+            return passed / len(self.location_names) - average / 100
+        return average
+
+
+def random_factors(rng, shape, max_factor_value):
+    """
+    Draws random factors: half of them uniformly between 0 and 1, the other half uniformly
+    between 1 and max_factor_value (like the factors of the genetic algorithm in run_learning).
+
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :param shape: Shape of the result
+    :type shape: tuple
+    :param max_factor_value: Maximum factor
+    :type max_factor_value: float
+    :return: Random factors
+    :rtype: numpy.ndarray
+    """
+    low = rng.random(shape) * 2
+    high = rng.uniform(1, max_factor_value, shape)
+    return numpy.where(low < 1, low, high)
+
+
+def pareto_mask(fitness, latency):
+    """
+    Marks the individuals no other individual beats in both fitness (higher is better) and latency (lower is better).
+    Of individuals with equal fitness and latency only the first one is marked.
+
+    :param fitness: Fitness of the individuals
+    :type fitness: numpy.ndarray
+    :param latency: Latency of the individuals
+    :type latency: numpy.ndarray
+    :return: Mask of the Pareto front
+    :rtype: numpy.ndarray
+    """
+    order = numpy.lexsort((-fitness, latency))
+    best_before = numpy.maximum.accumulate(numpy.concatenate(([-numpy.inf], fitness[order][:-1])))
+    mask = numpy.zeros(len(fitness), dtype=bool)
+    mask[order[fitness[order] > best_before]] = True
+    return mask
+
+
+def genetic_search(objective, dimensions, settings, rng, report=None):
+    """
+    Genetic algorithm on a population stored as one array: in every round settings['new_population_per_turn']
+    children are created by uniform crossover of random parents and mutated, then the best
+    settings['population'] individuals of parents and children survive.
+
+    :param objective: Function returning the value to maximise for every row of a factor matrix
+    :type objective: function
+    :param dimensions: Number of factors
+    :type dimensions: int
+    :param settings: Learning settings (see run_learning.default_settings())
+    :type settings: dict
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :param report: Called after every round with the round number, the population and its objectives, None: no reports
+    :type report: function
+    :return: Best factor vector and its objective
+    :rtype: (numpy.ndarray, float)
+    """
+    population = random_factors(rng, (settings['population'], dimensions), settings['max_factor_value'])
+    values = objective(population)
+    for round in range(settings['rounds']):
+        children_count = settings['new_population_per_turn']
+        parents1 = population[rng.integers(0, len(population), children_count)]
+        parents2 = population[rng.integers(0, len(population), children_count)]
+        children = numpy.where(rng.random((children_count, dimensions)) < 0.5, parents1, parents2)
+
+        mutated = numpy.flatnonzero(rng.random(children_count) < settings['mutations_rate'])
+        genes = rng.integers(0, dimensions, len(mutated))
+        new_values = random_factors(rng, len(mutated), settings['max_factor_value'])
+        new_values[rng.random(len(mutated)) < settings['zero_factor_rate']] = 0.0
+        children[mutated, genes] = new_values
+
+        population = numpy.concatenate((population, children))
+        values = numpy.concatenate((values, objective(children)))
+        survivors = numpy.argsort(-values, kind='stable')[:settings['population']]
+        population = population[survivors]
+        values = values[survivors]
+        if report is not None:
+            report(round, population, values)
+    return population[0], float(values[0])
+
+
+def coordinate_search(objective, dimensions, settings, rng, report=None, steps=21):
+    """
+    Coordinate search: starting from the best of settings['population'] random factor vectors, every round
+    evaluates all vectors differing from the current one in a single factor set to one of "steps" values
+    between 0 and settings['max_factor_value'] at once and moves to the best of them.
+    Stops early when no move improves the objective.
+
+    :param objective: Function returning the value to maximise for every row of a factor matrix
+    :type objective: function
+    :param dimensions: Number of factors
+    :type dimensions: int
+    :param settings: Learning settings (see run_learning.default_settings())
+    :type settings: dict
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :param report: Called after every round with the round number, the current vector (as 1 x dimensions array)
+                   and its objective, None: no reports
+    :type report: function
+    :param steps: Number of values tried per factor
+    :type steps: int
+    :return: Best factor vector and its objective
+    :rtype: (numpy.ndarray, float)
+    """
+    population = random_factors(rng, (settings['population'], dimensions), settings['max_factor_value'])
+    values = objective(population)
+    best = int(numpy.argmax(values))
+    current = population[best]
+    value = float(values[best])
+
+    grid = numpy.linspace(0, settings['max_factor_value'], steps)
+    for round in range(settings['rounds']):
+        candidates = numpy.repeat(current[numpy.newaxis], dimensions * steps, axis=0)
+        candidates[numpy.arange(dimensions * steps), numpy.repeat(numpy.arange(dimensions), steps)] = numpy.tile(grid, dimensions)
+        candidate_values = objective(candidates)
+        best = int(numpy.argmax(candidate_values))
+        improved = candidate_values[best] > value
+        if improved:
+            current = candidates[best]
+            value = float(candidate_values[best])
+        if report is not None:
+            report(round, current[numpy.newaxis], numpy.array([value]))
+        if not improved:
+            break
+    return current, value
+
+
+# Optimizers selectable in run_learning (settings['optimizer']), 'ga' is the genetic algorithm of run_learning
+optimizers = {
+    'vector-ga': genetic_search,
+    'coordinate': coordinate_search
+}
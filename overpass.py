@@ -16,31 +16,392 @@
 # You should have received a copy of the GNU General Public License
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
+import email.utils
+import http.client
+import multiprocessing
+import os
+import os.path
 import urllib
+import urllib.error
 import urllib.parse
 import urllib.request
-import os.path
+import time
+
+# Overpass API interpreter used by default
+default_url = 'http://overpass-api.de/api/interpreter'
+
+# HTTP status codes of responses worth repeating the request for (rate limits and overloaded servers)
+retry_status_codes = (429, 500, 502, 503, 504)
+
+# HTTP status codes of redirects followed by OverpassConnection, the permanent ones change the URL of the connection
+redirect_status_codes = (301, 302, 303, 307, 308)
+permanent_redirect_status_codes = (301, 308)
+
+# Maximum number of redirects followed for one request
+maximum_redirects = 5
+
+
+class OverpassConnection:
+    def __init__(self, url=default_url, timeout=180):
+        """
+        This class keeps an HTTP connection to an Overpass API interpreter open between requests (keep-alive),
+        so consecutive requests save the connection setup. A connection must only be used by one thread at a time.
+        Redirects are followed, after a permanent redirect (e.g. from http to https) the requests are sent to the
+        new URL directly.
+
+        :param url: URL of the interpreter
+        :type url: string
+        :param timeout: Timeout of connecting and receiving in seconds
+        :type timeout: float
+        :return: None
+        """
+        self.timeout = timeout
+        self._connection = None
+        self._set_url(url)
+
+    def _set_url(self, url):
+        """
+        Changes the URL of the interpreter. The connection is closed if the new URL is on another server.
+
+        :param url: URL of the interpreter
+        :type url: string
+        :return: None
+        """
+        parts = urllib.parse.urlsplit(url)
+        if self._connection is not None and (parts.scheme, parts.netloc) != (self._scheme, self._host):
+            self.close()
+        self.url = url
+        self._scheme = parts.scheme
+        self._host = parts.netloc
+        self._path = parts.path if parts.path != '' else '/'
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+
+    def close(self):
+        """
+        Closes the connection. The next request opens a new one.
+
+        :return: None
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _response(self, target):
+        """
+        Sends a request and returns the response. A kept connection may have been closed by the server in the
+        meantime, so the request is repeated once on a new connection if sending it on a kept connection fails.
+
+        :param target: Path and query of the request
+        :type target: string
+        :return: Response
+        :rtype: http.client.HTTPResponse
+        """
+        while True:
+            reused = self._connection is not None
+            if not reused:
+                self._connection = self._connection_class(self._host, timeout=self.timeout)
+            try:
+                self._connection.request('GET', target)
+                return self._connection.getresponse()
+            except (http.client.HTTPException, OSError) as error:
+                self.close()
+                if not reused:
+                    raise urllib.error.URLError(error)
+
+    @staticmethod
+    def _read(response, chunk_size):
+        """
+        Reads the next part of a response.
+
+        :param response: Response to read from
+        :type response: http.client.HTTPResponse
+        :param chunk_size: Maximum number of bytes
+        :type chunk_size: int
+        :raise urllib.error.URLError: if receiving fails
+        :return: Data, empty at the end of the response
+        :rtype: bytes
+        """
+        try:
+            return response.read(chunk_size)
+        except (http.client.HTTPException, OSError) as error:
+            raise urllib.error.URLError(error)
+
+    def download(self, query, file_path, chunk_size=64 * 1024):
+        """
+        Sends a query and writes the response to a file while it is received. The data is written to a temporary
+        file which replaces file_path when complete, so a failed download never leaves a partial file behind.
+
+        :param query: Query parameters
+        :type query: dict
+        :param file_path: Path of the file to save the response to
+        :type file_path: string
+        :param chunk_size: Number of bytes written at once
+        :type chunk_size: int
+        :return: Headers of the response
+        :rtype: http.client.HTTPMessage
+        """
+        return self._download(self._path + '?' + urllib.parse.urlencode(query), file_path, chunk_size, 0)
+
+    def _download(self, target, file_path, chunk_size, redirects):
+        """
+        Implements download() for a request target, following redirects.
+
+        :param target: Path and query of the request
+        :type target: string
+        :param file_path: Path of the file to save the response to
+        :type file_path: string
+        :param chunk_size: Number of bytes written at once
+        :type chunk_size: int
+        :param redirects: Number of redirects followed so far
+        :type redirects: int
+        :return: Headers of the response
+        :rtype: http.client.HTTPMessage
+        """
+        response = self._response(target)
+        if response.status != 200:
+            # Read the body so the connection can be used again
+            try:
+                while len(self._read(response, 64 * 1024)) > 0:
+                    pass
+            except urllib.error.URLError:
+                self.close()
+            if response.will_close:
+                self.close()
+            location = response.getheader('Location')
+            if response.status not in redirect_status_codes or location is None or redirects >= maximum_redirects:
+                raise urllib.error.HTTPError(self.url, response.status, response.reason, response.msg, None)
+
+            # The location usually contains the query, too
+            parts = urllib.parse.urlsplit(urllib.parse.urljoin('%s://%s%s' % (self._scheme, self._host, target), location))
+            url = urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+            target = urllib.parse.urlunsplit(('', '', parts.path if parts.path != '' else '/', parts.query, ''))
+            if response.status in permanent_redirect_status_codes:
+                self._set_url(url)
+            elif (parts.scheme, parts.netloc) != (self._scheme, self._host):
+                connection = OverpassConnection(url, self.timeout)
+                try:
+                    return connection._download(target, file_path, chunk_size, redirects + 1)
+                finally:
+                    connection.close()
+            return self._download(target, file_path, chunk_size, redirects + 1)
+
+        temporary_file_path = file_path + '.part'
+        try:
+            with open(temporary_file_path, 'wb') as file:
+                chunk = self._read(response, chunk_size)
+                while len(chunk) > 0:
+                    file.write(chunk)
+                    chunk = self._read(response, chunk_size)
+        except OSError:
+            self.close()
+            if os.path.isfile(temporary_file_path):
+                os.remove(temporary_file_path)
+            raise
+        if response.will_close:
+            self.close()
+        os.replace(temporary_file_path, file_path)
+        return response.msg
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        """
+        This class limits the rate of requests. Every request takes a token, tokens are added at a constant rate
+        up to the capacity. The bucket lives in shared memory, so all processes it is passed to when they are
+        created (e.g. by the initializer of a multiprocessing.Pool) and all their threads share the limit.
+
+        :param rate: Tokens added per second
+        :type rate: float
+        :param capacity: Maximum number of tokens, i.e. requests sent at once after a pause
+        :type capacity: float
+        :return: None
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = multiprocessing.Lock()
+        # Tokens and time.monotonic() of the last update
+        self._state = multiprocessing.RawArray('d', [capacity, time.monotonic()])
+
+    def _update(self, now):
+        """
+        Adds the tokens since the last update, must be called with the lock held.
+
+        :param now: time.monotonic()
+        :type now: float
+        :return: Current number of tokens
+        :rtype: float
+        """
+        tokens = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate)
+        self._state[0] = tokens
+        self._state[1] = now
+        return tokens
+
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available.
+
+        :return: None
+        """
+        while True:
+            with self._lock:
+                tokens = self._update(time.monotonic())
+                if tokens >= 1:
+                    self._state[0] = tokens - 1
+                    return
+            time.sleep((1 - tokens) / self.rate)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for the given time, e.g. when a server asks to retry later.
+
+        :param seconds: Time without tokens
+        :type seconds: float
+        :return: None
+        """
+        with self._lock:
+            tokens = self._update(time.monotonic())
+            self._state[0] = min(tokens, -seconds * self.rate)
+
+
+def retry_after(headers):
+    """
+    Returns the time a server asks to wait before repeating a request ("Retry-After" header).
+
+    :param headers: Headers of the response
+    :type headers: http.client.HTTPMessage
+    :return: Time in seconds, None if the header is missing or invalid
+    :rtype: float
+    """
+    value = headers.get('Retry-After') if headers is not None else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class OverpassClient:
+    def __init__(self, urls=(default_url,), retries=5, backoff=1.0, maximum_backoff=60.0, rate_limiter=None, first=0, timeout=180):
+        """
+        This class sends requests to a list of Overpass API interpreters in turn, keeping a connection to each of them
+        (see OverpassConnection). Failed requests are repeated on the next interpreter after waiting: as long as the
+        server asks to ("Retry-After"), otherwise backoff seconds, doubled after every failed attempt, but never longer
+        than maximum_backoff seconds.
+        A client must only be used by one thread at a time.
+
+        :param urls: URLs of the interpreters
+        :type urls: list
+        :param retries: Number of times a failed request is repeated
+        :type retries: int
+        :param backoff: Time to wait before the first repetition in seconds
+        :type backoff: float
+        :param maximum_backoff: Maximum time to wait before a repetition in seconds
+        :type maximum_backoff: float
+        :param rate_limiter: Limit of the request rate shared with other clients, None: no limit
+        :type rate_limiter: TokenBucket
+        :param first: Index of the URL to send the first request to, so several clients start with different interpreters
+        :type first: int
+        :param timeout: Timeout of connecting and receiving in seconds
+        :type timeout: float
+        :return: None
+        """
+        self.connections = [OverpassConnection(url, timeout) for url in urls]
+        self.retries = retries
+        self.backoff = backoff
+        self.maximum_backoff = maximum_backoff
+        self.rate_limiter = rate_limiter
+        self._next = first % len(self.connections)
+
+    def close(self):
+        """
+        Closes the connections to all interpreters.
+
+        :return: None
+        """
+        for connection in self.connections:
+            connection.close()
+
+    def download(self, query, file_path, chunk_size=64 * 1024):
+        """
+        Sends a query and writes the response to a file (see OverpassConnection.download()),
+        repeating the request on errors.
+
+        :param query: Query parameters
+        :type query: dict
+        :param file_path: Path of the file to save the response to
+        :type file_path: string
+        :param chunk_size: Number of bytes written at once
+        :type chunk_size: int
+        :raise urllib.error.URLError: if the last repetition failed, too
+        :return: Headers of the response
+        :rtype: http.client.HTTPMessage
+        """
+        attempt = 0
+        while True:
+            connection = self.connections[self._next]
+            self._next = (self._next + 1) % len(self.connections)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                return connection.download(query, file_path, chunk_size)
+            except urllib.error.HTTPError as error:
+                if error.code not in retry_status_codes or attempt >= self.retries:
+                    raise
+                delay = retry_after(error.headers)
+                if delay is not None:
+                    delay = min(self.maximum_backoff, delay)
+            except urllib.error.URLError:
+                if attempt >= self.retries:
+                    raise
+                delay = None
+
+            if delay is not None and self.rate_limiter is not None:
+                # The server is busy for all clients
+                self.rate_limiter.pause(delay)
+            else:
+                time.sleep(delay if delay is not None else min(self.maximum_backoff, self.backoff * 2 ** attempt))
+            attempt += 1
 
 
 class Overpass:
-    def __init__(self, output_file_path):
+    def __init__(self, output_file_path, connection=None):
+        """
+        This class queries the "Open Street Map Overpass API" and saves the results in a file.
+
+        :param output_file_path: Path of the file to save the results to
+        :type output_file_path: string
+        :param connection: Connection or client to use, None: a new connection to default_url for every request
+        :type connection: OverpassConnection or OverpassClient
+        :return: None
+        """
         self.output_file_path = output_file_path
         self.file_size = -1
+        self.connection = connection
 
     def query_by_osm_script(self, osm_script):
         """
         This function passes an OSM script to the "Open Street Map Overpass API"
-        (http://overpass-api.de/api/interpreter). It saves the result in a file.
+        (http://overpass-api.de/api/interpreter or the URL of the connection). It saves the result in a file.
 
         :param osm_script: Correct OSM script which should be used for the request
         :type osm_script: string
         :return: Information about the request in the form (filename, headers)
         :rtype: (string, dict)
         """
-        query = {'data': osm_script}
-        relative_file_path, headers = urllib.request.urlretrieve('http://overpass-api.de/api/interpreter?' + urllib.parse.urlencode(query), self.output_file_path)
-        self.file_size = os.path.getsize(relative_file_path)
-        return relative_file_path, headers
+        connection = self.connection if self.connection is not None else OverpassConnection()
+        try:
+            headers = connection.download({'data': osm_script}, self.output_file_path)
+        finally:
+            if self.connection is None:
+                connection.close()
+        self.file_size = os.path.getsize(self.output_file_path)
+        return self.output_file_path, headers
 
     def query_by_lat_lon_and_radius(self, lat, lon, radius):
         """
@@ -0,0 +1,183 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import concurrent.futures
+import functools
+import queue
+import threading
+
+
+class LockedFile:
+    def __init__(self, file):
+        """
+        This class wraps a file so several threads can write to it. Each write() is written as a whole.
+
+        :param file: File to write to
+        :type file: file
+        :return: None
+        """
+        self.file = file
+        self.name = file.name
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        """
+        Writes text to the file.
+
+        :param text: Text to write
+        :type text: string
+        :return: Number of characters written
+        :rtype: int
+        """
+        with self._lock:
+            return self.file.write(text)
+
+
+class _Failure:
+    def __init__(self, error):
+        """
+        Carries an exception raised by a stage to the consumer of stream().
+
+        :param error: Raised exception
+        :type error: BaseException
+        :return: None
+        """
+        self.error = error
+
+
+# Marks the end of the items
+_end = object()
+
+
+def _put(target, item, stop):
+    """
+    Puts an item into a bounded queue, waiting while it is full.
+
+    :return: False if the pipeline was stopped before the item could be put
+    :rtype: bool
+    """
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source, stop):
+    """
+    Takes an item from a queue, waiting while it is empty.
+
+    :return: Item, _end if the pipeline was stopped
+    """
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _end
+
+
+def _run_stage(function, source, target, stop, threads=1):
+    """
+    Applies function to every item of source and puts the results into target. Items for which function
+    returns None are dropped. Exceptions are passed on to the consumer, which ends the stage.
+
+    :param function: Function of the stage
+    :type function: function
+    :param source: Iterator (first stage) or queue of the previous stage
+    :param target: Queue of the next stage
+    :type target: queue.Queue
+    :param stop: Set when the consumer is gone
+    :type stop: threading.Event
+    :param threads: Number of items function is applied to at the same time
+    :type threads: int
+    :return: None
+    """
+    if threads > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(threads)
+        submit = lambda item: executor.submit(function, item).result
+    else:
+        executor = None
+        submit = lambda item: functools.partial(function, item)
+    pending = collections.deque()
+    try:
+        while True:
+            item = _get(source, stop) if isinstance(source, queue.Queue) else next(source, _end)
+            finished = item is _end or isinstance(item, _Failure)
+            if not finished:
+                pending.append(submit(item))
+            # Results are passed on in order, at most "threads" items are in the stage at once
+            while len(pending) >= threads or (finished and len(pending) > 0):
+                try:
+                    result = pending.popleft()()
+                except BaseException as error:
+                    _put(target, _Failure(error), stop)
+                    return
+                if result is not None and not _put(target, result, stop):
+                    return
+            if finished:
+                _put(target, item, stop)
+                return
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def stream(items, stages, queue_size=2):
+    """
+    Passes items through stages running in threads of their own, so one item can be in every stage at the same
+    time. A stage given as (function, threads) processes up to "threads" items at the same time in a thread pool,
+    e.g. for I/O bound work. The stages are connected by queues holding at most queue_size items, so only a bounded
+    number of items exists at once. Items are yielded in order. An exception raised by a stage is raised by the
+    generator, with the items before it yielded first.
+
+    :param items: Items to process
+    :type items: iterable
+    :param stages: Functions taking an item and returning the item for the next stage, or None to drop it,
+                   or tuples (function, threads)
+    :type stages: list
+    :param queue_size: Maximum number of items waiting between two stages
+    :type queue_size: int
+    :return: Items after the last stage
+    :rtype: generator
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(queue_size) for _ in stages]
+    threads = []
+    source = iter(items)
+    for (stage, target) in zip(stages, queues):
+        (function, stage_threads) = stage if isinstance(stage, tuple) else (stage, 1)
+        threads.append(threading.Thread(target=_run_stage, args=(function, source, target, stop, stage_threads), daemon=True))
+        source = target
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _end:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
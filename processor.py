@@ -17,7 +17,9 @@
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
 import json
-import operator
+import time
+
+import numpy
 
 from classifier import *
 
@@ -39,42 +41,89 @@ class Processor:
         self.factors = factors
         self.output_folder_path = output_folder_path
         self.csv_separator = ';'
-        self.points = {}
+        self.uids = []
+        self.classifier_names = []
+        self.scores = None
+        self.weighted_scores = None
+        self.totals = None
+        self.statistics = {}
         self.transposed_output = True
         self.factors = factors
         self.exclude_slow_classifiers = exclude_slow_classifiers
         self.save_csv_files = False
         self.save_json_files = True
+        self.sur_osm_rules = None
+        self.thread_pool = None  # concurrent.futures.Executor for concurrent classifiers, None: sequential
+        self.skip_zero_weight_classifiers = True
+        self.prune_ways = False
+        self.pruned_uids = []
 
     def run(self):
         """
         Applies all classifiers and saves the results in the output folder.
+        The unweighted points are stored in self.scores, the weighted points in self.weighted_scores
+        (rows: self.classifier_names, columns: self.uids). Wall time, number of scored ways and number
+        of geometry operations of each classifier are stored in self.statistics.
+
+        Classifiers run in the order of their cost. Classifiers lacking their inputs (see Classifier.requires)
+        and, if self.skip_zero_weight_classifiers is set, classifiers with a factor of 0 are skipped.
+        Their points are 0 in self.scores.
+
+        If self.prune_ways is set, classifiers run one after another and stop rating ways which can no longer get
+        the highest total (see Processor.classify_pruned()). The winner is identical to the exhaustive run,
+        the totals of the pruned ways (self.pruned_uids) are lower bounds.
 
         :return: Result of classification
         :rtype: [(polygon UID, highest total), ..., (polygon UID, lowest total)]
         """
-        # Instantiate and apply classifiers
-        classifiers = get_classifiers_list(location=self.location, exclude_slow_classifiers=self.exclude_slow_classifiers)
-        for classifier in classifiers:
-            points = classifier.classify()
-            points = {k: round(self.factors.get_factor(classifier.name()) * v) for k, v in points.items()}
-            self.points[classifier.name()] = points
+        # Select classifiers, skipped classifiers keep 0 points
+        classifier_classes = registered_classifiers(self.exclude_slow_classifiers)
+        self.uids = sorted(self.location.ways)
+        self.classifier_names = [classifier_name(c) for c in classifier_classes]
+        self.scores = numpy.zeros((len(classifier_classes), len(self.uids)), dtype=int)
+        self.statistics = {}
+        classifiers = {}
+        for (i, classifier_class) in enumerate(classifier_classes):
+            reason = skip_reason(classifier_class, self.location, self.factors if self.skip_zero_weight_classifiers else None)
+            if reason is None:
+                classifiers[i] = create_classifier(classifier_class, self.location, self.sur_osm_rules)
+            else:
+                self.statistics[self.classifier_names[i]] = {'time_ms': 0.0, 'ways': 0, 'geometry_operations': 0, 'skipped': reason}
+        # Cheap classifiers first
+        order = sorted(classifiers.keys(), key=lambda i: classifiers[i].cost)
+        factor_vector = numpy.array([self.factors.get_factor(name) for name in self.classifier_names], dtype=float)
+
+        # Apply classifiers
+        self.pruned_uids = []
+        if self.prune_ways:
+            results = self.classify_pruned(classifiers, order, factor_vector)
+        elif self.thread_pool is None:
+            results = {i: classify(classifiers[i]) for i in order}
+        else:
+            # Thread safe classifiers run on the pool, the others one after another in this thread.
+            # Results are merged in classifier order, so the outcome does not depend on scheduling.
+            futures = {i: self.thread_pool.submit(classify, classifiers[i]) for i in order if classifiers[i].thread_safe}
+            results = {i: classify(classifiers[i]) for i in order if not classifiers[i].thread_safe}
+            results.update({i: future.result() for (i, future) in futures.items()})
+
+        for i in sorted(results.keys()):
+            (points, statistics) = results[i]
+            self.scores[i] = [points[uid] for uid in self.uids]
+            self.statistics[self.classifier_names[i]] = statistics
+        self.statistics = {name: self.statistics[name] for name in self.classifier_names}
+
+        # Weight points, each weighted point is rounded (half to even like round())
+        self.weighted_scores = numpy.rint(self.scores * factor_vector[:, numpy.newaxis]).astype(int)
+        self.totals = self.weighted_scores.sum(axis=0)
 
         # Store results
-        ways = sorted(self.location.ways)
-        lines = []
-        all_points = []
-        lines += [[''] + ways]
-        for (classifier_name, classifier_points) in self.points.items():
-            classifier_uids_sorted = sorted(classifier_points)
-            points = [classifier_points[u] for u in classifier_uids_sorted]
-            all_points += [points]
-            lines += [[classifier_name] + [str(p) for p in points]]
-        totals = [sum(p) for p in zip(*all_points)]
-        lines += [['Total'] + [str(t) for t in totals]]
+        lines = [[''] + self.uids]
+        for (name, points) in zip(self.classifier_names, self.weighted_scores):
+            lines += [[name] + [str(p) for p in points]]
+        lines += [['Total'] + [str(t) for t in self.totals]]
 
         if self.transposed_output:
-            lines = [[row[i] for row in lines] for i in range(len(ways) + 1)]
+            lines = [list(line) for line in zip(*lines)]
 
         if self.save_csv_files:
             csv_file_path = self.output_folder_path + self.location.name + '.points.csv'
@@ -85,6 +134,108 @@ class Processor:
         if self.save_json_files:
             json_file_path = self.output_folder_path + self.location.name + '.json'
             with open(json_file_path, 'w') as json_file:
-                json_file.write(json.dumps(self.location.json_serializable(), separators=(',', ':')))
+                location_json = self.location.json_serializable()
+                location_json['statistics'] = self.statistics
+                json_file.write(json.dumps(location_json, separators=(',', ':')))
+
+        # Highest total first, equal totals keep the order of self.uids
+        order = numpy.argsort(-self.totals, kind='stable')
+        return [(self.uids[i], int(self.totals[i])) for i in order]
+
+    def classify_pruned(self, classifiers, order, factor_vector):
+        """
+        Applies the classifiers in the given order. After each classifier the lowest and highest possible total of
+        every way is bounded using the score ranges (Classifier.score_range) of the remaining classifiers.
+        Ways whose highest possible total is lower than the highest lowest possible total of another way can not win
+        and are not rated by the remaining classifiers. Instead, they get the points leading to the lowest
+        weighted points. The remaining ways are rated exactly.
+
+        :param classifiers: Classifiers to apply, keys are rows of self.scores
+        :type classifiers: dict
+        :param order: Keys of classifiers in order of application
+        :type order: list
+        :param factor_vector: Factors of all rows of self.scores
+        :type factor_vector: numpy.ndarray
+        :return: Points (for all ways) and statistics for every classifier, keys like classifiers
+        :rtype: dict
+        """
+        # Range of weighted points of each classifier, the lowest weighted points result from lowest_points
+        bounds = {}
+        lowest_points = {}
+        for i in order:
+            (low, high) = classifiers[i].score_range
+            if factor_vector[i] < 0:
+                (low, high) = (high, low)
+            lowest_points[i] = low
+            bounds[i] = (int(numpy.rint(factor_vector[i] * low)), int(numpy.rint(factor_vector[i] * high)))
+        remaining_low = sum(low for (low, high) in bounds.values())
+        remaining_high = sum(high for (low, high) in bounds.values())
+
+        alive = numpy.ones(len(self.uids), dtype=bool)
+        known = numpy.zeros(len(self.uids), dtype=int)
+        results = {}
+        for i in order:
+            alive_uids = [self.uids[j] for j in numpy.flatnonzero(alive)]
+            (points, statistics) = classify(classifiers[i], None if alive.all() else alive_uids)
+            row = numpy.array([points.get(uid, lowest_points[i]) for uid in self.uids], dtype=int)
+            results[i] = (dict(zip(self.uids, row.tolist())), statistics)
+
+            known += numpy.rint(row * factor_vector[i]).astype(int)
+            remaining_low -= bounds[i][0]
+            remaining_high -= bounds[i][1]
+            if alive.any():
+                best_low = (known[alive] + remaining_low).max()
+                alive &= known + remaining_high >= best_low
+
+        self.pruned_uids = [self.uids[j] for j in numpy.flatnonzero(~alive)]
+        return results
+
+
+def classify(classifier, uids=None):
+    """
+    Applies a classifier and measures it.
+
+    :param classifier: Classifier to apply
+    :type classifier: classifier.Classifier
+    :param uids: Rate only these ways (see Classifier.classify_ways()), None: rate all ways
+    :type uids: list
+    :return: Points as returned by classifier.classify() and statistics (see Processor.statistics)
+    :rtype: (dict, dict)
+    """
+    start_time = time.perf_counter()
+    points = classifier.classify() if uids is None else classifier.classify_ways(uids)
+    end_time = time.perf_counter()
+    statistics = {
+        'time_ms': (end_time - start_time) * 1000,
+        'ways': len(points),
+        'geometry_operations': classifier.geometry_operations
+    }
+    return points, statistics
+
+
+def aggregate_statistics(statistics_list):
+    """
+    Aggregates the classifier statistics (Processor.statistics) of several locations.
 
-        return sorted(zip(ways, totals), key=operator.itemgetter(1), reverse=True)
+    :param statistics_list: List of Processor.statistics
+    :type statistics_list: list
+    :return: Dictionary with classifier names as keys and dicts with the keys 'locations', 'sum_ms', 'mean_ms',
+             'p95_ms', 'ways', 'geometry_operations' and 'skipped' (number of locations) as values
+    :rtype: dict
+    """
+    times = {}
+    aggregated = {}
+    for statistics in statistics_list:
+        for (name, values) in statistics.items():
+            times.setdefault(name, []).append(values['time_ms'])
+            entry = aggregated.setdefault(name, {'ways': 0, 'geometry_operations': 0, 'skipped': 0})
+            entry['ways'] += values['ways']
+            entry['geometry_operations'] += values['geometry_operations']
+            if 'skipped' in values:
+                entry['skipped'] += 1
+    for (name, entry) in aggregated.items():
+        entry['locations'] = len(times[name])
+        entry['sum_ms'] = float(numpy.sum(times[name]))
+        entry['mean_ms'] = float(numpy.mean(times[name]))
+        entry['p95_ms'] = float(numpy.percentile(times[name], 95))
+    return aggregated
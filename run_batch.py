@@ -42,6 +42,8 @@ def main(argv):
                         help='Path to the text file containing the SURs. (Default: ./input/surs.txt)')
     parser.add_argument('-f', '--factors-file-path', dest='factors_file_path', default='./data/factors.txt',
                         help='Path to the text file containing the SURs. (Default: ./data/factors.txt).')
+    parser.add_argument('--sur-osm-mapping-file-path', dest='sur_osm_mapping_file_path',
+                        help='Path to a text file containing SUR-OSM mapping rules. (Default: built-in rules)')
     parser.add_argument('-c', '--cache-folder-path', dest='cache_folder_path',
                         help='Path to the folder containing cache data (i. e. data from OpenStreetMap)')
     parser.add_argument('-u', '--force-cache-update', dest='force_cache_update', help='Force cache update.',
@@ -52,7 +54,37 @@ def main(argv):
     parser.add_argument('-q', '--quiet-mode', dest='quiet_mode', help='Do not write to stdout.', action='store_true')
     parser.add_argument('--exclude-slow-classifiers', dest='exclude_slow_classifiers',
                         help='Exclude classifiers with suboptimal running times.', action='store_true')
+    parser.add_argument('--prune-ways', dest='prune_ways',
+                        help='Stop rating ways which can no longer win. Totals in debug output are then lower bounds for pruned ways.',
+                        action='store_true')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Number of worker processes. (Default: number of CPUs)')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                        help='Number of locations a worker process takes from the work queue at once. (Default: about four chunks per process)')
+    parser.add_argument('--largest-first', dest='largest_first',
+                        help='Process the locations with the largest OSM cache files first, so they do not delay the end of processing.',
+                        action='store_true')
+    parser.add_argument('--score-store', dest='score_store_folder_path',
+                        help='Path to the folder the unweighted classifier points of all locations are saved to (used by --rescore).')
+    parser.add_argument('--rescore', dest='rescore_factors_file_paths', nargs='+', metavar='FACTORS',
+                        help='Determine the winners for the given factors files from the points in the score store (requires --score-store) instead of processing the locations. With several files, the results of each file are written to a subfolder of the output folder.')
     parser.add_argument('--overpass-radius', dest='overpass_radius', help='Overpass API query radius.', type=int)
+    parser.add_argument('--fetch-concurrency', dest='fetch_concurrency', type=int,
+                        help='Number of Overpass API requests all worker processes together send at the same time. (Default: 4)')
+    parser.add_argument('--overpass-url', dest='overpass_urls', action='append', metavar='URL',
+                        help='URL of an Overpass API interpreter. Can be given several times to distribute the requests over several interpreters. (Default: %s)' % batch.default_url)
+    parser.add_argument('--overpass-retries', dest='overpass_retries', type=int,
+                        help='Number of times a failed Overpass API request is repeated. (Default: 5)')
+    parser.add_argument('--overpass-rate', dest='overpass_rate', type=float,
+                        help='Maximum number of Overpass API requests per second of all worker processes together. (Default: no limit)')
+    parser.add_argument('--osm-extract', dest='osm_extract_file_path',
+                        help='Path to a local *.osm extract to use instead of the Overpass API. The data around the locations is passed on in memory.')
+    parser.add_argument('--osm-extract-to-cache', dest='osm_extract_to_cache',
+                        help='Write the data around the locations from the OSM extract to the cache folder like the Overpass API results.',
+                        action='store_true')
+    parser.add_argument('--spatial-join', dest='spatial_join',
+                        help='Assign the data from the OSM extract to all locations in one spatial join, so data shared by close locations is only processed once.',
+                        action='store_true')
     parser.add_argument('--compare-results', dest='compare_results',
                         help='Compare computed polygons to polygons in *.truth.kml files.', action='store_true')
     parser.add_argument('--log-prefix', dest='log_file_prefix', default='icup_',
@@ -72,21 +104,75 @@ def main(argv):
         settings['output_folder_path'] = args.output_folder_path + os.path.sep
     if args.cache_folder_path:
         settings['cache_folder_path'] = args.cache_folder_path + os.path.sep
-    if args.overpass_radius:
+    if args.overpass_radius is not None:
+        if args.overpass_radius <= 0:
+            print('overpass radius must be larger than 0')
+            return 1
         settings['overpass_radius'] = args.overpass_radius
     settings['surs_file_path'] = args.surs_file_path
     settings['factors_file_path'] = args.factors_file_path
+    settings['sur_osm_mapping_file_path'] = args.sur_osm_mapping_file_path
     settings['force_cache_update'] = args.force_cache_update
     settings['skip_cache_update'] = args.skip_cache_update
     settings['quiet_mode'] = args.quiet_mode
     settings['exclude_slow_classifiers'] = args.exclude_slow_classifiers
+    settings['prune_ways'] = args.prune_ways
     settings['compare_results'] = args.compare_results
     settings['log_file_prefix'] = args.log_file_prefix
     settings['debug_output'] = args.debug_output
     settings['use_two_circle_intersection_ratio'] = args.use_two_circle_intersection_ratio
+    if args.jobs is not None:
+        if args.jobs < 1:
+            print('jobs must be larger or equal to 1')
+            return 1
+        settings['jobs'] = args.jobs
+    if args.chunk_size is not None:
+        if args.chunk_size < 1:
+            print('chunk size must be larger or equal to 1')
+            return 1
+        settings['chunk_size'] = args.chunk_size
+    settings['largest_first'] = args.largest_first
+    if args.fetch_concurrency is not None:
+        if args.fetch_concurrency < 1:
+            print('fetch concurrency must be larger or equal to 1')
+            return 1
+        settings['fetch_concurrency'] = args.fetch_concurrency
+    if args.overpass_urls:
+        settings['overpass_urls'] = args.overpass_urls
+    if args.overpass_retries is not None:
+        if args.overpass_retries < 0:
+            print('overpass retries must be larger or equal to 0')
+            return 1
+        settings['overpass_retries'] = args.overpass_retries
+    if args.overpass_rate is not None:
+        if args.overpass_rate <= 0:
+            print('overpass rate must be larger than 0')
+            return 1
+        settings['overpass_rate'] = args.overpass_rate
+    if args.osm_extract_file_path:
+        settings['osm_extract_file_path'] = args.osm_extract_file_path
+    elif args.osm_extract_to_cache:
+        print('--osm-extract-to-cache requires --osm-extract')
+        return 1
+    settings['osm_extract_to_cache'] = args.osm_extract_to_cache
+    if args.spatial_join and not args.osm_extract_file_path:
+        print('--spatial-join requires --osm-extract')
+        return 1
+    if args.spatial_join and args.osm_extract_to_cache:
+        print('--spatial-join can not be combined with --osm-extract-to-cache')
+        return 1
+    settings['spatial_join'] = args.spatial_join
+    if args.score_store_folder_path:
+        settings['score_store_folder_path'] = args.score_store_folder_path + os.path.sep
+    if args.rescore_factors_file_paths and not args.score_store_folder_path:
+        print('--rescore requires --score-store')
+        return 1
 
     # Run batch processing
-    exit_code = batch.main(settings)
+    if args.rescore_factors_file_paths:
+        exit_code = batch.rescore(settings, args.rescore_factors_file_paths)
+    else:
+        exit_code = batch.main(settings)
     if not args.quiet_mode:
         if exit_code == 0:
             print('Batch processing finished successfully.')
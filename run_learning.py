@@ -17,18 +17,30 @@
 # You should have received a copy of the GNU General Public License
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
+import math
 import random
+import pickle
+import hashlib
+import multiprocessing
 import shutil
 import argparse
 
+import numpy
+
 import batch
 from comparator import *
 from classifier import *
 from factors import *
+from scores import *
+from fitness_cache import *
+from optimizer import *
 
 
 classifiers_list = get_classifiers_list(None)
 
+# Version of the checkpoint format, increased when the saved state or the settings change
+checkpoint_version = 2
+
 def default_settings():
     """
     Returns a dict containing the default settings for learning.
@@ -54,16 +66,249 @@ def default_settings():
         'temp_folder_path': './learning/tmp/',
         'use_two_circle_intersection_ratio': False,
         'minimum_intersection_ratio': 0.7,
+        'use_score_cache': False,  # True: process locations once and evaluate factors on the cached points
+        'truth_table_file_path': './learning/truth_table.json',  # Used with the score cache, None: do not save
+        'jobs': 1,  # Processes evaluating individuals concurrently, requires the score cache
+        'fitness_cache_file_path': None,  # None: keep the fitness cache in memory only
+        'fitness_cache_quantum': 1e-6,  # Factors differing less than this share their fitness
+        'racing_subset_sizes': [],  # Numbers of locations of the racing stages, requires the score cache, []: no racing
+        'racing_promotion_ratio': 0.5,  # Share of the children promoted to the next racing stage
+        'checkpoint_file_path': './learning/checkpoint.pickle',  # Saved after every round, None: no checkpoints
+        'resume': False,  # True: continue from the checkpoint using its settings
+        'latency_penalty': 0.0,  # Fitness subtracted per millisecond of classification time per location, requires the score cache
+        'zero_factor_rate': 0.0,  # Probability of a mutation setting a factor to 0, so the classifier is skipped
+        'optimizer': 'ga',  # 'ga' or one of optimizer.optimizers (require the score cache, no checkpoints)
+        'pareto_folder_path': None,  # Folder the factors of the accuracy versus latency Pareto front are written to, None: do not write
     }
 
-def main(settings):
+
+def fitness(comparator, settings):
     """
-    Runs the learning process.
+    Computes the fitness of the results of an individual.
 
-    :param settings: Settings dict like default_learning_settings. Defaults to default_learning_settings
+    :param comparator: Comparator after run() or scores.ScoreTable.evaluate()
+    :type comparator: comparator.Comparator
+    :param settings: Learning settings
     :type settings: dict
-    :return: 0 if success, 1 otherwise
-    :rtype: int
+    :return: Fitness, higher is better
+    :rtype: float
+    """
+    if settings['use_two_circle_intersection_ratio']:
+        passed = len(comparator.passed)
+        return (passed / (passed + len(comparator.failed) + len(comparator.erroneous))) - (comparator.average_intersection_ratio/100)
+    else:
+        return comparator.average_intersection_ratio
+
+def data_fingerprint(settings):
+    """
+    Creates a fingerprint of the settings and learning data the fitness values depend on.
+    Changes of the OSM data are not detected.
+
+    :param settings: Learning settings
+    :type settings: dict
+    :raise: OSError if a file can not be read
+    :return: Fingerprint
+    :rtype: string
+    """
+    digest = hashlib.sha1()
+    for key in ('overpass_radius', 'minimum_intersection_ratio', 'use_two_circle_intersection_ratio'):
+        digest.update(('%s=%s\n' % (key, str(settings[key]))).encode('utf-8'))
+    file_paths = [settings['surs_file_path']]
+    file_paths += [settings['db_folder_path'] + file_name for file_name in sorted(kml_files(settings['db_folder_path'], '.truth.kml').values())]
+    for file_path in file_paths:
+        with open(file_path, 'rb') as data_file:
+            digest.update(os.path.basename(file_path).encode('utf-8'))
+            digest.update(data_file.read())
+    return digest.hexdigest()
+
+
+def pareto_front(individuals):
+    """
+    Returns the individuals no other individual beats in both accuracy and latency.
+
+    :param individuals: Factors, fitness (higher is better) and latency (lower is better) of the individuals
+    :type individuals: [(factors.Factors, float, float)]
+    :return: Pareto front ordered by latency
+    :rtype: [(factors.Factors, float, float)]
+    """
+    front = []
+    for individual in sorted(individuals, key=lambda x: (x[2], -x[1])):
+        if len(front) == 0 or individual[1] > front[-1][1]:
+            front.append(individual)
+    return front
+
+
+def write_pareto_front(folder_path, front):
+    """
+    Writes the factors of a Pareto front to factors_<n>.txt files and an overview of their fitness
+    and latency to pareto.txt.
+
+    :param folder_path: Output folder
+    :type folder_path: string
+    :param front: Pareto front as returned by pareto_front()
+    :type front: [(factors.Factors, float, float)]
+    :raise: OSError if a file can not be written
+    :return: None
+    """
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+    with open(os.path.join(folder_path, 'pareto.txt'), 'w') as overview_file:
+        overview_file.write('# file, fitness, latency [ms]\n')
+        for (i, (factors, accuracy, latency)) in enumerate(front):
+            file_name = 'factors_%i.txt' % i
+            factors.write_file(os.path.join(folder_path, file_name))
+            overview_file.write('%s, %f, %f\n' % (file_name, accuracy, latency))
+
+
+def save_checkpoint(path, state):
+    """
+    Saves the state of a learning run. The file is replaced atomically.
+
+    :param path: Path to the checkpoint file
+    :type path: string
+    :param state: Learning state (see main())
+    :type state: dict
+    :raise: OSError if the file can not be written
+    :return: None
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as checkpoint_file:
+        pickle.dump(state, checkpoint_file)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads the state of a learning run saved by save_checkpoint().
+
+    :param path: Path to the checkpoint file
+    :type path: string
+    :raise: OSError if the file can not be read, pickle.UnpicklingError or ValueError if it is invalid or
+            of another version (see checkpoint_version)
+    :return: Learning state
+    :rtype: dict
+    """
+    with open(path, 'rb') as checkpoint_file:
+        state = pickle.load(checkpoint_file)
+    if not isinstance(state, dict) or 'version' not in state:
+        raise ValueError('Unknown checkpoint format')
+    if not state['version'] == checkpoint_version:
+        raise ValueError('Checkpoint format version %s is not supported (expected %d), start a new run without --resume' % (str(state['version']), checkpoint_version))
+    return state
+
+
+def evaluate_population(score_table, factors_list, settings, pool=None, location_names=None):
+    """
+    Computes the fitness of factors using the score table (and the process pool if available).
+
+    :param score_table: Score table of the learning locations
+    :type score_table: scores.ScoreTable
+    :param factors_list: Factors to evaluate
+    :type factors_list: [factors.Factors]
+    :param settings: Learning settings
+    :type settings: dict
+    :param pool: Processes initialized with the score table (see scores.init_pool_worker()), None: evaluate in this process
+    :type pool: multiprocessing.Pool
+    :param location_names: Evaluate only these locations, None: all locations
+    :type location_names: list
+    :return: Fitness of each factors
+    :rtype: [float]
+    """
+    factor_vectors = [score_table.factor_vector(f) for f in factors_list]
+    if pool is None:
+        comparators = [score_table.evaluate_vector(v, location_names) for v in factor_vectors]
+    else:
+        comparators = pool.starmap(evaluate_in_pool_worker, [(v, location_names) for v in factor_vectors])
+    return [fitness(comparator, settings) for comparator in comparators]
+
+
+def race(children, location_names, evaluate, settings):
+    """
+    Successive halving: the children are evaluated on random subsets of the learning locations of increasing
+    size (settings['racing_subset_sizes']), after each subset only the best children
+    (settings['racing_promotion_ratio']) are promoted to the next subset.
+
+    :param children: Children to race
+    :type children: [factors.Factors]
+    :param location_names: Names of all learning locations
+    :type location_names: iterable
+    :param evaluate: Function returning the fitness of each of a list of factors on a list of locations
+                     (see evaluate_population())
+    :type evaluate: function
+    :param settings: Learning settings
+    :type settings: dict
+    :return: Promoted children in the given order
+    :rtype: [factors.Factors]
+    """
+    location_names = sorted(location_names)
+    for size in settings['racing_subset_sizes']:
+        if size >= len(location_names) or len(children) <= 1:
+            break
+        subset_fitness = evaluate(children, random.sample(location_names, size))
+        promoted = max(1, math.ceil(len(children) * settings['racing_promotion_ratio']))
+        order = sorted(range(len(children)), key=lambda i: subset_fitness[i], reverse=True)
+        children = [children[i] for i in sorted(order[:promoted])]
+    return children
+
+
+def latency(score_table, factors, mean_times_ms=None):
+    """
+    Returns the mean classification time per location of the classifiers used by factors (see ScoreTable.latency_ms()).
+
+    :param score_table: Score table of the learning locations
+    :type score_table: scores.ScoreTable
+    :param factors: Factors
+    :type factors: factors.Factors
+    :param mean_times_ms: Result of ScoreTable.mean_times_ms(), None: compute it
+    :type mean_times_ms: numpy.ndarray
+    :return: Time in milliseconds
+    :rtype: float
+    """
+    return score_table.latency_ms(score_table.factor_vector(factors), mean_times_ms)
+
+
+def objective(score_table, factors, accuracy, settings, mean_times_ms=None):
+    """
+    Returns the value learning maximises: the fitness minus the latency penalty.
+
+    :param score_table: Score table of the learning locations, None if settings['latency_penalty'] is 0
+    :type score_table: scores.ScoreTable
+    :param factors: Factors
+    :type factors: factors.Factors
+    :param accuracy: Fitness of factors (see fitness())
+    :type accuracy: float
+    :param settings: Learning settings
+    :type settings: dict
+    :param mean_times_ms: Result of ScoreTable.mean_times_ms(), None: compute it
+    :type mean_times_ms: numpy.ndarray
+    :return: Objective
+    :rtype: float
+    """
+    if settings['latency_penalty'] == 0.0:
+        return accuracy
+    return accuracy - settings['latency_penalty'] * latency(score_table, factors, mean_times_ms)
+
+
+def genetic_learning(settings, score_table, batch_settings, main_log_file, checkpoint=None, pool=None):
+    """
+    Runs the genetic learning: every round children of the population are created, evaluated one by one
+    (on the score table if available, otherwise by batch processing) and the best individuals form the next population.
+    The state is saved to settings['checkpoint_file_path'] after every round.
+
+    :param settings: Learning settings
+    :type settings: dict
+    :param score_table: Score table of the learning locations, None: evaluate by batch processing
+    :type score_table: scores.ScoreTable
+    :param batch_settings: Settings for batch processing (see main())
+    :type batch_settings: dict
+    :param main_log_file: Log file of main()
+    :type main_log_file: file
+    :param checkpoint: Learning state to continue from (see load_checkpoint()), None: start a new run
+    :type checkpoint: dict
+    :param pool: Processes initialized with the score table (see scores.init_pool_worker()), None: evaluate in this process
+    :type pool: multiprocessing.Pool
+    :return: Winner and Pareto front (see pareto_front())
+    :rtype: (factors.Factors, [(factors.Factors, float, float)])
     """
 
     def get_random_number():
@@ -82,6 +327,262 @@ def main(settings):
         else:
             return random.uniform(1, settings['max_factor_value'])
 
+    def cached_objective(factors):
+        """
+        Returns the objective of factors if their fitness is in the fitness cache.
+
+        :param factors: Factors
+        :type factors: factors.Factors
+        :return: Objective, None if unknown
+        :rtype: float
+        """
+        accuracy = fitness_cache.get(factors)
+        return None if accuracy is None else objective(score_table, factors, accuracy, settings, mean_times_ms)
+
+    mean_times_ms = score_table.mean_times_ms() if score_table is not None else None
+
+    # Fitness of all evaluated factors
+    main_log_file.write('Initializing fitness cache...')
+    classifier_names = [classifier.name() for classifier in classifiers_list]
+    fitness_cache = FitnessCache(classifier_names, settings['fitness_cache_quantum'])
+    if settings['fitness_cache_file_path'] is not None:
+        try:
+            fitness_cache.fingerprint = data_fingerprint(settings)
+            if os.path.isfile(settings['fitness_cache_file_path']):
+                fitness_cache = FitnessCache.load_file(settings['fitness_cache_file_path'], classifier_names, settings['fitness_cache_quantum'], fitness_cache.fingerprint)
+        except (OSError, ValueError, KeyError) as error:
+            main_log_file.write('ignoring fitness cache file "%s" (%s)...' % (settings['fitness_cache_file_path'], str(error)))
+    main_log_file.write('OK, %d entries\n' % len(fitness_cache.entries))
+
+    if checkpoint is None:
+        main_log_file.write('Initializing factors...')
+        factor_list = []
+        for i in range(0, settings['population']):
+            temp_factor = Factors()
+            for classifier in classifiers_list:
+                temp_factor.factors[classifier.name()] = get_random_number()
+            factor_list.append((temp_factor, cached_objective(temp_factor)))
+        main_log_file.write('OK\n')
+        duplicates = 0
+        raced_out = 0
+        winner = None
+        front = []
+        first_round = 0
+    else:
+        main_log_file.write('Resuming from checkpoint "%s" at round %i...' % (settings['checkpoint_file_path'], checkpoint['round'] + 1))
+        factor_list = checkpoint['population']
+        fitness_cache = checkpoint['fitness_cache']
+        duplicates = checkpoint['duplicates']
+        raced_out = checkpoint['raced_out']
+        winner = checkpoint['winner']
+        front = checkpoint['pareto_front']
+        first_round = checkpoint['round']
+        random.setstate(checkpoint['random_state'])
+        main_log_file.write('OK\n')
+
+    for round in range(first_round, settings['rounds']):
+        print('Round %i' % (round + 1), end='', flush=True)
+        main_log_file.write('Round %i' % (round + 1))
+
+        # New population
+        current_population = factor_list.copy()
+        result_population = []
+        population_keys = {fitness_cache.key(f) for (f, points) in current_population}
+        for i in range(0, settings['new_population_per_turn']):
+            parent1 = current_population[random.randint(0, len(current_population) - 1)][0]
+            parent2 = current_population[random.randint(0, len(current_population) - 1)][0]
+            child = Factors()
+            for classifier in classifiers_list:
+                if random.randint(0, 1) == 0:
+                    child.factors[classifier.name()] = parent1.factors[classifier.name()]
+                else:
+                    child.factors[classifier.name()] = parent2.factors[classifier.name()]
+            # Mutation of children
+            if random.random() < settings['mutations_rate']:
+                mutated_name = classifiers_list[random.randint(0, len(classifiers_list) - 1)].name()
+                if settings['zero_factor_rate'] > 0.0 and random.random() < settings['zero_factor_rate']:
+                    child.factors[mutated_name] = 0.0
+                else:
+                    child.factors[mutated_name] = get_random_number()
+            # Identical individuals add nothing to the population
+            if fitness_cache.key(child) in population_keys:
+                duplicates += 1
+                continue
+            population_keys.add(fitness_cache.key(child))
+            current_population.append((child, cached_objective(child)))
+
+        # Processing
+        if score_table is not None:
+            if len(settings['racing_subset_sizes']) > 0:
+                # Only children promoted to the full set of locations get a fitness, raced out children are dropped
+                children = [f for (f, points) in current_population[len(factor_list):] if points is None]
+                evaluate = lambda factors_list, location_names: evaluate_population(score_table, factors_list, settings, pool, location_names)
+                promoted = {id(f) for f in race(children, score_table.truth_polygons.keys(), evaluate, settings)}
+                raced_out += len(children) - len(promoted)
+                current_population = current_population[:len(factor_list)] + [(f, points) for (f, points) in current_population[len(factor_list):] if points is not None or id(f) in promoted]
+            cached_fitness = iter(evaluate_population(score_table, [f for (f, points) in current_population if points is None], settings, pool))
+        for current_factor in current_population:
+            if current_factor[1] is None and score_table is not None:
+                accuracy = next(cached_fitness)
+                fitness_cache.add(current_factor[0], accuracy)
+                result_population.append((current_factor[0], objective(score_table, current_factor[0], accuracy, settings, mean_times_ms)))
+                print('.', end='', flush=True)
+                main_log_file.write('.')
+            elif current_factor[1] is None:
+                batch_settings['factors'] = current_factor[0]
+                if batch.main(batch_settings) == 1:
+                    main_log_file.write(' ERROR - Can not complete batch processing!')
+                    print('!', end='', flush=True)
+                    result_population.append((current_factor[0], -1.0))
+                    continue
+                batch_settings['force_cache_update'] = False
+
+                try:
+                    comparator = Comparator(settings['db_folder_path'], settings['temp_folder_path'], settings['minimum_intersection_ratio'], raise_on_critical_error=True, use_two_circle_intersection_ratio=settings['use_two_circle_intersection_ratio'])
+                    comparator.run()
+                except Exception as exception:
+                    main_log_file.write(' ERROR - %s!' % str(exception))
+                    result_population.append((current_factor[0], -1.0))
+                    print('!', end='', flush=True)
+                    continue
+                result_population.append((current_factor[0], fitness(comparator, settings)))
+                fitness_cache.add(*result_population[-1])
+                print('.', end='', flush=True)
+                main_log_file.write('.')
+            else:
+                print(':', end='', flush=True)
+                main_log_file.write(':')
+                result_population.append(current_factor)
+        result_population.sort(key=lambda x: x[1], reverse=True)
+        print('[ ', end='', flush=True)
+        main_log_file.write('[ ')
+        for tuple in result_population:
+            print('%5.4f ' % tuple[1], end='', flush=True)
+            main_log_file.write('%5.4f ' % tuple[1])
+        print(']', end='', flush=True)
+        main_log_file.write(']')
+
+        winner = result_population[0][0]
+        if score_table is not None:
+            # Accuracy is taken from the fitness cache, raced out children are not in the population anyway
+            accuracies = [(f, fitness_cache.entries.get(fitness_cache.key(f))) for (f, points) in result_population]
+            front = pareto_front(front + [(f, accuracy, latency(score_table, f, mean_times_ms)) for (f, accuracy) in accuracies if accuracy is not None])
+        factor_list = []
+        for _ in range(0, min(settings['population'], len(result_population))):
+            factor_list.append(result_population.pop(0))
+        print(' OK')
+        main_log_file.write(' OK, fitness cache hit rate %.1f%%\n' % (fitness_cache.hit_rate() * 100))
+
+        if settings['fitness_cache_file_path'] is not None:
+            try:
+                fitness_cache.save_file(settings['fitness_cache_file_path'])
+            except OSError as error:
+                main_log_file.write('Can not save fitness cache file "%s": %s\n' % (settings['fitness_cache_file_path'], str(error)))
+
+        if settings['checkpoint_file_path'] is not None:
+            state = {
+                'version': checkpoint_version,
+                'settings': settings,
+                'round': round + 1,
+                'population': factor_list,
+                'winner': winner,
+                'pareto_front': front,
+                'fitness_cache': fitness_cache,
+                'duplicates': duplicates,
+                'raced_out': raced_out,
+                'random_state': random.getstate()
+            }
+            try:
+                save_checkpoint(settings['checkpoint_file_path'], state)
+            except OSError as error:
+                main_log_file.write('Can not save checkpoint file "%s": %s\n' % (settings['checkpoint_file_path'], str(error)))
+
+    main_log_file.write('Fitness cache: %d of %d lookups answered (%.1f%%), %d duplicate children dropped\n' % (fitness_cache.hits, fitness_cache.lookups, fitness_cache.hit_rate() * 100, duplicates))
+    if len(settings['racing_subset_sizes']) > 0:
+        main_log_file.write('Racing: %d children raced out\n' % raced_out)
+    return winner, front
+
+
+def optimize_vectorized(settings, score_table, main_log_file):
+    """
+    Runs the optimizer settings['optimizer'] (see optimizer.optimizers) on the score table.
+    All individuals of a round are evaluated at once.
+
+    :param settings: Learning settings
+    :type settings: dict
+    :param score_table: Score table of the learning locations
+    :type score_table: scores.ScoreTable
+    :param main_log_file: Log file of main()
+    :type main_log_file: file
+    :return: Winner and Pareto front (see pareto_front())
+    :rtype: (factors.Factors, [(factors.Factors, float, float)])
+    """
+    main_log_file.write('Initializing score tensor...')
+    score_tensor = ScoreTensor(score_table)
+    mean_times_ms = score_table.mean_times_ms()
+    names = score_table.classifier_names
+    main_log_file.write('OK\n')
+    front_matrix = numpy.zeros((0, len(names)))
+    front_accuracy = numpy.zeros(0)
+    front_latency = numpy.zeros(0)
+
+    def to_factors(factor_vector):
+        """
+        Converts a factor vector (row order of the score table) to factors.
+
+        :param factor_vector: Factor vector
+        :type factor_vector: numpy.ndarray
+        :return: Factors
+        :rtype: factors.Factors
+        """
+        factors = Factors()
+        factors.factors = {name: float(value) for (name, value) in zip(names, factor_vector)}
+        return factors
+
+    def vector_objective(factor_matrix):
+        """
+        Returns the objective (see objective()) of every factor vector and updates the Pareto front.
+
+        :param factor_matrix: Factor vectors (rows: individuals)
+        :type factor_matrix: numpy.ndarray
+        :return: Objectives
+        :rtype: numpy.ndarray
+        """
+        nonlocal front_matrix, front_accuracy, front_latency
+        accuracy = score_tensor.fitness_many(factor_matrix)
+        latencies = (factor_matrix != 0).astype(float) @ mean_times_ms
+        front_matrix = numpy.concatenate((front_matrix, factor_matrix))
+        front_accuracy = numpy.concatenate((front_accuracy, accuracy))
+        front_latency = numpy.concatenate((front_latency, latencies))
+        mask = pareto_mask(front_accuracy, front_latency)
+        (front_matrix, front_accuracy, front_latency) = (front_matrix[mask], front_accuracy[mask], front_latency[mask])
+        return accuracy - settings['latency_penalty'] * latencies
+
+    def report(round, population, values):
+        """
+        Prints and logs the objectives of a round (see optimizer.genetic_search()).
+
+        :return: None
+        """
+        print('Round %i [ %5.4f ] OK' % (round + 1, values[0]), flush=True)
+        main_log_file.write('Round %i [ %s] OK\n' % (round + 1, ''.join('%5.4f ' % value for value in values[:10])))
+
+    rng = numpy.random.default_rng(random.getrandbits(64))
+    (factor_vector, value) = optimizers[settings['optimizer']](vector_objective, len(names), settings, rng, report)
+    front = pareto_front([(to_factors(v), a, l) for (v, a, l) in zip(front_matrix, front_accuracy, front_latency)])
+    return to_factors(factor_vector), front
+
+
+def main(settings):
+    """
+    Runs the learning process.
+
+    :param settings: Settings dict like default_learning_settings. Defaults to default_learning_settings
+    :type settings: dict
+    :return: 0 if success, 1 otherwise
+    :rtype: int
+    """
+
     def test_result(batch_settings, learning_settings, winner):
         """
         Tests the accuracy after learning.
@@ -131,6 +632,17 @@ def main(settings):
             main_log_file.write('Can not delete temporary folder "%s", aborting.\n' % settings['temp_folder_path'])
             sys.exit(1)
 
+    # Continue with the settings of the checkpoint
+    checkpoint = None
+    if settings['resume']:
+        try:
+            checkpoint = load_checkpoint(settings['checkpoint_file_path'])
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError) as error:
+            print('Can not load checkpoint file "%s": %s' % (settings['checkpoint_file_path'], str(error)))
+            return 1
+        # Settings added later keep their defaults
+        settings = dict(default_settings(), **dict(checkpoint['settings'], resume=True, checkpoint_file_path=settings['checkpoint_file_path']))
+
     #Create header
     header = format_header(settings)
     print(header + '\n')
@@ -152,7 +664,7 @@ def main(settings):
     batch_settings['output_folder_path'] = settings['temp_folder_path']
     batch_settings['log_folder_path'] = settings['log_folder_path']
     batch_settings['cache_folder_path'] = settings['cache_folder_path']
-    batch_settings['force_cache_update'] = True  # Force cache update
+    batch_settings['force_cache_update'] = checkpoint is None  # Force cache update, unless resuming with the cached data
     batch_settings['maximum_cache_file_age'] = settings['maximum_cache_file_age']
     batch_settings['overpass_radius'] = settings['overpass_radius']
     batch_settings['minimum_intersection_ratio'] = settings['minimum_intersection_ratio']
@@ -163,7 +675,7 @@ def main(settings):
 
     main_log_file_path = settings['log_folder_path'] + 'learning.log'
     try:
-        with open(main_log_file_path, 'w', 1) as main_log_file:
+        with open(main_log_file_path, 'w' if checkpoint is None else 'a', 1) as main_log_file:
             main_log_file.write(header + '\n')
             main_log_file.write('Initializing...')
             if not os.path.exists(settings['cache_folder_path']):
@@ -192,86 +704,38 @@ def main(settings):
                     return 1
             main_log_file.write('OK\n')
 
-            main_log_file.write('Initializing factors...')
-            factor_list = []
-            for i in range(0, settings['population']):
-                temp_factor = Factors()
-                for classifier in classifiers_list:
-                    temp_factor.factors[classifier.name()] = get_random_number()
-                factor_list.append((temp_factor, None))
-            main_log_file.write('OK\n')
-
-            winner = None
-            for round in range(settings['rounds']):
-                print('Round %i' % (round + 1), end='', flush=True)
-                main_log_file.write('Round %i' % (round + 1))
-
-                # New population
-                current_population = factor_list.copy()
-                result_population = []
-                for i in range(0, settings['new_population_per_turn']):
-                    parent1 = current_population[random.randint(0, len(current_population) - 1)][0]
-                    parent2 = current_population[random.randint(0, len(current_population) - 1)][0]
-                    child = Factors()
-                    for classifier in classifiers_list:
-                        if random.randint(0, 1) == 0:
-                            child.factors[classifier.name()] = parent1.factors[classifier.name()]
-                        else:
-                            child.factors[classifier.name()] = parent2.factors[classifier.name()]
-                    # Mutation of children
-                    if random.random() < settings['mutations_rate']:
-                        child.factors[classifiers_list[random.randint(0, len(classifiers_list) - 1)].name()] = get_random_number()
-                    current_population.append((child, None))
-
-                # Processing
-                for current_factor in current_population:
-                    if current_factor[1] is None:
-                        batch_settings['factors'] = current_factor[0]
-                        if batch.main(batch_settings) == 1:
-                            main_log_file.write(' ERROR - Can not complete batch processing!')
-                            print('!', end='', flush=True)
-                            result_population.append((current_factor[0], -1.0))
-                            continue
-                        batch_settings['force_cache_update'] = False
-
-                        try:
-                            comparator = Comparator(settings['db_folder_path'], settings['temp_folder_path'], settings['minimum_intersection_ratio'], raise_on_critical_error=True, use_two_circle_intersection_ratio=settings['use_two_circle_intersection_ratio'])
-                            comparator.run()
-                        except Exception as exception:
-                            main_log_file.write(' ERROR - %s!' % str(exception))
-                            result_population.append((current_factor[0], -1.0))
-                            print('!', end='', flush=True)
-                            continue
-                        if settings['use_two_circle_intersection_ratio']:
-                            passed = len(comparator.passed)
-                            points = (passed / (passed + len(comparator.failed) + len(comparator.erroneous))) - (comparator.average_intersection_ratio/100)
-                        else:
-                            points = comparator.average_intersection_ratio
-                        result_population.append((current_factor[0], points))
-                        print('.', end='', flush=True)
-                        main_log_file.write('.')
-                    else:
-                        print(':', end='', flush=True)
-                        main_log_file.write(':')
-                        result_population.append(current_factor)
-                result_population.sort(key=lambda x: x[1], reverse=True)
-                print('[ ', end='', flush=True)
-                main_log_file.write('[ ')
-                for tuple in result_population:
-                    print('%5.4f ' % tuple[1], end='', flush=True)
-                    main_log_file.write('%5.4f ' % tuple[1])
-                print(']', end='', flush=True)
-                main_log_file.write(']')
-
-                winner = result_population[0][0]
-                factor_list = []
-                for _ in range(0, settings['population']):
-                    factor_list.append(result_population.pop(0))
-                print(' OK')
-                main_log_file.write(' OK\n')
+            score_table = None
+            if settings['use_score_cache']:
+                score_table = batch.compute_score_table(batch_settings, main_log_file, settings['truth_table_file_path'])
+                if score_table is None:
+                    print('Could not compute score table, aborting.')
+                    return 1
+                batch_settings['force_cache_update'] = False
+                main_log_file.write('Classification time per location: %.1f ms\n' % score_table.mean_times_ms().sum())
+
+            if settings['optimizer'] == 'ga':
+                # Workers live for all rounds and receive the score table once
+                pool = None
+                if score_table is not None and settings['jobs'] > 1:
+                    pool = multiprocessing.Pool(settings['jobs'], initializer=init_pool_worker, initargs=(score_table, ))
+                try:
+                    (winner, front) = genetic_learning(settings, score_table, batch_settings, main_log_file, checkpoint, pool)
+                finally:
+                    if pool is not None:
+                        pool.terminate()
+            else:
+                (winner, front) = optimize_vectorized(settings, score_table, main_log_file)
             print('All rounds complete!')
             main_log_file.write('All rounds complete!\n')
             winner.write_file(settings['factors_file_path'])
+            if score_table is not None:
+                main_log_file.write('Winner classification time per location: %.1f ms\n' % latency(score_table, winner))
+            if settings['pareto_folder_path'] is not None:
+                try:
+                    write_pareto_front(settings['pareto_folder_path'], front)
+                    main_log_file.write('Pareto front: %d factor file(s) written to "%s"\n' % (len(front), settings['pareto_folder_path']))
+                except OSError as error:
+                    main_log_file.write('Can not write Pareto front to "%s": %s\n' % (settings['pareto_folder_path'], str(error)))
             test_result(batch_settings, settings, winner)
             clear_learning_tmp()
     except OSError as error:
@@ -303,6 +767,18 @@ def parse_cmd_args():
     parser.add_argument('--test-sur-file', dest='test_sur_file', help='Path to the text file containing the SURs for verification. Default: %s' % settings['test_surs_file_path']) # #testsur
     parser.add_argument('--temp-output', dest='output_folder', help='Path to the folder that will contain the resulting KML files. This folder will be deleted at the end. Default: %s' % settings['temp_folder_path']) # output
     parser.add_argument('--two-circle-intersection', dest='use_two_circle_intersection_ratio', help='Use two circle intersection ratio method. Default: False', action='store_true')
+    parser.add_argument('--score-cache', dest='use_score_cache', help='Process the learning locations once and evaluate factors on the cached classifier points. Default: False', action='store_true')
+    parser.add_argument('-j', '--jobs', dest='jobs', help='Number of processes evaluating individuals concurrently (requires --score-cache). Default: %i' % settings['jobs'], type=int)
+    parser.add_argument('--fitness-cache', dest='fitness_cache_file_path', help='File keeping the fitness of evaluated factors between runs. Default: in memory only')
+    parser.add_argument('--racing-subsets', dest='racing_subset_sizes', help='Comma separated numbers of locations children are raced on before being evaluated on all locations, e.g. 10,40 (requires --score-cache). Default: no racing')
+    parser.add_argument('--racing-promotion', dest='racing_promotion_ratio', help='Share of the children promoted to the next racing stage. Default: %f' % settings['racing_promotion_ratio'], type=float)
+    parser.add_argument('--checkpoint', dest='checkpoint_file_path', help='File the learning state is saved to after every round. Default: %s' % settings['checkpoint_file_path'])
+    parser.add_argument('--resume', dest='resume', help='Continue the learning run saved in the checkpoint file with its settings. Default: False', action='store_true')
+    parser.add_argument('--latency-penalty', dest='latency_penalty', help='Fitness subtracted per millisecond of classification time per location of the classifiers with a factor other than 0 (requires --score-cache). Default: %f' % settings['latency_penalty'], type=float)
+    parser.add_argument('--zero-factor-rate', dest='zero_factor_rate', help='Probability of a mutation setting a factor to 0, which disables the classifier. Default: %f' % settings['zero_factor_rate'], type=float)
+    parser.add_argument('--pareto-front', dest='pareto_folder_path', help='Folder to write the factors of the accuracy versus latency Pareto front to (requires --score-cache). Default: not written')
+    parser.add_argument('--optimizer', dest='optimizer', choices=['ga'] + sorted(optimizers.keys()), help='Optimizer: "ga" evaluates individuals one by one and supports all options, "vector-ga" and "coordinate" evaluate whole rounds at once on the score cache (requires --score-cache, can not be combined with --resume, --jobs, --fitness-cache and racing). Default: %s' % settings['optimizer'])
+    parser.add_argument('--truth-table', dest='truth_table_file_path', help='File caching the intersection ratios of all ways of the learning locations between runs (used with --score-cache). Default: %s' % settings['truth_table_file_path'])
 
     args = parser.parse_args()
 
@@ -348,6 +824,73 @@ def parse_cmd_args():
         settings['temp_folder_path'] = output_folder
     if args.use_two_circle_intersection_ratio:
         settings['use_two_circle_intersection_ratio'] = args.use_two_circle_intersection_ratio
+    if args.use_score_cache:
+        settings['use_score_cache'] = args.use_score_cache
+    if args.truth_table_file_path:
+        settings['truth_table_file_path'] = args.truth_table_file_path
+    if args.racing_subset_sizes:
+        try:
+            sizes = [int(size) for size in args.racing_subset_sizes.split(',')]
+        except ValueError:
+            print('racing subsets must be comma separated integers')
+            sys.exit(0)
+        if any(size < 1 for size in sizes) or not sizes == sorted(sizes):
+            print('racing subsets must be larger or equal to 1 and ascending')
+            sys.exit(0)
+        if not settings['use_score_cache']:
+            print('racing requires --score-cache')
+            sys.exit(0)
+        settings['racing_subset_sizes'] = sizes
+    if args.racing_promotion_ratio:
+        if not (0.0 < args.racing_promotion_ratio <= 1.0):
+            print('racing promotion must be between 0.0 (exclusive) and 1.0')
+            sys.exit(0)
+        settings['racing_promotion_ratio'] = args.racing_promotion_ratio
+    if args.checkpoint_file_path:
+        settings['checkpoint_file_path'] = args.checkpoint_file_path
+    if args.resume:
+        settings['resume'] = args.resume
+    if args.fitness_cache_file_path:
+        settings['fitness_cache_file_path'] = args.fitness_cache_file_path
+    if args.optimizer:
+        if not args.optimizer == 'ga' and not settings['use_score_cache']:
+            print('optimizer %s requires --score-cache' % args.optimizer)
+            sys.exit(0)
+        settings['optimizer'] = args.optimizer
+    if args.latency_penalty:
+        if args.latency_penalty < 0.0:
+            print('latency penalty must be larger or equal to 0.0')
+            sys.exit(0)
+        if not settings['use_score_cache']:
+            print('latency penalty requires --score-cache')
+            sys.exit(0)
+        settings['latency_penalty'] = args.latency_penalty
+    if args.zero_factor_rate:
+        if not (0.0 <= args.zero_factor_rate <= 1.0):
+            print('zero factor rate must be between 0.0 and 1.0')
+            sys.exit(0)
+        settings['zero_factor_rate'] = args.zero_factor_rate
+    if args.pareto_folder_path:
+        if not settings['use_score_cache']:
+            print('Pareto front requires --score-cache')
+            sys.exit(0)
+        settings['pareto_folder_path'] = args.pareto_folder_path
+    if args.jobs:
+        if args.jobs < 1:
+            print('jobs must be larger or equal to 1')
+            sys.exit(0)
+        if args.jobs > 1 and not settings['use_score_cache']:
+            print('jobs requires --score-cache')
+            sys.exit(0)
+        settings['jobs'] = args.jobs
+    if not settings['optimizer'] == 'ga':
+        # Only the genetic learning evaluates individuals one by one
+        unsupported = [('--resume', args.resume), ('--jobs', args.jobs is not None and args.jobs > 1), ('--fitness-cache', args.fitness_cache_file_path),
+                       ('--racing-subsets', args.racing_subset_sizes), ('--racing-promotion', args.racing_promotion_ratio)]
+        for (option, given) in unsupported:
+            if given:
+                print('optimizer %s can not be combined with %s' % (settings['optimizer'], option))
+                sys.exit(0)
 
     return settings
 
@@ -384,6 +927,25 @@ def format_header(settings):
     header += item('Verification database path', settings['test_folder_path'])
     header += item('Verification SUR file path', settings['test_surs_file_path'])
     header += item('Temporary output path', settings['temp_folder_path'])
+    header += item('Checkpoint file path', settings['checkpoint_file_path'])
+    if settings['resume']:
+        header += item('Resume', settings['resume'])
+    header += item('Use score cache', settings['use_score_cache'])
+    header += item('Optimizer', settings['optimizer'])
+    if settings['fitness_cache_file_path'] is not None:
+        header += item('Fitness cache file path', settings['fitness_cache_file_path'])
+    if settings['use_score_cache']:
+        header += item('Truth table file path', settings['truth_table_file_path'])
+        header += item('Jobs', settings['jobs'])
+    if settings['zero_factor_rate'] > 0.0:
+        header += item('Zero factor rate', settings['zero_factor_rate'])
+    if settings['latency_penalty'] > 0.0:
+        header += item('Latency penalty [1/ms]', settings['latency_penalty'])
+    if settings['pareto_folder_path'] is not None:
+        header += item('Pareto front path', settings['pareto_folder_path'])
+    if len(settings['racing_subset_sizes']) > 0:
+        header += item('Racing subsets', ', '.join(str(size) for size in settings['racing_subset_sizes']))
+        header += item('Racing promotion ratio', settings['racing_promotion_ratio'])
     return header
 
 if __name__ == '__main__':
@@ -396,4 +958,6 @@ if __name__ == '__main__':
             print('Learning failed. Check log files for details.')
     except KeyboardInterrupt:
         print('\nAborted')
+        if learning_settings['checkpoint_file_path'] is not None and os.path.isfile(learning_settings['checkpoint_file_path']):
+            print('Run with --resume to continue from the last completed round.')
         sys.exit(0)
@@ -20,6 +20,7 @@
 import os
 import sys
 import argparse
+import xml.etree.ElementTree
 
 import server
 
@@ -42,6 +43,9 @@ def main(argv):
     parser.add_argument('--output_folder_path', dest='output_folder_path', default='../output/', help='Path to output folder. Default: ../output/ (relative to server/)')
     parser.add_argument('--cache_folder_path', dest='cache_folder_path', default='../cache/', help='Path to cache folder containing *.osm. Default: ../input/ (relative to server/)')
     parser.add_argument('--images_folder_path', dest='images_folder_path', default='./images/', help='Path to input folder. Default: ./images/ (relative to server/)')
+    parser.add_argument('--classifier-threads', dest='classifier_threads', default=0, type=int, help='Number of threads running classifiers concurrently. Default: 0 (sequential)')
+    parser.add_argument('--prune-ways', dest='prune_ways', help='Stop rating ways which can no longer win.', action='store_true')
+    parser.add_argument('--osm-extract', dest='osm_extract_file_path', help='Path to a local *.osm extract to use instead of the Overpass API.')
     parser.add_argument('-q', '--quiet-mode', dest='quiet_mode', help='Prevents all output to stdout.', action='store_true')
     args = parser.parse_args()
 
@@ -50,17 +54,22 @@ def main(argv):
     settings['host'] = args.host
     settings['port'] = args.port
     settings['quiet_mode'] = args.quiet_mode
+    settings['classifier_threads'] = args.classifier_threads
+    settings['prune_ways'] = args.prune_ways
     settings['data_folder_path'] = args.data_folder_path + '/'
     settings['cache_folder_path'] = args.cache_folder_path + '/'
     settings['input_folder_path'] = args.input_folder_path + '/'
     settings['output_folder_path'] = args.output_folder_path + '/'
     settings['images_folder_path'] = args.images_folder_path + '/'
+    if args.osm_extract_file_path:
+        # The server runs in server/
+        settings['osm_extract_file_path'] = os.path.abspath(args.osm_extract_file_path)
 
     # Run server
     os.chdir('server/')
     try:
         server_instance = server.Server((settings['host'], settings['port']), server.HTTPRequestHandler, settings=settings)
-    except OSError as error:
+    except (OSError, xml.etree.ElementTree.ParseError) as error:
         print('Error while starting server: %s' % str(error), file=sys.stderr)
         sys.exit(1)
     try:
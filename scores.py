@@ -0,0 +1,373 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import hashlib
+
+import numpy
+import shapely.geometry
+
+from comparator import *
+from distance import *
+
+
+class LocationScores:
+    def __init__(self, name, uids, scores, coordinates, offsets, times_ms=None, point=None, descriptions=None):
+        """
+        This class holds the unweighted points of all classifiers for the ways of a location.
+
+        :param name: Location name
+        :type name: string
+        :param uids: UIDs of the ways
+        :type uids: list
+        :param scores: Unweighted points (rows: classifiers, columns: uids) as in processor.Processor.scores
+        :type scores: numpy.ndarray
+        :param coordinates: Exterior coordinates of all ways as returned by distance.stack_coordinates()
+        :type coordinates: numpy.ndarray
+        :param offsets: Offsets of the first coordinate of every way as returned by distance.stack_coordinates()
+        :type offsets: numpy.ndarray
+        :param times_ms: Classification time of every classifier in milliseconds (rows of scores), None: unknown
+        :type times_ms: numpy.ndarray
+        :param point: Position of the location, None: unknown
+        :type point: shapely.geometry.Point
+        :param descriptions: "description" tags of the ways ('' if not tagged), None: unknown
+        :type descriptions: list
+        :return: None
+        """
+        self.name = name
+        self.uids = uids
+        self.scores = scores
+        self.coordinates = coordinates
+        self.offsets = offsets
+        self.times_ms = times_ms
+        self.point = point
+        self.descriptions = descriptions
+
+    @staticmethod
+    def from_processor(processor):
+        """
+        Creates the scores of a location processed by processor.Processor.run().
+
+        :param processor: Processor after run()
+        :type processor: processor.Processor
+        :return: Location scores
+        :rtype: LocationScores
+        """
+        coordinates, offsets = stack_coordinates([processor.location.ways[uid] for uid in processor.uids])
+        times_ms = numpy.array([processor.statistics[name]['time_ms'] for name in processor.classifier_names], dtype=float)
+        descriptions = [processor.location.ways[uid].tags.get('description', '') for uid in processor.uids]
+        return LocationScores(processor.location.name, list(processor.uids), processor.scores.copy(), coordinates, offsets, times_ms, processor.location.point, descriptions)
+
+    def winner(self, factor_vector):
+        """
+        Returns the index of the way with the highest total. Like processor.Processor.run(), each weighted point
+        is rounded and equal totals are decided by the order of self.uids.
+
+        :param factor_vector: Factors of all rows of self.scores
+        :type factor_vector: numpy.ndarray
+        :return: Index of the winner in self.uids
+        :rtype: int
+        """
+        totals = numpy.rint(self.scores * factor_vector[:, numpy.newaxis]).astype(int).sum(axis=0)
+        return int(numpy.argmax(totals))
+
+    def truth_key(self, truth_data):
+        """
+        Returns a key identifying the inputs of the intersection ratios of this location: a hash of the
+        *.truth.kml file and of the UIDs and coordinates of all ways.
+
+        :param truth_data: Contents of the *.truth.kml file
+        :type truth_data: bytes
+        :return: Key
+        :rtype: string
+        """
+        digest = hashlib.sha1(truth_data)
+        digest.update('\n'.join(self.uids).encode('utf-8'))
+        digest.update(numpy.ascontiguousarray(self.offsets, dtype=numpy.int64).tobytes())
+        digest.update(numpy.ascontiguousarray(self.coordinates, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def polygon(self, index):
+        """
+        Returns the polygon of a way as read back from the *.computed.kml.
+
+        :param index: Index of the way in self.uids
+        :type index: int
+        :return: Polygon
+        :rtype: shapely.geometry.Polygon
+        """
+        return kml_polygon(self.coordinates[self.offsets[index]:self.offsets[index + 1]])
+
+
+def save_scores_file(path, classifier_names, location_scores_list):
+    """
+    Saves the scores of locations column-wise to a numpy .npz file. The file is replaced atomically.
+
+    :param path: Path to the file
+    :type path: string
+    :param classifier_names: Names of the classifiers (rows of the scores)
+    :type classifier_names: list
+    :param location_scores_list: Scores of the locations, created by LocationScores.from_processor()
+    :type location_scores_list: [LocationScores]
+    :raise: OSError if the file can not be written
+    :return: None
+    """
+    way_offsets = numpy.zeros(len(location_scores_list) + 1, dtype=numpy.int64)
+    way_offsets[1:] = numpy.cumsum([len(location_scores.uids) for location_scores in location_scores_list])
+    # Offsets of the first coordinate of every way in the coordinates of all locations
+    coordinate_offsets = [numpy.zeros(1, dtype=numpy.int64)]
+    coordinate_count = 0
+    for location_scores in location_scores_list:
+        coordinate_offsets.append(location_scores.offsets[1:] + coordinate_count)
+        coordinate_count += location_scores.offsets[-1]
+
+    arrays = {
+        'classifier_names': numpy.array(classifier_names, dtype=str),
+        'names': numpy.array([location_scores.name for location_scores in location_scores_list], dtype=str),
+        'points': numpy.array([(location_scores.point.x, location_scores.point.y) for location_scores in location_scores_list], dtype=float).reshape(-1, 2),
+        'times_ms': numpy.array([location_scores.times_ms for location_scores in location_scores_list], dtype=float).reshape(-1, len(classifier_names)),
+        'way_offsets': way_offsets,
+        'uids': numpy.array([uid for location_scores in location_scores_list for uid in location_scores.uids], dtype=str),
+        'descriptions': numpy.array([d for location_scores in location_scores_list for d in location_scores.descriptions], dtype=str),
+        'scores': numpy.concatenate([numpy.zeros((len(classifier_names), 0), dtype=numpy.int32)] + [location_scores.scores.astype(numpy.int32) for location_scores in location_scores_list], axis=1),
+        'coordinate_offsets': numpy.concatenate(coordinate_offsets).astype(numpy.int64),
+        'coordinates': numpy.concatenate([numpy.zeros((0, 2))] + [location_scores.coordinates for location_scores in location_scores_list])
+    }
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as scores_file:
+        numpy.savez_compressed(scores_file, **arrays)
+    os.replace(temporary_path, path)
+
+
+def load_scores_file(path):
+    """
+    Loads the scores saved by save_scores_file().
+
+    :param path: Path to the file
+    :type path: string
+    :raise: OSError if the file can not be read, ValueError or KeyError if it is invalid
+    :return: Names of the classifiers and scores of the locations
+    :rtype: (list, [LocationScores])
+    """
+    with numpy.load(path, allow_pickle=False) as arrays:
+        arrays = dict(arrays)
+    way_offsets = arrays['way_offsets']
+    coordinate_offsets = arrays['coordinate_offsets']
+    location_scores_list = []
+    for (i, name) in enumerate(arrays['names']):
+        (first, last) = (way_offsets[i], way_offsets[i + 1])
+        offsets = coordinate_offsets[first:last + 1]
+        location_scores_list.append(LocationScores(str(name),
+                                                   [str(uid) for uid in arrays['uids'][first:last]],
+                                                   arrays['scores'][:, first:last].astype(int),
+                                                   arrays['coordinates'][offsets[0]:offsets[-1]],
+                                                   offsets - offsets[0],
+                                                   arrays['times_ms'][i],
+                                                   shapely.geometry.Point(arrays['points'][i]),
+                                                   [str(d) for d in arrays['descriptions'][first:last]]))
+    return [str(name) for name in arrays['classifier_names']], location_scores_list
+
+
+class ScoreTable:
+    def __init__(self, classifier_names, minimum_intersection_ratio, use_two_circle_intersection_ratio=False):
+        """
+        This class caches the unweighted points of all locations, so factors can be evaluated without
+        processing the locations again. The result of an evaluation equals running batch processing
+        followed by the Comparator.
+
+        :param classifier_names: Names of the classifiers (rows of the scores)
+        :type classifier_names: list
+        :param minimum_intersection_ratio: Ratio polygons have to share to be considered equal
+        :type minimum_intersection_ratio: float
+        :param use_two_circle_intersection_ratio: Use the "two circle intersection ratio" method
+        :type use_two_circle_intersection_ratio: bool
+        :return: None
+        """
+        self.classifier_names = classifier_names
+        self.minimum_intersection_ratio = minimum_intersection_ratio
+        self.use_two_circle_intersection_ratio = use_two_circle_intersection_ratio
+        self.locations = {}
+        self.truth_polygons = {}
+        self.truth_table = TruthTable(minimum_intersection_ratio)
+
+    def add_location(self, location_scores):
+        """
+        Adds the scores of a location.
+
+        :param location_scores: Scores of the location
+        :type location_scores: LocationScores
+        :return: None
+        """
+        self.locations[location_scores.name] = location_scores
+
+    def load_truth_polygons(self, input_folder_path, truth_table=None):
+        """
+        Loads the polygons of all *.truth.kml files and fills self.truth_table with the intersection ratios
+        of all ways. Locations whose inputs did not change are taken from the given table.
+
+        :param input_folder_path: Path to the folder containing the *.truth.kml files
+        :type input_folder_path: string
+        :param truth_table: Previously computed table, e.g. loaded from a file, None: compute all ratios
+        :type truth_table: comparator.TruthTable
+        :raise ComparatorError: if a file can not be parsed or no scores exist for a location
+        :return: Number of locations whose ratios had to be computed
+        :rtype: int
+        """
+        if truth_table is not None and truth_table.minimum_intersection_ratio == self.minimum_intersection_ratio:
+            self.truth_table = truth_table
+        else:
+            self.truth_table = TruthTable(self.minimum_intersection_ratio)
+
+        computed = 0
+        for (location_name, file_name) in kml_files(input_folder_path, '.truth.kml').items():
+            try:
+                self.truth_polygons[location_name] = read_kml_polygon(input_folder_path + file_name)
+                with open(input_folder_path + file_name, 'rb') as truth_file:
+                    truth_data = truth_file.read()
+            except:
+                raise ComparatorError('Failed to parse KML file "%s".' % file_name)
+            if location_name not in self.locations:
+                raise ComparatorError('Computed polygon not found for location "%s".' % location_name)
+
+            location_scores = self.locations[location_name]
+            key = location_scores.truth_key(truth_data)
+            if not self.truth_table.contains(location_name, key):
+                polygons = {uid: location_scores.polygon(index) for (index, uid) in enumerate(location_scores.uids)}
+                self.truth_table.add_location(location_name, key, self.truth_polygons[location_name], polygons)
+                computed += 1
+        return computed
+
+    def factor_vector(self, factors):
+        """
+        Returns the factors of all classifiers in row order.
+
+        :param factors: Factors to evaluate
+        :type factors: factors.Factors
+        :return: Factors
+        :rtype: numpy.ndarray
+        """
+        return numpy.array([factors.get_factor(name) for name in self.classifier_names], dtype=float)
+
+    def mean_times_ms(self):
+        """
+        Returns the mean classification time per location of every classifier.
+        Locations without measured times are not counted.
+
+        :return: Mean times in milliseconds in row order
+        :rtype: numpy.ndarray
+        """
+        times = [location_scores.times_ms for location_scores in self.locations.values() if location_scores.times_ms is not None]
+        if len(times) == 0:
+            return numpy.zeros(len(self.classifier_names))
+        return numpy.mean(times, axis=0)
+
+    def latency_ms(self, factor_vector, mean_times_ms=None):
+        """
+        Returns the mean classification time per location when only classifiers with a factor other than 0 run
+        (see processor.Processor.skip_zero_weight_classifiers).
+
+        :param factor_vector: Factors in row order
+        :type factor_vector: numpy.ndarray
+        :param mean_times_ms: Result of ScoreTable.mean_times_ms(), None: compute it
+        :type mean_times_ms: numpy.ndarray
+        :return: Time in milliseconds
+        :rtype: float
+        """
+        if mean_times_ms is None:
+            mean_times_ms = self.mean_times_ms()
+        return float(mean_times_ms[factor_vector != 0].sum())
+
+    def intersection_ratio(self, location_name, index):
+        """
+        Returns the intersection ratio between the truth polygon and a way of a location (see self.truth_table).
+
+        :param location_name: Location name
+        :type location_name: string
+        :param index: Index of the way in LocationScores.uids
+        :type index: int
+        :raise shapely.geos.TopologicalError: if the polygons can not be intersected
+        :return: Intersection ratio
+        :rtype: float
+        """
+        uid = self.locations[location_name].uids[index]
+        return self.truth_table.intersection_ratio(location_name, uid, self.use_two_circle_intersection_ratio)
+
+    def evaluate(self, factors):
+        """
+        Determines the winners of all locations with truth polygons for the given factors and compares them.
+
+        :param factors: Factors to evaluate
+        :type factors: factors.Factors
+        :return: Comparator containing the results (see Comparator.passed, Comparator.failed and Comparator.erroneous)
+        :rtype: comparator.Comparator
+        """
+        return self.evaluate_vector(self.factor_vector(factors))
+
+    def evaluate_vector(self, factor_vector, location_names=None):
+        """
+        Like ScoreTable.evaluate() but takes the factors in row order (see ScoreTable.factor_vector()).
+
+        :param factor_vector: Factors of all rows of the scores
+        :type factor_vector: numpy.ndarray
+        :param location_names: Evaluate only these locations with truth polygons, None: all locations
+        :type location_names: list
+        :return: Comparator containing the results (see Comparator.passed, Comparator.failed and Comparator.erroneous)
+        :rtype: comparator.Comparator
+        """
+        if location_names is None:
+            location_names = list(self.truth_polygons.keys())
+        comparator = Comparator(None, None, self.minimum_intersection_ratio, raise_on_critical_error=True, use_two_circle_intersection_ratio=self.use_two_circle_intersection_ratio)
+        for location_name in location_names:
+            index = self.locations[location_name].winner(factor_vector)
+            try:
+                comparator.add_result(location_name, self.intersection_ratio(location_name, index))
+            except shapely.geos.TopologicalError as error:
+                comparator.erroneous[location_name] = error
+        comparator.complete(len(location_names))
+        return comparator
+
+
+# Score table of a process pool worker, see init_pool_worker()
+pool_score_table = None
+
+
+def init_pool_worker(score_table):
+    """
+    Initializer of multiprocessing.Pool workers evaluating factors. The score table is sent once per worker,
+    afterwards only factor vectors are sent (see evaluate_in_pool_worker()).
+
+    :param score_table: Score table to evaluate factors on
+    :type score_table: ScoreTable
+    :return: None
+    """
+    global pool_score_table
+    pool_score_table = score_table
+
+
+def evaluate_in_pool_worker(factor_vector, location_names=None):
+    """
+    Evaluates factors on the score table of the worker (see ScoreTable.evaluate_vector()).
+
+    :param factor_vector: Factors in row order
+    :type factor_vector: numpy.ndarray
+    :param location_names: Evaluate only these locations, None: all locations
+    :type location_names: list
+    :return: Comparator containing the results
+    :rtype: comparator.Comparator
+    """
+    return pool_score_table.evaluate_vector(factor_vector, location_names)
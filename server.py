@@ -23,12 +23,14 @@ import http.server
 import hashlib
 import base64
 import sys
+import concurrent.futures
 
 import PIL.Image
 
 from kml import *
 from location import *
 from overpass import *
+from extract import *
 from processor import *
 from factors import *
 from generated import *
@@ -58,7 +60,10 @@ def default_settings():
         'computed_kml_suffix': '.computed.kml',
         'json_file_suffix': '.json',
         'maximum_image_height': 350,
-        'maximum_image_width': 350
+        'maximum_image_width': 350,
+        'classifier_threads': 0,  # 0: run classifiers sequentially
+        'prune_ways': False,  # True: stop rating ways which can no longer win, classifiers then run sequentially
+        'osm_extract_file_path': None  # Local *.osm extract to use instead of the Overpass API, None: use the Overpass API
     }
 
 
@@ -94,6 +99,10 @@ def format_header(settings):
     header += item('Cache folder path', os.path.abspath(settings['cache_folder_path']))
     header += item('Images folder path', os.path.abspath(settings['images_folder_path']))
     header += item('Temporary files folder path', os.path.abspath(settings['tmp_files_folder_path']))
+    header += item('Classifier threads', settings['classifier_threads'])
+    header += item('Prune ways', settings['prune_ways'])
+    if settings['osm_extract_file_path'] is not None:
+        header += item('OSM extract path', os.path.abspath(settings['osm_extract_file_path']))
 
     return header
 
@@ -281,19 +290,26 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_json({'result': 'failure', 'reason': 'Could not create folder for temporary files.'})
                 return
 
-        osm_file_path = self.server.settings['tmp_files_folder_path'] + 'manual.osm'
-        try:
-            overpass = Overpass(osm_file_path)
-            overpass.query_by_lat_lon_and_radius(lat, lon, radius)
-        except:
-            self.send_json({'result': 'failure', 'reason': 'Error querying Overpass API.'})
-            return
+        if self.server.osm_extract is not None:
+            try:
+                osm = self.server.osm_extract.osm(lat, lon, radius)
+            except:
+                self.send_json({'result': 'failure', 'reason': 'Error querying OSM extract.'})
+                return
+        else:
+            osm_file_path = self.server.settings['tmp_files_folder_path'] + 'manual.osm'
+            try:
+                overpass = Overpass(osm_file_path)
+                overpass.query_by_lat_lon_and_radius(lat, lon, radius)
+            except:
+                self.send_json({'result': 'failure', 'reason': 'Error querying Overpass API.'})
+                return
 
-        try:
-            osm = OSM(xml.etree.ElementTree.parse(osm_file_path))
-        except:
-            self.send_json({'result': 'failure', 'reason': 'Error parsing Overpass OSM data.'})
-            return
+            try:
+                osm = OSM(xml.etree.ElementTree.parse(osm_file_path))
+            except:
+                self.send_json({'result': 'failure', 'reason': 'Error parsing Overpass OSM data.'})
+                return
         location.add_osm(osm)
 
         generated = GeneratedFromOSMNode(location)
@@ -322,6 +338,8 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         except Exception as exception:
             print('Failed to load factors file. Using default factors. Exception: %s' % str(exception), file=sys.stderr)
         processor = Processor(location, factors, self.server.settings['tmp_files_folder_path'], True)
+        processor.thread_pool = self.server.classifier_thread_pool
+        processor.prune_ways = self.server.settings['prune_ways']
         try:
             totals = processor.run()
         except Exception as exception:
@@ -442,13 +460,22 @@ class Server(http.server.HTTPServer):
         """
         Calls http.server.HTTPServer.__init__() and stores the given settings
         to self.settings. This makes them available to the request handler.
+        Creates the thread pool shared by all requests if settings['classifier_threads'] is positive
+        and loads the OSM extract if settings['osm_extract_file_path'] is set.
 
         :param settings: server settings (Default: server.default_settings())
         :type settings: dict
+        :raise xml.etree.ElementTree.ParseError: if the OSM extract can not be parsed
         :return: None
         """
         http.server.HTTPServer.__init__(self, *args, **kwargs)
         self.settings = settings
+        self.classifier_thread_pool = None
+        if settings['classifier_threads'] > 0:
+            self.classifier_thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=settings['classifier_threads'])
+        self.osm_extract = None
+        if settings['osm_extract_file_path'] is not None:
+            self.osm_extract = OSMExtract(settings['osm_extract_file_path'])
 
     def start(self):
         """
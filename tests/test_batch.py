@@ -17,9 +17,22 @@
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import contextlib
+import http.server
+import io
 import shutil
 import subprocess
 import os
+import json
+import tempfile
+import threading
+import time
+
+import shapely.geometry
+
+import batch
+from location import *
+from overpass import *
 
 class TestBatch(unittest.TestCase):
     def setUp(self):
@@ -46,10 +59,171 @@ class TestBatch(unittest.TestCase):
         self.assertTrue(os.path.isfile('./output/0001.json'), 'Missing JSON file from output')
         self.assertTrue(os.path.isfile('./output/0001.points.csv'), 'Missing CSV file from output')
 
+    def test_statistics(self):
+        self.assertEqual(0, self.run_batch(['--skip-cache-update']))
+        with open('./output/0001.json') as json_file:
+            statistics = json.loads(json_file.read())['statistics']
+        self.assertIn('Proximity (closest edge)', statistics)
+        self.assertEqual(set(statistics['Point in polygon'].keys()), {'time_ms', 'ways', 'geometry_operations'})
+        with open('./log/icup_batch.log') as log_file:
+            self.assertIn('Classifier statistics (1 locations)', log_file.read())
+
+    def test_rescore(self):
+        self.assertEqual(0, self.run_batch(['--skip-cache-update', '--score-store', './scores', '-f', './data/factors.txt']))
+        self.assertTrue(os.path.isfile('./scores/scores_0.npz'), 'Missing score file')
+        with open('./output/0001.computed.kml') as kml_file:
+            expected = kml_file.read()
+        self.assertEqual(0, self.run_batch(['--score-store', './scores', '--rescore', './data/factors.txt', '-o', './output/rescore']))
+        with open('./output/rescore/0001.computed.kml') as kml_file:
+            self.assertEqual(kml_file.read(), expected)
+        self.assertTrue(os.path.isfile('./output/rescore/0001.jpg'), 'Missing image file from output')
+        self.assertEqual(1, self.run_batch(['--rescore', './data/factors.txt']))
+
+    def test_work_queue(self):
+        self.assertEqual(0, self.run_batch(['--skip-cache-update', '-j', '2', '--chunk-size', '1', '--largest-first']))
+        self.assertTrue(os.path.isfile('./output/0001.computed.kml'), 'Missing KML file from output')
+        with open('./log/icup_batch.log') as log_file:
+            self.assertIn('1 chunk(s)', log_file.read())
+
+    def test_failed_fetch(self):
+        # Nothing listens on port 1, the outdated cache file is used
+        self.assertEqual(0, self.run_batch(['-u', '--overpass-url', 'http://127.0.0.1:1/api/interpreter', '--overpass-retries', '1']))
+        self.assertTrue(os.path.isfile('./output/0001.computed.kml'), 'Missing KML file from output')
+        with open('./log/icup_process_0.log') as log_file:
+            self.assertIn('using outdated file', log_file.read())
+
+    def test_osm_extract(self):
+        self.assertEqual(0, self.run_batch(['--skip-cache-update']))
+        with open('./output/0001.computed.kml') as kml_file:
+            expected = kml_file.read()
+        # The cache file is the Overpass API result of the location
+        self.assertEqual(0, self.run_batch(['--osm-extract', './cache/0001.osm', '-o', './output/extract']))
+        with open('./output/extract/0001.computed.kml') as kml_file:
+            self.assertEqual(kml_file.read(), expected)
+        self.assertEqual(0, self.run_batch(['--osm-extract', './cache/0001.osm', '--spatial-join', '-o', './output/join']))
+        with open('./output/join/0001.computed.kml') as kml_file:
+            self.assertEqual(kml_file.read(), expected)
+        self.assertEqual(1, self.run_batch(['--osm-extract', './cache/missing.osm', '-o', './output/extract']))
+        self.assertEqual(1, self.run_batch(['--osm-extract-to-cache']))
+        self.assertEqual(1, self.run_batch(['--spatial-join']))
+        self.assertEqual(1, self.run_batch(['--osm-extract', './cache/0001.osm', '--spatial-join', '--osm-extract-to-cache']))
+        self.assertEqual(1, self.run_batch(['--osm-extract', './cache/0001.osm', '--spatial-join', '--overpass-radius', '0']))
+
     def tearDown(self):
+        if os.path.exists('./scores'):
+            shutil.rmtree('./scores')
         if os.path.exists('./log'):
             shutil.rmtree('./log')
         if os.path.exists('./output'):
             shutil.rmtree('./output')
         os.chdir('..')
-        os.chdir('..')
\ No newline at end of file
+        os.chdir('..')
+
+
+class TestChunkLocations(unittest.TestCase):
+    def test_chunk_locations(self):
+        locations = {'0001': 'a', '0002': 'b', '0003': 'c', '0004': 'd', '0005': 'e'}
+        settings = batch.default_settings()
+        settings['cache_folder_path'] = './tests/'
+        settings['jobs'] = 1
+        self.assertEqual([list(chunk.keys()) for chunk in batch.chunk_locations(locations, settings)], [['0001', '0002'], ['0003', '0004'], ['0005']])
+        settings['chunk_size'] = 3
+        self.assertEqual([list(chunk.keys()) for chunk in batch.chunk_locations(locations, settings)], [['0001', '0002', '0003'], ['0004', '0005']])
+
+        # ./tests/0002.osm is larger than ./tests/0001.osm, the others do not exist
+        settings['largest_first'] = True
+        chunks = batch.chunk_locations(locations, settings)
+        self.assertEqual([list(chunk.keys()) for chunk in chunks], [['0002', '0001', '0003'], ['0004', '0005']])
+        self.assertEqual(chunks[0]['0002'], 'b')
+
+
+class TestFetchLocation(unittest.TestCase):
+    def test_skipped_location(self):
+        settings = batch.default_settings()
+        settings['quiet_mode'] = True
+        # Nothing listens on port 1
+        client = OverpassClient(['http://127.0.0.1:1/api/interpreter'], retries=0, timeout=5)
+        location = Location('0001', shapely.geometry.Point(10.21322326, 53.5038433))
+        log_file = io.StringIO()
+        with tempfile.TemporaryDirectory() as folder_path:
+            settings['cache_folder_path'] = folder_path + os.path.sep
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertIsNone(batch.fetch_location(location, settings, log_file, client))
+            self.assertEqual(os.listdir(folder_path), [])
+        client.close()
+        self.assertIn('skipping location "0001"', log_file.getvalue())
+
+
+class TestWorkerTask(unittest.TestCase):
+    def test_exception(self):
+        # Locations without a point make the pipeline raise an AttributeError
+        settings = batch.default_settings()
+        settings['quiet_mode'] = True
+        with tempfile.TemporaryDirectory() as folder_path:
+            settings['log_folder_path'] = folder_path + os.path.sep
+            settings['output_folder_path'] = folder_path + os.path.sep
+            settings['skip_cache_update'] = True
+            settings['factors_file_path'] = 'tests/factors.txt'
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertEqual(batch.worker_task(({'0001': 'a'}, 3, settings)), (3, False))
+                self.assertEqual(batch.score_worker_task(({'0001': 'a'}, 4, settings)), (4, None))
+            self.assertIn('Process 3 failed', stderr.getvalue())
+            for worker_id in (3, 4):
+                with open(os.path.join(folder_path, 'process_%d.log' % worker_id)) as log_file:
+                    self.assertIn('AttributeError', log_file.read())
+
+
+class ConcurrencyHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.maximum_active = max(self.server.maximum_active, self.server.active)
+        time.sleep(0.2)
+        with self.server.lock:
+            self.server.active -= 1
+        body = b'<osm version="0.6"></osm>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def prepare_locations(arguments):
+    locations, settings = arguments
+    return [location.name for location in batch.prepared_locations(locations, settings, io.StringIO())]
+
+
+class TestFetchConcurrency(unittest.TestCase):
+    def test_fetch_concurrency(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ConcurrencyHandler)
+        server.daemon_threads = True
+        server.lock = threading.Lock()
+        server.active = 0
+        server.maximum_active = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        settings = batch.default_settings()
+        settings['quiet_mode'] = True
+        settings['force_cache_update'] = True
+        settings['jobs'] = 2
+        settings['fetch_concurrency'] = 2
+        settings['overpass_urls'] = ['http://127.0.0.1:%d/api/interpreter' % server.server_address[1]]
+        with tempfile.TemporaryDirectory() as folder_path:
+            settings['cache_folder_path'] = folder_path + os.path.sep
+            chunks = [({'%d%d' % (chunk, i): Location('%d%d' % (chunk, i), shapely.geometry.Point(10.2, 53.5)) for i in range(4)}, settings)
+                      for chunk in range(2)]
+            pool = batch.create_pool(settings)
+            try:
+                names = pool.map(prepare_locations, chunks)
+            finally:
+                pool.terminate()
+        server.shutdown()
+        server.server_close()
+        self.assertEqual(names, [['00', '01', '02', '03'], ['10', '11', '12', '13']])
+        # Both processes fetch with 2 threads each, but only 2 requests of all processes are sent at the same time
+        self.assertLessEqual(server.maximum_active, 2)
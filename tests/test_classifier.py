@@ -17,6 +17,8 @@
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import os
+import tempfile
 import xml.etree.ElementTree
 
 from classifier import *
@@ -54,3 +56,76 @@ class TestClassifier(unittest.TestCase):
                 self.assertTrue(points[key] >= -100, 'Failure in %s: Points (%i) less than -100' % (classifier.name(), points[key]))
                 self.assertIn(key, ['osm_100', 'osm_200', 'osm_300'], 'Failure in %s: Unknown key %s' % (classifier.name(), key))
             self.assertEqual(len(points), 3, 'Failure in %s: Wrong number of entries' % classifier.name())
+
+
+class TestSUROSMRules(unittest.TestCase):
+    def setUp(self):
+        self.rules = SUROSMRules.load_file('tests/sur_osm_mapping.txt')
+
+    def naive_points(self, rules, surs, tags):
+        points = 0
+        for (sur_key, sur_value) in surs.items():
+            for m in rules:
+                if (m[0] == '*' or m[0] == sur_key) and (m[1] == '*' or m[1] == sur_value) and m[2] in tags and (m[3] == '*' or tags[m[2]] == m[3]):
+                    points += m[4]
+        return points
+
+    def test_load_file(self):
+        self.assertEqual(len(self.rules.rules), 4)
+        self.assertEqual(self.rules.rules[0], ('smoking', 'no', 'building', '*', 10))
+
+        (handle, file_path) = tempfile.mkstemp(suffix='.txt')
+        os.close(handle)
+        try:
+            for (content, line) in [('smoking, no, building, *, 10\ninvalid line\n', 2), ('# Comment\n\nsmoking, no, building, *, ten\n', 3)]:
+                with open(file_path, 'w') as rule_file:
+                    rule_file.write(content)
+                with self.assertRaises(ValueError) as context:
+                    SUROSMRules.load_file(file_path)
+                self.assertIn('Line %d' % line, str(context.exception))
+        finally:
+            os.remove(file_path)
+
+    def test_points(self):
+        tags_list = [{'building': 'roof'}, {'building': 'yes', 'highway': 'path'}, {'amenity': 'parking'}, {'shop': 'bakery'}]
+        surs_list = [{'smoking': 'no'}, {'parking': 'yes', 'food': 'no'}, {'dog_waste': 'no', 'smoking': 'no'}]
+        for rules in [self.rules, default_sur_osm_rules]:
+            for surs in surs_list:
+                buckets = []
+                for (sur_key, sur_value) in surs.items():
+                    buckets += rules.buckets(sur_key, sur_value)
+                for tags in tags_list:
+                    self.assertEqual(SUROSMRules.points(buckets, tags), self.naive_points(rules.rules, surs, tags))
+
+    def test_classifier(self):
+        location = Location('2', shapely.geometry.Point(1.0, 1.0))
+        location.surs['smoking'] = 'no'
+        location.add_osm(OSM(xml.etree.ElementTree.parse('tests/0002.osm').getroot()))
+        points = SUROSMMapping(location, self.rules).classify()
+        self.assertEqual(points, {'osm_100': 100, 'osm_200': -100, 'osm_300': 0})
+
+
+class TestRegistry(unittest.TestCase):
+    def test_registered_classifiers(self):
+        self.assertEqual(len(registered_classifiers()), len(get_classifiers_list(None)))
+        self.assertNotIn(ImageProcessing, registered_classifiers(exclude_slow_classifiers=True))
+        for classifier_class in registered_classifiers():
+            self.assertTrue(issubclass(classifier_class, Classifier))
+            self.assertIsNotNone(classifier_name(classifier_class))
+
+    def test_skip_reason(self):
+        location = Location('2', shapely.geometry.Point(1.0, 1.0))
+        self.assertEqual(skip_reason(ExifDirection, location), 'not applicable')
+        self.assertEqual(skip_reason(SURDescription, location), 'not applicable')
+        self.assertIsNone(skip_reason(PointInPolygon, location))
+        location.gps_info['direction'] = 90.0
+        location.surs['smoking'] = 'no'
+        self.assertIsNone(skip_reason(ExifDirection, location))
+        self.assertIsNone(skip_reason(SURDescription, location))
+
+    def test_inapplicable_classifiers_score_zero(self):
+        location = Location('2', shapely.geometry.Point(1.0, 1.0))
+        location.add_osm(OSM(xml.etree.ElementTree.parse('tests/0002.osm').getroot()))
+        for classifier_class in registered_classifiers():
+            if skip_reason(classifier_class, location) is not None:
+                self.assertEqual(set(create_classifier(classifier_class, location).classify().values()), {0})
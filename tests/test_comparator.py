@@ -17,6 +17,8 @@
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import os
+import tempfile
 import comparator
 
 class TestComparator(unittest.TestCase):
@@ -31,4 +33,29 @@ class TestComparator(unittest.TestCase):
         except:
             self.fail('Test failed with unknown exception')
         self.assertEqual(set(self.comparator.passed.keys()), {'correct1', 'correct2'})
-        self.assertEqual(set(self.comparator.failed.keys()), {'incorrect1', 'incorrect2'})
\ No newline at end of file
+        self.assertEqual(set(self.comparator.failed.keys()), {'incorrect1', 'incorrect2'})
+
+class TestTruthTable(unittest.TestCase):
+    def setUp(self):
+        self.truth_polygon = comparator.read_kml_polygon('./tests/comparator/input/correct1.truth.kml')
+        self.polygons = {name: comparator.read_kml_polygon('./tests/comparator/output/%s.computed.kml' % name)
+                         for name in ('correct1', 'incorrect1')}
+        self.table = comparator.TruthTable(0.7)
+        self.table.add_location('correct1', 'key', self.truth_polygon, self.polygons)
+
+    def test_intersection_ratio(self):
+        self.assertTrue(self.table.contains('correct1', 'key'))
+        self.assertFalse(self.table.contains('correct1', 'other key'))
+        self.assertFalse(self.table.contains('correct2', 'key'))
+        for (uid, polygon) in self.polygons.items():
+            for use_two_circle_intersection_ratio in (False, True):
+                expected = comparator.intersection_ratio(self.truth_polygon, polygon, 0.7, use_two_circle_intersection_ratio)
+                self.assertEqual(self.table.intersection_ratio('correct1', uid, use_two_circle_intersection_ratio), expected)
+
+    def test_save_file(self):
+        with tempfile.TemporaryDirectory() as folder_path:
+            path = os.path.join(folder_path, 'truth_table.json')
+            self.table.save_file(path)
+            table = comparator.TruthTable.load_file(path)
+        self.assertEqual(table.minimum_intersection_ratio, 0.7)
+        self.assertEqual(table.locations, self.table.locations)
@@ -0,0 +1,75 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import xml.etree.ElementTree
+
+import shapely.geometry
+
+from distance import *
+from osm import *
+
+
+class TestDistance(unittest.TestCase):
+    def setUp(self):
+        osm = OSM(xml.etree.ElementTree.parse('tests/batch_test_files/cache/0001.osm').getroot())
+        self.uids = list(osm.ways.keys())
+        self.ways = list(osm.ways.values())
+        self.points = [shapely.geometry.Point(10.21322326, 53.5038433), shapely.geometry.Point(10.2145, 53.5031)]
+
+    def test_vertex_distances(self):
+        for point in self.points:
+            distances = vertex_distances(point, self.ways)
+            for (way, distance) in zip(self.ways, distances):
+                expected = min(point.distance(shapely.geometry.Point(c)) for c in way.polygon.exterior.coords)
+                self.assertEqual(distance, expected)
+
+    def test_edge_distances(self):
+        for point in self.points:
+            distances = edge_distances(point, self.ways)
+            for (way, distance) in zip(self.ways, distances):
+                coords = way.polygon.exterior.coords
+                expected = min(point.distance(shapely.geometry.LineString([coords[i], coords[i + 1]])) for i in range(len(coords) - 1))
+                self.assertEqual(distance, expected)
+
+    def test_centroid_distances(self):
+        for point in self.points:
+            distances = centroid_distances(point, self.ways)
+            for (way, distance) in zip(self.ways, distances):
+                self.assertEqual(distance, point.distance(way.polygon.centroid))
+
+    def test_empty(self):
+        self.assertEqual(len(edge_distances(self.points[0], [])), 0)
+        self.assertEqual(len(vertex_distances(self.points[0], [])), 0)
+        self.assertEqual(len(centroid_distances(self.points[0], [])), 0)
+
+    def test_rank_points(self):
+        points = rank_points(['a', 'b', 'c', 'd'], numpy.array([3.0, 1.0, 3.0, 2.0]))
+        self.assertEqual(points, {'b': 100, 'd': 75, 'a': 50, 'c': 25})
+        points = rank_points([str(i) for i in range(10)], numpy.arange(10.0))
+        self.assertEqual(points['8'], -100)
+        self.assertEqual(points['9'], -100)
+
+    def test_rank_points_of(self):
+        for point in self.points:
+            for measure in (edge_distances, vertex_distances, centroid_distances):
+                expected = rank_points(self.uids, measure(point, self.ways))
+                for subset in (self.uids[:3], self.uids[-5:], [self.uids[10]]):
+                    points, measured = rank_points_of(point, dict(zip(self.uids, self.ways)), self.uids, subset, measure)
+                    self.assertEqual(points, {uid: expected[uid] for uid in subset})
+                    self.assertLess(len(measured), len(self.uids))
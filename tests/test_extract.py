@@ -0,0 +1,130 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import math
+import os
+import tempfile
+import xml.etree.ElementTree
+
+import numpy
+import shapely.geometry
+
+from extract import *
+from location import *
+
+
+class TestGridIndex(unittest.TestCase):
+    def test_query(self):
+        bounds = numpy.array([[0.0, 0.0, 0.5, 0.5], [1.5, 1.5, 3.5, 2.5], [-1.0, -1.0, -0.5, -0.5]])
+        index = GridIndex(bounds, 1.0)
+        self.assertEqual(list(index.query(0.2, 0.2, 0.3, 0.3)), [0])
+        self.assertEqual(list(index.query(3.1, 2.1, 3.2, 2.2)), [1])
+        self.assertEqual(list(index.query(-0.7, -0.7, 1.7, 1.7)), [0, 1, 2])
+        self.assertEqual(list(index.query(10.0, 10.0, 11.0, 11.0)), [])
+
+        # The second box covers six cells and is returned by every query
+        index = GridIndex(bounds, 1.0, maximum_cells=4)
+        self.assertEqual(list(index.large), [1])
+        self.assertEqual(list(index.query(0.2, 0.2, 0.3, 0.3)), [0, 1])
+        self.assertEqual(list(index.query(-0.7, -0.7, 1.7, 1.7)), [0, 1, 2])
+        self.assertEqual(list(index.query(10.0, 10.0, 11.0, 11.0)), [1])
+        (queries, items) = index.pairs(numpy.array([[0.2, 0.2, 0.3, 0.3], [-0.7, -0.7, -0.6, -0.6]]))
+        self.assertEqual(sorted(zip(queries, items)), [(0, 0), (0, 1), (1, 1), (1, 2)])
+
+
+class TestOSMExtract(unittest.TestCase):
+    def setUp(self):
+        # Overpass API result of the location of the batch tests (radius 200)
+        self.file_path = 'tests/batch_test_files/cache/0001.osm'
+        self.extract = OSMExtract(self.file_path)
+        self.lat = 53.5038433
+        self.lon = 10.21322326
+
+    def test_overpass_result(self):
+        root = xml.etree.ElementTree.parse(self.file_path).getroot()
+        (nodes, ways) = self.extract.query(self.lat, self.lon, 200)
+        self.assertEqual([self.extract.node_ids[i] for i in nodes], [node.attrib['id'] for node in root.findall('node')])
+        self.assertEqual([self.extract.way_ids[i] for i in ways], [way.attrib['id'] for way in root.findall('way')])
+
+        expected = OSM(root)
+        osm = self.extract.osm(self.lat, self.lon, 200)
+        self.assertEqual(list(osm.ways.keys()), list(expected.ways.keys()))
+        for (uid, way) in expected.ways.items():
+            self.assertTrue(osm.ways[uid].polygon.equals_exact(way.polygon, 0))
+            self.assertEqual(osm.ways[uid].tags, way.tags)
+        for (uid, node) in expected.nodes.items():
+            self.assertTrue(osm.nodes[uid].point.equals_exact(node.point, 0))
+            self.assertEqual(osm.nodes[uid].tags, node.tags)
+
+    def test_radius(self):
+        scale = numpy.array([meters_per_degree * math.cos(math.radians(self.lat)), meters_per_degree])
+        for radius in (10, 50, 120):
+            (nodes, ways) = self.extract.query(self.lat, self.lon, radius)
+            for i in range(len(self.extract.way_ids)):
+                coordinates = (self.extract.node_coordinates[self.extract.way_refs[self.extract.way_offsets[i]:self.extract.way_offsets[i + 1]]] - (self.lon, self.lat)) * scale
+                geometry = shapely.geometry.LineString(coordinates) if len(coordinates) > 1 else shapely.geometry.Point(coordinates[0])
+                self.assertEqual(i in ways, geometry.distance(shapely.geometry.Point(0, 0)) <= radius)
+            way_nodes = set(self.extract.way_refs[numpy.concatenate([numpy.arange(self.extract.way_offsets[i], self.extract.way_offsets[i + 1]) for i in ways])])
+            for i in range(len(self.extract.node_ids)):
+                distance = numpy.hypot(*((self.extract.node_coordinates[i] - (self.lon, self.lat)) * scale))
+                self.assertEqual(i in nodes, distance <= radius or i in way_nodes)
+
+    def test_local_extract(self):
+        (handle, file_path) = tempfile.mkstemp(suffix='.osm')
+        os.close(handle)
+        try:
+            local_extract = LocalExtract(file_path, self.extract)
+            local_extract.query_by_lat_lon_and_radius(self.lat, self.lon, 50)
+            self.assertEqual(local_extract.file_size, os.path.getsize(file_path))
+            osm = OSM(xml.etree.ElementTree.parse(file_path).getroot())
+            expected = self.extract.osm(self.lat, self.lon, 50)
+            self.assertEqual(list(osm.ways.keys()), list(expected.ways.keys()))
+            self.assertEqual(list(osm.nodes.keys()), list(expected.nodes.keys()))
+        finally:
+            os.remove(file_path)
+
+    def test_join(self):
+        points = [(self.lat + dlat, self.lon + dlon) for dlat in (-0.001, 0, 0.0015) for dlon in (-0.002, 0, 0.001)]
+        for radius in (20, 100):
+            for ((lat, lon), (nodes, ways)) in zip(points, self.extract.join(points, radius, block_size=4)):
+                (expected_nodes, expected_ways) = self.extract.query(lat, lon, radius)
+                self.assertEqual(list(nodes), list(expected_nodes))
+                self.assertEqual(list(ways), list(expected_ways))
+        self.assertEqual(self.extract.join([], 100), [])
+
+    def test_spatial_join(self):
+        locations = {}
+        for (i, (dlat, dlon)) in enumerate([(0, 0), (0.0005, 0.0005), (-0.001, 0.001)]):
+            locations[str(i)] = Location(str(i), shapely.geometry.Point(self.lon + dlon, self.lat + dlat))
+        spatial_join = SpatialJoin(self.extract, locations, 100)
+        for location in locations.values():
+            expected = Location(location.name, location.point)
+            expected.add_osm(self.extract.osm(location.point.y, location.point.x, 100))
+            expected.add_generated(GeneratedFromOSMNode(expected))
+            spatial_join.add_to_location(location)
+            self.assertEqual(list(location.nodes.keys()), list(expected.nodes.keys()))
+            self.assertEqual(list(location.ways.keys()), list(expected.ways.keys()))
+            for (uid, way) in expected.ways.items():
+                self.assertTrue(location.ways[uid].polygon.equals_exact(way.polygon, 0))
+                self.assertEqual(location.ways[uid].tags, way.tags)
+        # Close locations share the features
+        shared = set(locations['0'].ways.keys()) & set(locations['1'].ways.keys())
+        self.assertGreater(len(shared), 0)
+        for uid in shared:
+            self.assertIs(locations['0'].ways[uid], locations['1'].ways[uid])
@@ -0,0 +1,62 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import tempfile
+
+from fitness_cache import *
+from factors import *
+
+
+class TestFitnessCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = FitnessCache(['A', 'B'], 0.001, 'fingerprint')
+        self.factors = Factors()
+        self.factors.factors = {'A': 0.5, 'B': 2.0}
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get(self.factors))
+        self.cache.add(self.factors, 0.75)
+        similar_factors = Factors()
+        similar_factors.factors = {'A': 0.5000001, 'B': 2.0, 'C': 3.0}
+        self.assertEqual(self.cache.get(similar_factors), 0.75)
+        similar_factors.factors['B'] = 2.1
+        self.assertIsNone(self.cache.get(similar_factors))
+        self.assertEqual(self.cache.lookups, 3)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertAlmostEqual(self.cache.hit_rate(), 1 / 3)
+
+    def test_missing_factor(self):
+        self.cache.add(self.factors, 0.75)
+        factors = Factors()
+        factors.factors = {'A': 0.5}
+        self.assertNotEqual(self.cache.key(factors), self.cache.key(self.factors))
+        factors.factors = {'A': 1.0, 'B': 1.0}
+        self.assertEqual(self.cache.key(factors), self.cache.key(Factors()))
+
+    def test_save_file(self):
+        self.cache.add(self.factors, 0.75)
+        with tempfile.TemporaryDirectory() as folder_path:
+            path = os.path.join(folder_path, 'fitness.json')
+            self.cache.save_file(path)
+            cache = FitnessCache.load_file(path, ['A', 'B'], 0.001, 'fingerprint')
+            self.assertEqual(cache.get(self.factors), 0.75)
+            self.assertRaises(ValueError, FitnessCache.load_file, path, ['A', 'B'], 0.001, 'other fingerprint')
+            self.assertRaises(ValueError, FitnessCache.load_file, path, ['A'], 0.001, 'fingerprint')
+            self.assertRaises(ValueError, FitnessCache.load_file, path, ['A', 'B'], 0.01, 'fingerprint')
@@ -17,6 +17,7 @@
 # along with SPtP. If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+import pickle
 
 import shapely
 
@@ -52,4 +53,51 @@ class TestWay(unittest.TestCase):
         json = self.way.json_serializable()
         self.assertEqual(json['name'], '3')
         self.assertEqual(json['tags'], {'test': 'test', 'cake': 'lie'})
-        self.assertEqual(json['polygon'], [[1., 1.], [2., 2.], [2., 1.], [1., 1.]])
\ No newline at end of file
+        self.assertEqual(json['polygon'], [[1., 1.], [2., 2.], [2., 1.], [1., 1.]])
+
+    def test_geometry_cache(self):
+        self.assertEqual(self.way.coordinates().tolist(), [[1., 1.], [2., 2.], [1., 2.], [1., 1.]])
+        self.assertEqual(self.way.bounds(), (1., 1., 2., 2.))
+        self.assertEqual(self.way.area(), 0.5)
+        self.assertEqual(self.way.centroid().xy, self.way.polygon.centroid.xy)
+        self.assertTrue(self.way.prepared().contains(shapely.geometry.Point(1.2, 1.5)))
+        self.assertIs(self.way.prepared(), self.way.prepared())
+
+    def test_pickle(self):
+        self.way.prepared()
+        way = pickle.loads(pickle.dumps(self.way))
+        self.assertEqual(way.name, '3')
+        self.assertTrue(way.prepared().contains(shapely.geometry.Point(1.2, 1.5)))
+
+class TestWayIndex(unittest.TestCase):
+    def setUp(self):
+        self.ways = {
+            'a': Way('a', {}, shapely.geometry.Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])),
+            'b': Way('b', {}, shapely.geometry.Polygon([(2, 2), (3, 2), (3, 3)])),
+            'c': Way('c', {}, shapely.geometry.Polygon([(0, 0), (3, 0), (3, 3)])),
+        }
+        self.index = WayIndex(self.ways)
+
+    def test_query_point(self):
+        self.assertEqual(self.index.query(shapely.geometry.Point(0.5, 0.5)), ['a', 'c'])
+        self.assertEqual(self.index.query(shapely.geometry.Point(2.5, 2.5)), ['b', 'c'])
+        self.assertEqual(self.index.query(shapely.geometry.Point(5, 5)), [])
+
+    def test_query_line(self):
+        self.assertEqual(self.index.query(shapely.geometry.LineString([(0.5, 0.5), (2.5, 2.5)])), ['a', 'b', 'c'])
+
+    def test_empty(self):
+        self.assertEqual(WayIndex({}).query(shapely.geometry.Point(0, 0)), [])
+
+
+class TestCategories(unittest.TestCase):
+    def test_tag_categories(self):
+        self.assertEqual(tag_categories({}), 0)
+        self.assertEqual(tag_categories({'building': 'yes'}), category_building)
+        self.assertEqual(tag_categories({'landuse': 'retail'}), category_building | category_outside)
+        self.assertEqual(tag_categories({'landuse': 'basin'}), category_outside | category_water)
+        self.assertEqual(tag_categories({'highway': 'path', 'waterway': 'river'}), category_street | category_water)
+
+    def test_way(self):
+        way = Way('1', {'natural': 'water'}, shapely.geometry.Polygon([(1, 1), (2, 2), (1, 2)]))
+        self.assertEqual(way.categories, category_outside | category_water)
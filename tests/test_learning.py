@@ -0,0 +1,129 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import pickle
+import random
+import tempfile
+
+import run_learning
+from fitness_cache import *
+from factors import *
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_save_checkpoint(self):
+        factors = Factors()
+        factors.factors = {'A': 0.5}
+        fitness_cache = FitnessCache(['A'])
+        fitness_cache.add(factors, 0.25)
+        state = {
+            'version': run_learning.checkpoint_version,
+            'settings': run_learning.default_settings(),
+            'round': 3,
+            'population': [(factors, 0.25)],
+            'winner': factors,
+            'pareto_front': [],
+            'fitness_cache': fitness_cache,
+            'duplicates': 0,
+            'raced_out': 0,
+            'random_state': random.getstate()
+        }
+        with tempfile.TemporaryDirectory() as folder_path:
+            path = os.path.join(folder_path, 'checkpoint.pickle')
+            run_learning.save_checkpoint(path, state)
+            loaded_state = run_learning.load_checkpoint(path)
+            self.assertFalse(os.path.exists(path + '.tmp'))
+
+            with open(path, 'wb') as checkpoint_file:
+                pickle.dump({'version': 0}, checkpoint_file)
+            self.assertRaises(ValueError, run_learning.load_checkpoint, path)
+            # Written before the Pareto front and the latency settings were saved
+            with open(path, 'wb') as checkpoint_file:
+                pickle.dump(dict(state, version=1), checkpoint_file)
+            with self.assertRaises(ValueError) as context:
+                run_learning.load_checkpoint(path)
+            self.assertIn('version 1', str(context.exception))
+
+        self.assertEqual(loaded_state['round'], 3)
+        self.assertEqual(loaded_state['settings'], state['settings'])
+        self.assertEqual(loaded_state['population'][0][0].factors, {'A': 0.5})
+        self.assertEqual(loaded_state['fitness_cache'].get(factors), 0.25)
+        random.setstate(loaded_state['random_state'])
+        expected = random.random()
+        random.setstate(state['random_state'])
+        self.assertEqual(random.random(), expected)
+
+
+class TestParetoFront(unittest.TestCase):
+    def test_pareto_front(self):
+        individuals = []
+        for (value, accuracy, latency) in ((1.0, 0.5, 10.0), (2.0, 0.7, 30.0), (3.0, 0.6, 40.0), (4.0, 0.4, 5.0), (5.0, 0.5, 20.0)):
+            factors = Factors()
+            factors.factors = {'A': value}
+            individuals.append((factors, accuracy, latency))
+        front = run_learning.pareto_front(individuals)
+        self.assertEqual([f.factors['A'] for (f, accuracy, latency) in front], [4.0, 1.0, 2.0])
+
+        with tempfile.TemporaryDirectory() as folder_path:
+            run_learning.write_pareto_front(os.path.join(folder_path, 'pareto'), front)
+            factors = Factors()
+            factors.load_file(os.path.join(folder_path, 'pareto', 'factors_1.txt'))
+            with open(os.path.join(folder_path, 'pareto', 'pareto.txt')) as overview_file:
+                lines = overview_file.read().splitlines()
+        self.assertEqual(factors.factors, {'A': 1.0})
+        self.assertEqual(lines[2], 'factors_1.txt, 0.500000, 10.000000')
+
+
+class TestRace(unittest.TestCase):
+    def test_race(self):
+        children = []
+        for value in (3.0, 8.0, 1.0, 6.0, 5.0, 2.0, 7.0, 4.0):
+            factors = Factors()
+            factors.factors = {'A': value}
+            children.append(factors)
+        location_names = ['%04d' % i for i in range(10)]
+        subsets = []
+
+        def evaluate(factors_list, subset):
+            subsets.append(subset)
+            return [f.factors['A'] for f in factors_list]
+
+        settings = run_learning.default_settings()
+        settings['racing_subset_sizes'] = [2, 4, 10]
+        settings['racing_promotion_ratio'] = 0.5
+        promoted = run_learning.race(children, location_names, evaluate, settings)
+        # The best half is promoted in the given order, no stage for all locations
+        self.assertEqual([f.factors['A'] for f in promoted], [8.0, 7.0])
+        self.assertEqual(len(children) - len(promoted), 6)
+        self.assertEqual([len(subset) for subset in subsets], [2, 4])
+        for subset in subsets:
+            self.assertEqual(len(set(subset)), len(subset))
+            self.assertTrue(set(subset) <= set(location_names))
+
+        # Rounded up, at least one child is promoted
+        subsets.clear()
+        settings['racing_subset_sizes'] = [2, 4, 6]
+        settings['racing_promotion_ratio'] = 0.6
+        promoted = run_learning.race(children[:5], location_names, evaluate, settings)
+        self.assertEqual([f.factors['A'] for f in promoted], [8.0, 6.0])
+        settings['racing_promotion_ratio'] = 0.1
+        promoted = run_learning.race(children[:5], location_names, evaluate, settings)
+        self.assertEqual([f.factors['A'] for f in promoted], [8.0])
+        self.assertEqual([len(subset) for subset in subsets], [2, 4, 6, 2])
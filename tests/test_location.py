@@ -42,6 +42,13 @@ class TestLocation(unittest.TestCase):
         self.assertEqual(self.location.image, PIL.Image.open('tests/0001.jpg'))
         self.assertEqual(self.location.exif_tags, {'whitebalance': 0, 'datetimeoriginal': '2014:10:27 08:42:56', 'flashpixversion': b'0100', 'meteringmode': 1, 'focallength': (4, 1), 'flash': 0, 'model': 'Jolla', 'exifoffset': 146, 'exifversion': b'0230', 'make': 'Jolla', 'fnumber': (12, 5), 'orientation': 1, 'isospeedratings': 100, 'xresolution': (72, 1), 'aperturevalue': (334328577, 132351334), 'exposuretime': (139, 100000), 'yresolution': (72, 1), 'datetime': '2014:10:27 08:42:56', 'none': 100})
 
+    def test_query_ways(self):
+        self.location.add_ways('osm_', {'1': Way('1', {}, shapely.geometry.Polygon([(2, 1), (3, 1), (3, 2)]))})
+        self.location.add_ways('gen_', {'2': Way('2', {}, shapely.geometry.Polygon([(5, 5), (6, 5), (6, 6)]))})
+        self.assertEqual(self.location.query_ways(self.location.point), ['osm_1'])
+        self.location.ways['gen_3'] = Way('3', {}, shapely.geometry.Polygon([(5, 5), (6, 5), (6, 6)]))
+        self.assertEqual(self.location.query_ways(self.location.point), ['osm_1', 'gen_2', 'gen_3'])
+
 
 class TestFileParser(unittest.TestCase):
     def setUp(self):
@@ -58,3 +65,4 @@ class TestFileParser(unittest.TestCase):
         self.assertEqual(location.image, None)
         self.assertEqual(location.exif_tags, None)
         self.assertEqual(location.osm, None)
+
@@ -0,0 +1,95 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import xml.etree.ElementTree
+
+from optimizer import *
+from scores import *
+from processor import *
+from location import *
+from osm import *
+from generated import *
+from factors import *
+import run_learning
+
+
+class TestScoreTensor(unittest.TestCase):
+    def setUp(self):
+        location = Location('0001', shapely.geometry.Point(10.21322326, 53.5038433))
+        location.surs['parking'] = 'yes'
+        location.add_osm(OSM(xml.etree.ElementTree.parse('tests/batch_test_files/cache/0001.osm').getroot()))
+        location.add_generated(GeneratedFromOSMNode(location))
+        processor = Processor(location, Factors(), './', False)
+        processor.save_json_files = False
+        processor.skip_zero_weight_classifiers = False
+        processor.run()
+        self.location_scores = LocationScores.from_processor(processor)
+
+        rng = numpy.random.default_rng(1)
+        self.factor_matrix = random_factors(rng, (200, len(processor.classifier_names)), 5)
+        self.factor_matrix[rng.random(self.factor_matrix.shape) < 0.2] = 0.0
+        self.factor_matrix[:20] *= -1
+
+    def test_fitness_many(self):
+        for use_two_circle_intersection_ratio in (False, True):
+            score_table = ScoreTable(list(range(len(self.location_scores.scores))), 0.7, use_two_circle_intersection_ratio)
+            score_table.add_location(self.location_scores)
+            score_table.load_truth_polygons('tests/batch_test_files/input/')
+            score_tensor = ScoreTensor(score_table)
+
+            winners = score_tensor.winners(self.factor_matrix)
+            expected = [self.location_scores.winner(factor_vector) for factor_vector in self.factor_matrix]
+            self.assertEqual(winners[:, 0].tolist(), expected)
+
+            settings = {'use_two_circle_intersection_ratio': use_two_circle_intersection_ratio}
+            expected = [run_learning.fitness(score_table.evaluate_vector(factor_vector), settings) for factor_vector in self.factor_matrix]
+            self.assertEqual(score_tensor.fitness_many(self.factor_matrix).tolist(), expected)
+
+    def test_chunks(self):
+        score_table = ScoreTable(list(range(len(self.location_scores.scores))), 0.7)
+        score_table.add_location(self.location_scores)
+        score_table.load_truth_polygons('tests/batch_test_files/input/')
+        expected = ScoreTensor(score_table).winners(self.factor_matrix)
+        self.assertTrue((ScoreTensor(score_table, maximum_elements=1).winners(self.factor_matrix) == expected).all())
+
+
+class TestOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'population': 20, 'new_population_per_turn': 40, 'rounds': 30, 'mutations_rate': 0.5, 'zero_factor_rate': 0.1, 'max_factor_value': 5}
+        self.target = numpy.array([0.0, 1.0, 2.5, 4.0])
+
+    def objective(self, factor_matrix):
+        return -numpy.abs(factor_matrix - self.target).sum(axis=1)
+
+    def test_genetic_search(self):
+        (factor_vector, value) = genetic_search(self.objective, 4, self.settings, numpy.random.default_rng(1))
+        self.assertEqual(value, self.objective(factor_vector[numpy.newaxis])[0])
+        self.assertGreater(value, -1.0)
+
+    def test_coordinate_search(self):
+        reports = []
+        (factor_vector, value) = coordinate_search(self.objective, 4, self.settings, numpy.random.default_rng(1), lambda *args: reports.append(args))
+        self.assertEqual(factor_vector.tolist(), self.target.tolist())
+        self.assertEqual(value, 0.0)
+        self.assertLess(len(reports), self.settings['rounds'])
+
+    def test_pareto_mask(self):
+        fitness = numpy.array([0.5, 0.7, 0.6, 0.4, 0.5, 0.7])
+        latency = numpy.array([10.0, 30.0, 40.0, 5.0, 20.0, 30.0])
+        self.assertEqual(pareto_mask(fitness, latency).tolist(), [True, True, False, True, False, False])
@@ -0,0 +1,287 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import email.utils
+import http.server
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from overpass import *
+
+
+class OverpassHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        self.server.queries.append(query['data'][0])
+        status = self.server.statuses.pop(0) if len(self.server.statuses) > 0 else 200
+        body = self.server.body if status == 200 else b'error'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', self.server.retry_after)
+        if status in (301, 302, 307, 308):
+            self.send_header('Location', self.server.location + '?' + urllib.parse.urlencode(query, doseq=True))
+        if self.server.close_connections:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), OverpassHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.queries = []
+    server.statuses = []
+    server.close_connections = False
+    server.location = None
+    server.retry_after = '0'
+    server.body = open('tests/0001.osm', 'rb').read()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/api/interpreter' % server.server_address[1]
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+class TestOverpass(unittest.TestCase):
+    def setUp(self):
+        self.server, self.url = start_server()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        stop_server(self.server)
+        shutil.rmtree(self.folder)
+
+    def test_download(self):
+        connection = OverpassConnection(self.url)
+        file_path = os.path.join(self.folder, 'test.osm')
+        headers = connection.download({'data': 'script'}, file_path, chunk_size=1000)
+        connection.close()
+        self.assertEqual(open(file_path, 'rb').read(), self.server.body)
+        self.assertEqual(headers['Content-Length'], str(len(self.server.body)))
+        self.assertEqual(self.server.queries, ['script'])
+        self.assertFalse(os.path.exists(file_path + '.part'))
+
+    def test_keep_alive(self):
+        connection = OverpassConnection(self.url)
+        for i in range(3):
+            overpass = Overpass(os.path.join(self.folder, '%d.osm' % i), connection)
+            overpass.query_by_lat_lon_and_radius(53.5, 10.2, 200)
+            self.assertEqual(overpass.file_size, len(self.server.body))
+        connection.close()
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.queries), 3)
+        self.assertIn('radius="200"', self.server.queries[0])
+
+    def test_closed_connection(self):
+        self.server.close_connections = True
+        connection = OverpassConnection(self.url)
+        for i in range(3):
+            connection.download({'data': str(i)}, os.path.join(self.folder, 'test.osm'))
+        connection.close()
+        self.assertEqual(self.server.connections, 3)
+        self.assertEqual(self.server.queries, ['0', '1', '2'])
+
+    def test_error(self):
+        file_path = os.path.join(self.folder, 'test.osm')
+        with open(file_path, 'w') as file:
+            file.write('old')
+        self.server.statuses = [429]
+        connection = OverpassConnection(self.url)
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            connection.download({'data': 'script'}, file_path)
+        self.assertEqual(context.exception.code, 429)
+        self.assertEqual(open(file_path).read(), 'old')
+
+        # The connection is still usable
+        connection.download({'data': 'script'}, file_path)
+        connection.close()
+        self.assertEqual(open(file_path, 'rb').read(), self.server.body)
+        self.assertEqual(self.server.connections, 1)
+
+        connection = OverpassConnection('http://127.0.0.1:1/api/interpreter', timeout=5)
+        self.assertRaises(urllib.error.URLError, connection.download, {'data': 'script'}, file_path)
+
+    def test_redirect(self):
+        (other_server, other_url) = start_server()
+        try:
+            file_path = os.path.join(self.folder, 'test.osm')
+            connection = OverpassConnection(self.url)
+
+            # Temporary, the next request is sent to the original URL again
+            self.server.statuses = [302]
+            self.server.location = other_url
+            connection.download({'data': '0'}, file_path)
+            connection.download({'data': '1'}, file_path)
+            self.assertEqual(open(file_path, 'rb').read(), self.server.body)
+            self.assertEqual(self.server.queries, ['0', '1'])
+            self.assertEqual(other_server.queries, ['0'])
+            self.assertEqual(connection.url, self.url)
+
+            # Permanent, the next request is sent to the new URL directly
+            self.server.statuses = [301]
+            connection.download({'data': '2'}, file_path)
+            connection.download({'data': '3'}, file_path)
+            self.assertEqual(self.server.queries, ['0', '1', '2'])
+            self.assertEqual(other_server.queries, ['0', '2', '3'])
+            self.assertEqual(connection.url, other_url)
+            connection.close()
+
+            # Redirect loop
+            other_server.statuses = [307] * 10
+            other_server.location = other_url
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                OverpassConnection(other_url).download({'data': '4'}, file_path)
+            self.assertEqual(context.exception.code, 307)
+            self.assertEqual(len(other_server.queries), 3 + maximum_redirects + 1)
+        finally:
+            stop_server(other_server)
+
+    def test_incomplete_error(self):
+        # The body of the error responses ends before their Content-Length
+        error = b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 100\r\n\r\nerror'
+        responses = [error, error, b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\nConnection: close\r\n\r\n<ok>']
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+
+        def serve():
+            for response in responses:
+                (connection, address) = listener.accept()
+                connection.recv(65536)
+                connection.sendall(response)
+                connection.close()
+
+        threading.Thread(target=serve, daemon=True).start()
+        url = 'http://127.0.0.1:%d/api/interpreter' % listener.getsockname()[1]
+        file_path = os.path.join(self.folder, 'test.osm')
+        try:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                OverpassConnection(url).download({'data': 'script'}, file_path)
+            self.assertEqual(context.exception.code, 503)
+
+            # Repeated like any other 503
+            client = OverpassClient([url], retries=1, backoff=0.01)
+            Overpass(file_path, client).query_by_lat_lon_and_radius(53.5, 10.2, 200)
+            client.close()
+            self.assertEqual(open(file_path, 'rb').read(), b'<ok>')
+        finally:
+            listener.close()
+
+
+class TestOverpassClient(unittest.TestCase):
+    def setUp(self):
+        self.servers = [start_server() for _ in range(2)]
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, 'test.osm')
+
+    def tearDown(self):
+        for (server, url) in self.servers:
+            stop_server(server)
+        shutil.rmtree(self.folder)
+
+    def test_retry(self):
+        (server, url) = self.servers[0]
+        server.statuses = [429, 503, 504]
+        client = OverpassClient([url], retries=3, backoff=0.01)
+        client.download({'data': 'script'}, self.file_path)
+        self.assertEqual(len(server.queries), 4)
+        self.assertEqual(open(self.file_path, 'rb').read(), server.body)
+
+        # Retries exhausted
+        server.statuses = [500, 500, 500, 500]
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            client.download({'data': 'script'}, self.file_path)
+        self.assertEqual(context.exception.code, 500)
+
+        # Not repeated
+        server.statuses = [404]
+        self.assertRaises(urllib.error.HTTPError, client.download, {'data': 'script'}, self.file_path)
+        self.assertEqual(len(server.queries), 9)
+        client.close()
+
+        client = OverpassClient(['http://127.0.0.1:1/api/interpreter'], retries=2, backoff=0.01, timeout=5)
+        self.assertRaises(urllib.error.URLError, client.download, {'data': 'script'}, self.file_path)
+
+    def test_maximum_backoff(self):
+        (server, url) = self.servers[0]
+        server.statuses = [429]
+        server.retry_after = '3600'
+        client = OverpassClient([url], retries=1, maximum_backoff=0.1)
+        start = time.monotonic()
+        client.download({'data': 'script'}, self.file_path)
+        client.close()
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(len(server.queries), 2)
+
+    def test_endpoints(self):
+        client = OverpassClient([url for (server, url) in self.servers], backoff=0.01, first=1)
+        for i in range(4):
+            client.download({'data': str(i)}, self.file_path)
+        self.assertEqual(self.servers[0][0].queries, ['1', '3'])
+        self.assertEqual(self.servers[1][0].queries, ['0', '2'])
+
+        # A failed request is repeated on the other interpreter
+        self.servers[1][0].statuses = [429]
+        client.download({'data': '4'}, self.file_path)
+        client.close()
+        self.assertEqual(self.servers[0][0].queries, ['1', '3', '4'])
+        self.assertEqual(self.servers[1][0].queries, ['0', '2', '4'])
+        self.assertEqual([server.connections for (server, url) in self.servers], [1, 1])
+
+    def test_retry_after(self):
+        self.assertIsNone(retry_after({}))
+        self.assertEqual(retry_after({'Retry-After': '12'}), 12.0)
+        self.assertEqual(retry_after({'Retry-After': 'Thu, 01 Jan 1970 00:00:00 GMT'}), 0.0)
+        self.assertAlmostEqual(retry_after({'Retry-After': email.utils.formatdate(time.time() + 100, usegmt=True)}), 100, delta=2)
+        self.assertIsNone(retry_after({'Retry-After': 'soon'}))
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(100)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_pause(self):
+        bucket = TokenBucket(100, capacity=5)
+        bucket.pause(0.2)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
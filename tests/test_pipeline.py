@@ -0,0 +1,104 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import io
+import sys
+import threading
+import time
+
+from pipeline import *
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stream(self):
+        stages = [lambda x: x + 1, lambda x: None if x % 3 == 0 else x, lambda x: x * 2]
+        self.assertEqual(list(stream(range(10), stages)), [2, 4, 8, 10, 14, 16, 20])
+        self.assertEqual(list(stream([], stages)), [])
+
+    def test_bounded(self):
+        started = []
+        lock = threading.Lock()
+
+        def count(x):
+            with lock:
+                started.append(x)
+            return x
+
+        for x in stream(range(100), [count, lambda x: x], queue_size=2):
+            # Items in the stages and queues
+            self.assertLessEqual(len(started) - x, 8)
+
+    def test_error(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError('failed')
+            return x
+
+        results = []
+        with self.assertRaises(ValueError):
+            for x in stream(range(10), [fail, lambda x: x]):
+                results.append(x)
+        self.assertEqual(results, [0, 1, 2])
+
+        def exit(x):
+            sys.exit(1)
+        self.assertRaises(SystemExit, list, stream(range(10), [lambda x: x, exit]))
+
+    def test_parallel_stage(self):
+        # Only passes if four items are in the stage at the same time
+        barrier = threading.Barrier(4, timeout=10)
+
+        def wait(x):
+            if x < 8:
+                barrier.wait()
+            time.sleep(0.001 * (x % 3))
+            return None if x == 5 else x
+
+        self.assertEqual(list(stream(range(20), [(wait, 4), lambda x: x * 2])), [2 * x for x in range(20) if x != 5])
+
+        def fail(x):
+            if x == 7:
+                raise ValueError('failed')
+            return x
+
+        results = []
+        with self.assertRaises(ValueError):
+            for x in stream(range(20), [(fail, 3)]):
+                results.append(x)
+        self.assertEqual(results, list(range(7)))
+
+    def test_close(self):
+        thread_count = threading.active_count()
+        generator = stream(range(1000), [lambda x: x, lambda x: x])
+        self.assertEqual(next(generator), 0)
+        self.assertEqual(threading.active_count(), thread_count + 2)
+        generator.close()
+        self.assertEqual(threading.active_count(), thread_count)
+
+    def test_locked_file(self):
+        output = io.StringIO()
+        output.name = 'test'
+        locked_file = LockedFile(output)
+        threads = [threading.Thread(target=lambda: [locked_file.write('abc\n') for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(output.getvalue(), 'abc\n' * 400)
+        self.assertEqual(locked_file.name, 'test')
@@ -0,0 +1,127 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import concurrent.futures
+import xml.etree.ElementTree
+
+from processor import *
+from location import *
+from osm import *
+from generated import *
+from factors import *
+
+
+class TestProcessor(unittest.TestCase):
+    def setUp(self):
+        self.location = Location('0001', shapely.geometry.Point(10.21322326, 53.5038433))
+        self.location.surs['parking'] = 'yes'
+        self.location.add_osm(OSM(xml.etree.ElementTree.parse('tests/batch_test_files/cache/0001.osm').getroot()))
+        self.location.add_generated(GeneratedFromOSMNode(self.location))
+        self.factors = Factors()
+        self.factors.load_file('tests/batch_test_files/data/factors.txt')
+
+    def processor(self):
+        processor = Processor(self.location, self.factors, './', False)
+        processor.save_json_files = False
+        return processor
+
+    def test_run(self):
+        processor = self.processor()
+        totals = processor.run()
+        self.assertEqual(len(totals), len(self.location.ways))
+        self.assertEqual(sorted(uid for (uid, total) in totals), sorted(self.location.ways))
+        self.assertEqual([t for (uid, t) in totals], sorted([t for (uid, t) in totals], reverse=True))
+        self.assertEqual(processor.scores.shape, (len(processor.classifier_names), len(self.location.ways)))
+
+    def test_weighting(self):
+        processor = self.processor()
+        totals = dict(processor.run())
+        classifiers = get_classifiers_list(location=self.location)
+        expected = dict.fromkeys(self.location.ways, 0)
+        for classifier in classifiers:
+            for (uid, points) in classifier.classify().items():
+                expected[uid] += round(self.factors.get_factor(classifier.name()) * points)
+        self.assertEqual(totals, expected)
+
+    def test_statistics(self):
+        processor = self.processor()
+        processor.run()
+        self.assertEqual(list(processor.statistics.keys()), processor.classifier_names)
+        for entry in processor.statistics.values():
+            self.assertEqual(entry['ways'], 0 if 'skipped' in entry else len(self.location.ways))
+            self.assertGreaterEqual(entry['time_ms'], 0)
+
+    def test_skip_classifiers(self):
+        self.factors.factors['SUR Description'] = 0.0
+        processor = self.processor()
+        processor.run()
+        self.assertEqual(processor.statistics['Exif GPSInfo Direction']['skipped'], 'not applicable')
+        self.assertEqual(processor.statistics['Image processing']['skipped'], 'not applicable')
+        self.assertEqual(processor.statistics['SUR Description']['skipped'], 'zero weight')
+        self.assertNotIn('skipped', processor.statistics['SUR-OSM Mapping'])
+        self.assertEqual(processor.scores[processor.classifier_names.index('SUR Description')].tolist(), [0] * len(self.location.ways))
+
+        processor = self.processor()
+        processor.skip_zero_weight_classifiers = False
+        processor.run()
+        self.assertNotIn('skipped', processor.statistics['SUR Description'])
+
+    def test_prune_ways(self):
+        for factor in (1.0, -0.5, 3.0):
+            self.factors.factors['Proximity (closest edge)'] = factor
+            processor = self.processor()
+            totals = processor.run()
+            pruning_processor = self.processor()
+            pruning_processor.prune_ways = True
+            pruned_totals = pruning_processor.run()
+            self.assertEqual(pruned_totals[0], totals[0])
+            self.assertGreater(len(pruning_processor.pruned_uids), 0)
+            self.assertNotIn(totals[0][0], pruning_processor.pruned_uids)
+            pruned_totals = dict(pruned_totals)
+            for (uid, total) in totals:
+                if uid in pruning_processor.pruned_uids:
+                    self.assertLessEqual(pruned_totals[uid], total)
+                else:
+                    self.assertEqual(pruned_totals[uid], total)
+
+    def test_exclude_slow_classifiers(self):
+        processor = Processor(self.location, self.factors, './', True)
+        processor.save_json_files = False
+        processor.run()
+        self.assertNotIn('Image processing', processor.classifier_names)
+
+    def test_aggregate_statistics(self):
+        statistics = [{'A': {'time_ms': float(i), 'ways': 2, 'geometry_operations': 3}} for i in range(1, 101)]
+        statistics[0]['A']['skipped'] = 'zero weight'
+        aggregated = aggregate_statistics(statistics)
+        self.assertEqual(aggregated['A']['locations'], 100)
+        self.assertEqual(aggregated['A']['skipped'], 1)
+        self.assertEqual(aggregated['A']['sum_ms'], 5050.0)
+        self.assertEqual(aggregated['A']['mean_ms'], 50.5)
+        self.assertAlmostEqual(aggregated['A']['p95_ms'], 95.05)
+        self.assertEqual(aggregated['A']['ways'], 200)
+        self.assertEqual(aggregated['A']['geometry_operations'], 300)
+
+    def test_thread_pool(self):
+        expected = self.processor().run()
+        processor = self.processor()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as thread_pool:
+            processor.thread_pool = thread_pool
+            self.assertEqual(processor.run(), expected)
+        self.assertEqual(list(processor.statistics.keys()), processor.classifier_names)
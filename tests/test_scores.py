@@ -0,0 +1,145 @@
+# Copyright (C)2014,2015 Philipp Naumann
+# Copyright (C)2014,2015 Marcus Soll
+#
+# This file is part of SPtP.
+#
+# SPtP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SPtP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SPtP. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import multiprocessing
+import os
+import tempfile
+import xml.etree.ElementTree
+
+from scores import *
+from processor import *
+from location import *
+from osm import *
+from generated import *
+from factors import *
+
+
+class TestScores(unittest.TestCase):
+    def setUp(self):
+        self.location = Location('0001', shapely.geometry.Point(10.21322326, 53.5038433))
+        self.location.surs['parking'] = 'yes'
+        self.location.add_osm(OSM(xml.etree.ElementTree.parse('tests/batch_test_files/cache/0001.osm').getroot()))
+        self.location.add_generated(GeneratedFromOSMNode(self.location))
+        self.factors = Factors()
+        self.factors.load_file('tests/batch_test_files/data/factors.txt')
+
+        processor = Processor(self.location, Factors(), './', False)
+        processor.save_json_files = False
+        processor.skip_zero_weight_classifiers = False
+        processor.run()
+        self.location_scores = LocationScores.from_processor(processor)
+        self.score_table = ScoreTable(processor.classifier_names, 0.7)
+        self.score_table.add_location(self.location_scores)
+
+    def totals(self, factors):
+        processor = Processor(self.location, factors, './', False)
+        processor.save_json_files = False
+        return processor.run()
+
+    def test_winner(self):
+        for factor in (0.0, 0.5, 2.0, -1.0):
+            self.factors.factors['Proximity (centroid)'] = factor
+            factor_vector = self.score_table.factor_vector(self.factors)
+            winner = self.location_scores.uids[self.location_scores.winner(factor_vector)]
+            self.assertEqual(winner, self.totals(self.factors)[0][0])
+
+    def test_polygon(self):
+        for (index, uid) in enumerate(self.location_scores.uids):
+            kml_builder = KMLBuilder()
+            kml_builder.add_placemark(self.location.ways[uid])
+            kml = KML(xml.etree.ElementTree.fromstring(kml_builder.run()))
+            self.assertTrue(self.location_scores.polygon(index).equals_exact(next(iter(kml.ways.values())).polygon, 0))
+
+    def test_evaluate(self):
+        self.score_table.load_truth_polygons('tests/batch_test_files/input/')
+        comparator = self.score_table.evaluate(self.factors)
+        winner = self.location.ways[self.totals(self.factors)[0][0]]
+        truth_polygon = read_kml_polygon('tests/batch_test_files/input/0001.truth.kml')
+        expected = intersection_ratio(truth_polygon, kml_polygon(winner.coordinates()), 0.7)
+        self.assertEqual(comparator.average_intersection_ratio, expected)
+        self.assertEqual(len(comparator.passed) + len(comparator.failed), 1)
+
+    def test_truth_table(self):
+        self.assertEqual(self.score_table.load_truth_polygons('tests/batch_test_files/input/'), 1)
+        with tempfile.TemporaryDirectory() as folder_path:
+            path = os.path.join(folder_path, 'truth_table.json')
+            self.score_table.truth_table.save_file(path)
+            truth_table = TruthTable.load_file(path)
+        score_table = ScoreTable(self.score_table.classifier_names, 0.7)
+        score_table.add_location(self.location_scores)
+        self.assertEqual(score_table.load_truth_polygons('tests/batch_test_files/input/', truth_table), 0)
+        self.assertEqual(score_table.evaluate(self.factors).passed, self.score_table.evaluate(self.factors).passed)
+
+        # Other ways or another minimum intersection ratio invalidate the table
+        changed_scores = LocationScores('0001', self.location_scores.uids[1:], self.location_scores.scores[:, 1:],
+                                        self.location_scores.coordinates, self.location_scores.offsets[1:])
+        score_table = ScoreTable(self.score_table.classifier_names, 0.7)
+        score_table.add_location(changed_scores)
+        self.assertEqual(score_table.load_truth_polygons('tests/batch_test_files/input/', truth_table), 1)
+        score_table = ScoreTable(self.score_table.classifier_names, 0.5)
+        score_table.add_location(self.location_scores)
+        self.assertEqual(score_table.load_truth_polygons('tests/batch_test_files/input/', truth_table), 1)
+
+    def test_evaluate_subset(self):
+        self.score_table.load_truth_polygons('tests/batch_test_files/input/')
+        factor_vector = self.score_table.factor_vector(self.factors)
+        comparator = self.score_table.evaluate_vector(factor_vector, ['0001'])
+        self.assertEqual(comparator.passed, self.score_table.evaluate(self.factors).passed)
+        self.assertEqual(comparator.failed, self.score_table.evaluate(self.factors).failed)
+
+    def test_pool(self):
+        self.score_table.load_truth_polygons('tests/batch_test_files/input/')
+        factor_vectors = [self.score_table.factor_vector(self.factors), numpy.ones(len(self.score_table.classifier_names))]
+        with multiprocessing.Pool(2, initializer=init_pool_worker, initargs=(self.score_table, )) as pool:
+            comparators = pool.map(evaluate_in_pool_worker, factor_vectors)
+        for (comparator, factor_vector) in zip(comparators, factor_vectors):
+            expected = self.score_table.evaluate_vector(factor_vector)
+            self.assertEqual(comparator.average_intersection_ratio, expected.average_intersection_ratio)
+            self.assertEqual(comparator.passed, expected.passed)
+
+    def test_missing_location(self):
+        score_table = ScoreTable(self.score_table.classifier_names, 0.7)
+        self.assertRaises(ComparatorError, score_table.load_truth_polygons, 'tests/batch_test_files/input/')
+
+    def test_latency(self):
+        mean_times_ms = self.score_table.mean_times_ms()
+        self.assertEqual(len(mean_times_ms), len(self.score_table.classifier_names))
+        self.assertTrue((mean_times_ms == self.location_scores.times_ms).all())
+        factor_vector = numpy.ones(len(self.score_table.classifier_names))
+        self.assertAlmostEqual(self.score_table.latency_ms(factor_vector), mean_times_ms.sum())
+        factor_vector[0] = 0.0
+        self.assertAlmostEqual(self.score_table.latency_ms(factor_vector), mean_times_ms[1:].sum())
+        self.assertEqual(self.score_table.latency_ms(numpy.zeros(len(factor_vector))), 0.0)
+
+    def test_scores_file(self):
+        with tempfile.TemporaryDirectory() as folder_path:
+            path = os.path.join(folder_path, 'scores_0.npz')
+            save_scores_file(path, self.score_table.classifier_names, [self.location_scores, self.location_scores])
+            (classifier_names, location_scores_list) = load_scores_file(path)
+        self.assertEqual(classifier_names, self.score_table.classifier_names)
+        self.assertEqual(len(location_scores_list), 2)
+        for location_scores in location_scores_list:
+            self.assertEqual(location_scores.name, '0001')
+            self.assertEqual(location_scores.uids, self.location_scores.uids)
+            self.assertEqual(location_scores.descriptions, self.location_scores.descriptions)
+            self.assertTrue((location_scores.scores == self.location_scores.scores).all())
+            self.assertTrue((location_scores.coordinates == self.location_scores.coordinates).all())
+            self.assertTrue((location_scores.offsets == self.location_scores.offsets).all())
+            self.assertTrue((location_scores.times_ms == self.location_scores.times_ms).all())
+            self.assertTrue(location_scores.point.equals(self.location.point))